@@ -0,0 +1,92 @@
+"""
+crow2.util.AttrDict against earlier implementations, for the access patterns of hook events
+and of the config tree
+
+Everything runs with the garbage collector on, so the old self-referencing AttrDict (its
+__dict__ set to itself, freed only by the collector) is measured with the cost of collecting it.
+"""
+from benchutil import throughput, compare
+
+from crow2.util import AttrDict
+
+class SelfDictAttrDict(dict):
+    "an earlier AttrDict: the instance's __dict__ is the dict itself, making each one a cycle"
+    def __init__(self, *args, **keywords):
+        dict.__init__(self, *args, **keywords)
+        self.__dict__ = self
+
+class GetattrAttrDict(dict):
+    "the previous AttrDict: every attribute read goes through __getattr__"
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError
+
+    def __setattr__(self, name, attr):
+        self[name] = attr
+
+implementations = [("__getattr__", GetattrAttrDict), ("self __dict__", SelfDictAttrDict),
+                   ("AttrDict", AttrDict)]
+
+context = {"conn": object(), "server": object()}
+hook_sentinel = object()
+
+def event_pattern(cls):
+    "build an event the way BaseHook._make_eventobj does, then use it like a handler would"
+    def run():
+        event = cls()
+        event.update(context)
+        event.update({"line": ":nick!user@host PRIVMSG #channel :hello"})
+        event.update({"calling_hook": hook_sentinel})
+        event.conn
+        event.server
+        event.line
+        event.command = "PRIVMSG"
+        event.command
+        getattr(event, "cancelled", False)
+    return run
+
+config_source = {
+    "connections": dict(("network%d" % number, {
+        "server": "irc.network%d.net" % number,
+        "nick": "crow2",
+        "channels": ["#a", "#b"],
+    }) for number in range(20)),
+    "plugins": {"enabled": ["a", "b"], "options": {"x": 1}},
+}
+
+def to_attrdict(obj, cls):
+    "crow2.lib.config.to_attrdict, parameterized on the class"
+    if isinstance(obj, dict):
+        obj = cls(obj)
+        for key in obj:
+            obj[key] = to_attrdict(obj[key], cls)
+    return obj
+
+def config_build(cls):
+    def run():
+        to_attrdict(config_source, cls)
+    return run
+
+def config_access(cls):
+    config = to_attrdict(config_source, cls)
+    def run():
+        connections = config.connections
+        connections.network1.nick
+        connections.network7.server
+        config.plugins.options.x
+        config.plugins.enabled
+    return run
+
+def main():
+    compare("event build + use", [(name, throughput(event_pattern(cls), collect=True))
+                                  for name, cls in implementations])
+    compare("config tree build",
+            [(name, throughput(config_build(cls), number=5000, collect=True))
+             for name, cls in implementations])
+    compare("config attribute reads", [(name, throughput(config_access(cls), collect=True))
+                                       for name, cls in implementations])
+
+if __name__ == "__main__":
+    main()
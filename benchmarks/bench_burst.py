@@ -0,0 +1,57 @@
+"""
+crow2.irc.main.TwistedConnection handling the NAMES and WHO replies for a 5000 user channel,
+collected into one event per burst, against firing the received hook for every line
+"""
+from twisted.internet.task import Clock
+
+from benchutil import throughput, compare
+
+from crow2.util import AttrDict
+from crow2.irc.main import TwistedConnection
+from crow2.irc.message import parse
+
+class PerLine(TwistedConnection):
+    def linesReceived(self, lines):
+        self.received.fire_each(self.context, "line", lines, self._stop_receiving)
+
+users = 5000
+lines = [":crow2!bot@bot.example.com JOIN #big"]
+for start in range(0, users, 40):
+    lines.append(":irc.example.net 353 crow2 = #big :" + " ".join(
+            "%snick%d" % ("@" if i % 50 == 0 else "", i) for i in range(start, start + 40)))
+lines.append(":irc.example.net 366 crow2 #big :End of /NAMES list.")
+lines += [":irc.example.net 352 crow2 #big ~user%d host-%d.example.com irc.example.net nick%d H "
+          ":0 real name %d" % ((i,) * 4) for i in range(users)]
+lines.append(":irc.example.net 315 crow2 #big :End of /WHO list.")
+
+def make(cls):
+    server = AttrDict(delimiter="\r\n", reactor=Clock(), flood_burst=5, flood_rate=None,
+            send_queue_limit=1000, manager=None, capture=None)
+    def join():
+        connection = cls(server)
+        connection.transport = AttrDict(disconnecting=False)
+        state = connection.state
+        state.nick = state._my_key = "crow2"
+
+        # what crow2.irc.protocol.IRCProtocol does for every line
+        @connection.received.preparer
+        def line_received(event):
+            event.message = message = parse(event.line)
+            event.command = message.command
+            replies = event.get("replies")
+            if replies is not None:
+                state.handle_burst(message, replies)
+            state.handle(message)
+
+        connection.linesReceived(lines)
+        assert len(state.channel("#big").users) == users + 1
+    return join
+
+def main():
+    compare("joining a %d user channel" % users, [
+        ("per line", throughput(make(PerLine), number=5) * len(lines)),
+        ("bursts", throughput(make(TwistedConnection), number=5) * len(lines)),
+    ], unit="lines")
+
+if __name__ == "__main__":
+    main()
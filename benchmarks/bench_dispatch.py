@@ -0,0 +1,44 @@
+"""
+crow2.irc.main.ProtocolMultiplexer against the plain HookMultiplexer it used to fire through,
+dispatching a WHO burst (mostly numerics nothing handles) with a PRIVMSG handler registered
+"""
+from benchutil import throughput, compare
+
+from crow2.events.hooktree import HookMultiplexer
+from crow2.irc.main import ProtocolMultiplexer
+from crow2.irc.message import parse
+
+class PlainMultiplexer(ProtocolMultiplexer):
+    fire = HookMultiplexer.fire.im_func
+
+def line_received(event):
+    event.message = parse(event.line)
+    event.command = event.message.command
+
+def privmsg(event):
+    pass
+
+traffic = [":irc.example.net 352 crow2 #big ~user%d host-%d.example.com irc.example.net "
+           "nick%d H :0 real name %d" % ((i,) * 4) for i in range(90)]
+traffic += [":nick%d!~user%d@host-%d.example.com PRIVMSG #big :hello" % ((i,) * 3) for i in range(10)]
+
+def make(cls):
+    multiplexer = cls()
+    multiplexer.preparer.register(line_received)
+    multiplexer.register(privmsg, "PRIVMSG")
+    fire = multiplexer.fire
+    context = {"conn": None}
+    def dispatch():
+        for line in traffic:
+            fire(context, line=line)
+    return dispatch
+
+def main():
+    compare("WHO burst", [
+        ("HookMultiplexer.fire", throughput(make(PlainMultiplexer), number=2000) * len(traffic)),
+        ("ProtocolMultiplexer.fire", throughput(make(ProtocolMultiplexer), number=2000)
+                    * len(traffic)),
+    ], unit="lines")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+crow2.irc.framing.BufferedLineReceiver against twisted's LineOnlyReceiver, splitting a burst of
+server traffic (like the NAMES and WHO replies after joining a big channel) delivered in
+chunks of the size a socket read typically returns
+"""
+from twisted.protocols.basic import LineOnlyReceiver
+
+from benchutil import throughput, compare
+
+from crow2.irc.framing import BufferedLineReceiver
+
+class Transport(object):
+    disconnecting = False
+
+class OneByOne(LineOnlyReceiver):
+    MAX_LENGTH = 16384
+    def lineReceived(self, line):
+        pass
+
+class Batched(BufferedLineReceiver):
+    def linesReceived(self, lines):
+        pass
+
+line_count = 2000
+burst = "".join(":irc.example.net 352 crow2 #big ~user%d host-%d.example.com irc.example.net "
+                "nick%d H :0 real name %d\r\n" % ((i,) * 4) for i in range(line_count))
+
+def chunks(size):
+    return [burst[i:i + size] for i in range(0, len(burst), size)]
+
+def main():
+    for size in (1024, 4096, 65536):
+        data = chunks(size)
+        def feed(cls):
+            receiver = cls()
+            receiver.transport = Transport()
+            for chunk in data:
+                receiver.dataReceived(chunk)
+        compare("%d byte chunks" % size, [
+            ("LineOnlyReceiver", throughput(lambda: feed(OneByOne), number=50) * line_count),
+            ("BufferedLineReceiver", throughput(lambda: feed(Batched), number=50) * line_count),
+        ], unit="lines")
+
+if __name__ == "__main__":
+    main()
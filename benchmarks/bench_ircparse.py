@@ -0,0 +1,102 @@
+"""
+crow2.irc.message.parse against the regex crow2.irc.protocol used to have (with its
+placeholders filled in, and params split afterwards), on a mix of typical server traffic
+"""
+import re
+
+from benchutil import throughput, compare
+
+from crow2.irc.message import parse, unescape_tag_value
+
+space = r"\ +"
+prefix = r"""
+    (?P<prefix>
+        [^\ !@]+ (?:![^\ @]+)? (?:@[^\ ]+)?
+    )
+"""
+message = re.compile(r"""
+    ^
+    (?:
+        :{prefix}{space}
+    )?
+    (?P<command>
+        [a-zA-Z]+ | [0-9]{{3}}
+    )
+    (?P<params>
+        (?:{space}.+)?
+    )
+    $
+""".format(prefix=prefix, space=space), flags=re.VERBOSE)
+
+def regex_parse(line):
+    match = message.match(line)
+    params = match.group("params").lstrip(" ")
+    if params.startswith(":"):
+        params = [params[1:]]
+    else:
+        middle, colon, trailing = params.partition(" :")
+        params = middle.split()
+        if colon:
+            params.append(trailing)
+    nick = user = host = None
+    if match.group("prefix"):
+        rest, at, host = match.group("prefix").partition("@")
+        nick, bang, user = rest.partition("!")
+    return match.group("command").upper(), params, nick, user, host
+
+traffic = [
+    ":alice!~alice@host-1.example.com PRIVMSG #crow2 :has anyone tried the new plugin loader?",
+    ":bob!bob@192.0.2.7 PRIVMSG #crow2 :yeah, it's a lot faster with the manifest cache",
+    ":carol!~c@gateway/web/irccloud.com/x-abc JOIN #crow2",
+    ":dave!dave@unaffiliated/dave QUIT :Ping timeout: 260 seconds",
+    "PING :irc.example.net",
+    ":irc.example.net 353 crow2 = #crow2 :crow2 @alice +bob carol dave erin frank",
+    ":irc.example.net 366 crow2 #crow2 :End of /NAMES list.",
+    ":erin!erin@host.example.org NOTICE crow2 :\x01VERSION\x01",
+    ":frank!f@203.0.113.9 MODE #crow2 +v erin",
+    ":alice!~alice@host-1.example.com PRIVMSG #crow2 :\x01ACTION waves\x01",
+]
+
+tagged_traffic = [
+    "@time=2024-03-01T12:00:%02d.000Z;account=alice;msgid=Zx8Ab%d;batch=b1;+draft/reply=Zx8Aa\\:1 "
+    ":alice!~alice@host-1.example.com PRIVMSG #crow2 :message number %d" % (number, number, number)
+    for number in range(10)
+]
+
+def eager_tags(line):
+    "decode every tag up front, the way a dict-building parser would"
+    message = parse(line)
+    tags = {}
+    for tag in message.raw_tags.split(";"):
+        key, equals, value = tag.partition("=")
+        tags[key] = unescape_tag_value(value)
+    return tags["time"]
+
+def lazy_tags(line):
+    return parse(line).tags["time"]
+
+def main():
+    # parse only splits the prefix when asked, so also ask for the nick like most handlers would;
+    # the regex version always splits it
+    def regex_nick(line):
+        regex_parse(line)[2]
+    def parse_nick(line):
+        parse(line).nick
+
+    for name, regex_func, func in [("parse", regex_parse, parse), ("parse + nick", regex_nick, parse_nick)]:
+        compare(name, [
+            ("regex", throughput(lambda: [regex_func(line) for line in traffic], number=20000)
+                        * len(traffic)),
+            ("crow2.irc.message", throughput(lambda: [func(line) for line in traffic], number=20000)
+                        * len(traffic)),
+        ], unit="lines")
+
+    compare("tagged lines, reading server-time", [
+        ("eager tags", throughput(lambda: [eager_tags(line) for line in tagged_traffic], number=20000)
+                    * len(tagged_traffic)),
+        ("lazy tags", throughput(lambda: [lazy_tags(line) for line in tagged_traffic], number=20000)
+                    * len(tagged_traffic)),
+    ], unit="lines")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+crow2.plugin.listpackage against the previous listdir + getmodulename implementation, on a
+generated plugin package with modules, compiled files, subpackages and plain directories
+"""
+import os
+import shutil
+import tempfile
+import time
+
+from benchutil import throughput, compare
+
+from crow2 import plugin
+
+def previous_getmodulename(parent, filename):
+    "the previous getmodulename: endswith per suffix, then isdir and an exists per suffix"
+    for suffix in plugin.suffixes:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    else:
+        fullpath = os.path.join(parent, filename)
+        if os.path.isdir(fullpath):
+            for suffix in plugin.suffixes:
+                if os.path.exists(os.path.join(fullpath, "__init__"+suffix)):
+                    return filename
+
+def previous_listpackage(path):
+    results = set()
+    for package_path in path:
+        for filename in os.listdir(package_path):
+            modulename = previous_getmodulename(package_path, filename)
+            if not modulename or modulename == "__init__":
+                continue
+            results.add(modulename)
+    return results
+
+def uncached_listpackage(path):
+    plugin._listing_cache.clear()
+    return plugin.listpackage(path)
+
+def count_filesystem_calls(func):
+    """
+    How many directory listings and stats one call of func makes; on a network filesystem each
+    of these is a round trip
+    """
+    counts = [0]
+    originals = [(os, "stat"), (os, "listdir"), (plugin, "scandir")]
+    def counting(original):
+        def counted(*args):
+            counts[0] += 1
+            return original(*args)
+        return counted
+    saved = [(module, name, getattr(module, name)) for module, name in originals]
+    try:
+        for module, name, original in saved:
+            if original is not None:
+                setattr(module, name, counting(original))
+        func()
+    finally:
+        for module, name, original in saved:
+            setattr(module, name, original)
+    return counts[0]
+
+def make_package(directory):
+    open(os.path.join(directory, "__init__.py"), "w").close()
+    for number in range(150):
+        open(os.path.join(directory, "plugin%d.py" % number), "w").close()
+        open(os.path.join(directory, "plugin%d.pyc" % number), "w").close()
+    for number in range(30):
+        subpackage = os.path.join(directory, "subpackage%d" % number)
+        os.mkdir(subpackage)
+        open(os.path.join(subpackage, "__init__.py"), "w").close()
+    for number in range(10):
+        os.mkdir(os.path.join(directory, "data%d" % number))
+    # listings are only cached once the directories' mtimes are safely in the past
+    settled = time.time() - 60
+    for number in range(10):
+        os.utime(os.path.join(directory, "data%d" % number), (settled, settled))
+    os.utime(directory, (settled, settled))
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        make_package(directory)
+        path = [directory]
+        assert previous_listpackage(path) == plugin.listpackage(path) == uncached_listpackage(path)
+        compare("listpackage", [
+            ("listdir + getmodulename", throughput(lambda: previous_listpackage(path), number=300)),
+            ("single pass", throughput(lambda: uncached_listpackage(path), number=300)),
+            ("single pass, cached", throughput(lambda: plugin.listpackage(path), number=300)),
+        ], unit="scans")
+        for name, func in [("listdir + getmodulename", previous_listpackage),
+                           ("single pass", uncached_listpackage),
+                           ("single pass, cached", plugin.listpackage)]:
+            print "%-40s %5d filesystem calls per scan" % (name, count_filesystem_calls(lambda: func(path)))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Connects a number of bots, each a crow2.irc.main.Server with the real TwistedConnection, to the
+fake server in ircserver.py, all joined to one channel the server replays traffic into. After
+every bot has joined, it measures for a while and reports the lines per second the bots
+handled, how long replayed lines took from the server's write to a bot's handler, and the
+cpu the bots used.
+
+    python benchmarks/bench_load.py [--bots N] [--rate LINES_PER_SECOND] [--duration SECONDS]
+                                    [--traffic FILE] [--in-process]
+
+The server runs in a child process unless --in-process is given, in which case the cpu use
+includes the server's.
+"""
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from twisted.internet import reactor
+
+from benchutil import percentiles
+from crow2.irc.main import ConnectionFactory, Server
+from crow2.irc.connections import ConnectionManager
+from crow2.irc.message import parse
+import ircserver
+
+channel = "#bench"
+
+class BotFactory(ConnectionFactory):
+    def __init__(self, server, bot):
+        ConnectionFactory.__init__(self, server)
+        self.bot = bot
+
+    def buildProtocol(self, addr):
+        connection = ConnectionFactory.buildProtocol(self, addr)
+        self.bot.attach(connection)
+        return connection
+
+class Bot(object):
+    def __init__(self, load, index, port):
+        self.load = load
+        self.server = Server(reactor, "bot%d" % index, {
+            "server": "127.0.0.1",
+            "port": port,
+            "nick": "bot%d" % index,
+            "channels": [channel],
+            "flood_rate": None,
+        })
+        self.server.factory = BotFactory(self.server, self)
+
+    def attach(self, connection):
+        load = self.load
+        server = self.server
+
+        # what crow2.irc.protocol.IRCProtocol does for every line
+        @connection.received.preparer
+        def parse_line(event):
+            event.message = message = parse(event.line)
+            event.command = message.command
+            # NAMES and WHO replies arrive all at once, with the line that ends them
+            load.lines += 1 + len(event.get("replies", ()))
+
+        @connection.received("001")
+        def welcome(event):
+            connection.send("JOIN %s" % ",".join(server.channels))
+
+        @connection.received("366")
+        def joined(event):
+            load.joined()
+
+        @connection.received("PRIVMSG")
+        def privmsg(event):
+            sent = event.message.tags.get("+crow2.bench/sent")
+            if sent is not None and load.measuring:
+                load.latencies.append(time.time() - float(sent))
+
+        connection.send("NICK %s" % server.nick)
+        connection.send("USER %s 0 * :crow2 load test" % server.user)
+
+class Load(object):
+    def __init__(self, bots, duration):
+        self.bot_count = bots
+        self.duration = duration
+        self.joined_count = 0
+        self.measuring = False
+        self.lines = 0
+        self.latencies = []
+
+    def joined(self):
+        self.joined_count += 1
+        if self.joined_count == self.bot_count:
+            print "all %d bots joined; measuring for %s seconds" % (self.bot_count, self.duration)
+            self.lines = 0
+            self.measuring = True
+            self.started = time.time()
+            self.started_cpu = cpu_time()
+            reactor.callLater(self.duration, self.finish)
+
+    def finish(self):
+        elapsed = time.time() - self.started
+        cpu = cpu_time() - self.started_cpu
+        self.measuring = False
+        print "%-30s %12.0f lines/s" % ("handled by all bots", self.lines / elapsed)
+        print "%-30s %12.0f lines/s" % ("handled per bot", self.lines / elapsed / self.bot_count)
+        if self.latencies:
+            print "%-30s %s" % ("latency", "  ".join("p%s %.2f ms" % (p, value * 1000)
+                    for p, value in percentiles(self.latencies, [50, 90, 99, 100])))
+        print "%-30s %12.1f %%" % ("cpu", 100 * cpu / elapsed)
+        reactor.stop()
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def start_server(args):
+    "the port of a fake server, started in a child process unless args.in_process"
+    if args.in_process:
+        traffic = None
+        if args.traffic:
+            with open(args.traffic) as reader:
+                traffic = [line.rstrip("\r\n") for line in reader if line.strip()]
+        factory, listening = ircserver.listen(reactor, rate=args.rate, traffic=traffic)
+        return listening.getHost().port, None
+
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+            "ircserver.py"), "--rate", str(args.rate)]
+    if args.traffic:
+        command += ["--traffic", args.traffic]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    banner = process.stdout.readline()
+    return int(banner.rsplit(":", 1)[1]), process
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="load test crow2.irc on a local fake server")
+    parser.add_argument("--bots", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=1000,
+            help="lines per second the server replays into the channel")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--traffic", help="file of raw irc lines to replay instead of the "
+            "built in mix")
+    parser.add_argument("--in-process", action="store_true",
+            help="run the server in this process")
+    args = parser.parse_args()
+
+    port, process = start_server(args)
+    try:
+        load = Load(args.bots, args.duration)
+        manager = ConnectionManager(reactor, max_connecting=args.bots, stagger=0.001)
+        for index in range(args.bots):
+            manager.add(Bot(load, index, port).server)
+        reactor.run()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Decorator application throughput for crow2.util.paramdecorator
+
+Plugins apply hundreds of parameter decorators at import time; this measures how many
+applications per second each calling style manages.
+"""
+from benchutil import throughput, report
+
+from crow2.util import paramdecorator
+from crow2.events.hook import Hook
+from crow2.events.handlerclass import instancehandler
+
+@paramdecorator
+def simple(func):
+    "decorator without arguments"
+    return func
+
+@paramdecorator
+def with_args(func, first, second=None):
+    "decorator with arguments"
+    return func
+
+def target(event):
+    "function being decorated"
+
+def simple_call():
+    simple(target)
+
+def argument_call():
+    with_args(1, second=2)(target)
+
+def keyword_call():
+    with_args(1, func=target)
+
+def definition():
+    paramdecorator(lambda func, arg: func)
+
+def hook_partial():
+    Hook()(before="other", after="another")
+
+def instancehandler_call():
+    instancehandler.conn.received(lambda self, event: None)
+
+def main():
+    report("@decorator", throughput(simple_call))
+    report("@decorator(args)", throughput(argument_call))
+    report("decorator(args, func=target)", throughput(keyword_call))
+    report("paramdecorator(new decorator)", throughput(definition, number=20000))
+    report("Hook()(before=..., after=...)", throughput(hook_partial, number=20000))
+    report("@instancehandler.conn.received", throughput(instancehandler_call, number=20000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Wall-clock time of crow2.plugin.Tracker.load on a generated plugin tree, with and without
+preloading it on threads; without a cache directory, so every module is compiled each time.
+Compiling holds the GIL for most of its time, so this is what tells whether preloading pays.
+
+    python benchmarks/bench_preload.py [THREADS ...]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchutil import compare
+
+from crow2 import plugin
+from crow2.events.hooktree import HookTree
+
+packagename = "bench_preload_package"
+
+def make_tree(directory):
+    "a pluginset of 120 modules with a few dozen functions each, and 4 packages of 10 more"
+    package = os.path.join(directory, packagename)
+    os.mkdir(package)
+    with open(os.path.join(package, "__init__.py"), "w") as writer:
+        writer.write("crow2_pluginset = True\n")
+    body = "".join("def handler_%d(event, value=%d):\n"
+                   "    if event.get('value', 0) > value:\n"
+                   "        return [value * item for item in range(value)]\n"
+                   "    return {'value': value, 'name': 'handler_%d'}\n\n" % (number, number, number)
+                   for number in range(40))
+    for number in range(120):
+        with open(os.path.join(package, "plugin%d.py" % number), "w") as writer:
+            writer.write(body)
+    for number in range(4):
+        subpackage = os.path.join(package, "subpackage%d" % number)
+        os.mkdir(subpackage)
+        with open(os.path.join(subpackage, "__init__.py"), "w") as writer:
+            writer.write("crow2_pluginset = True\ncrow2_load_children_override = True\n")
+        for child in range(10):
+            with open(os.path.join(subpackage, "child%d.py" % child), "w") as writer:
+                writer.write(body)
+
+def load_time(threads):
+    "seconds one Tracker.load of the tree takes, from nothing imported"
+    for name in [name for name in sys.modules if name.split(".")[0] == packagename]:
+        del sys.modules[name]
+    tracker = plugin.Tracker(packagename, hook=HookTree(), preload_threads=threads)
+    started = time.time()
+    tracker.load()
+    return time.time() - started
+
+def main(sysargs=None):
+    thread_counts = [int(arg) for arg in (sys.argv[1:] if sysargs is None else sysargs)] or [2, 4]
+    directory = tempfile.mkdtemp()
+    sys.path.insert(0, directory)
+    try:
+        make_tree(directory)
+        rates = [("no preload", 1 / min(load_time(0) for i in range(5)))]
+        for threads in thread_counts:
+            rates.append(("preload, %d threads" % threads, 1 / min(load_time(threads) for i in range(5))))
+        compare("Tracker.load", rates, unit="loads")
+    finally:
+        sys.path.remove(directory)
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Shared helpers for the benchmark scripts in this directory. Run them from anywhere as
+
+    python benchmarks/bench_<name>.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def throughput(func, number=100000, repeat=3, collect=False):
+    """
+    calls per second of func, best of repeat runs of number calls each; timeit turns the
+    garbage collector off, so pass collect=True when func makes reference cycles, to include
+    the cost of collecting them
+    """
+    setup = "import gc; gc.enable()" if collect else "pass"
+    best = min(timeit.repeat(func, setup=setup, number=number, repeat=repeat))
+    return number / best
+
+def report(name, rate, unit="ops"):
+    "print a line of benchmark output"
+    print "%-50s %12.0f %s/s" % (name, rate, unit)
+
+def compare(name, rates, unit="ops"):
+    """
+    print a line per implementation, with its speed relative to the first one
+
+    rates is a list of (implementation name, rate) pairs
+    """
+    baseline = rates[0][1]
+    for implementation, rate in rates:
+        print "%-50s %12.0f %s/s  (%.2fx)" % ("%s [%s]" % (name, implementation), rate, unit, rate / baseline)
+
+def percentiles(samples, wanted):
+    "(p, value) for each p in wanted, the nearest-rank percentiles of samples"
+    ordered = sorted(samples)
+    return [(p, ordered[max(0, int(round(p / 100.0 * len(ordered))) - 1)]) for p in wanted]
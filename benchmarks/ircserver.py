@@ -0,0 +1,227 @@
+"""
+A stand-in irc server for benchmarks, listening on localhost only. It answers registration
+(NICK and USER), JOIN, PART, NAMES, PING and QUIT, relays PRIVMSG and NOTICE to channels, and
+replays traffic into every channel at a fixed rate once somebody has joined it.
+
+Each replayed line carries a +crow2.bench/sent client tag with the time.time() it was written,
+so clients on the same machine can measure their latency.
+
+    python benchmarks/ircserver.py [--port PORT] [--rate LINES_PER_SECOND] [--traffic FILE]
+
+prints "listening on 127.0.0.1:PORT" once it's ready.
+"""
+import sys
+import time
+
+from twisted.internet.protocol import ServerFactory
+from twisted.internet.task import LoopingCall
+from twisted.protocols.basic import LineOnlyReceiver
+
+import benchutil # for sys.path
+from crow2.irc.message import parse, ParseError
+
+def synthetic_traffic(count=1000, who_every=30):
+    """
+    a mix of channel chatter and the numerics a bot sees in bulk (WHO replies, each run of
+    them ended by a 315 like a real server would); {channel} is replaced with the channel when
+    replaying, in these and in lines from a file
+    """
+    lines = []
+    for i in range(count):
+        if i % who_every < who_every // 3:
+            lines.append(":irc.fake 352 bot {channel} ~user%d host-%d.example.com irc.fake "
+                    "nick%d H :0 real name %d" % ((i,) * 4))
+            if i % who_every == who_every // 3 - 1 or i == count - 1:
+                lines.append(":irc.fake 315 bot {channel} :End of /WHO list.")
+        else:
+            lines.append(":nick%d!~user%d@host-%d.example.com PRIVMSG {channel} :message number %d"
+                    % (i % 97, i % 97, i % 97, i))
+    return lines
+
+def tagged(tag, line):
+    "line with tag added to its tags, and a delimiter"
+    if line.startswith("@"):
+        return "@%s;%s\r\n" % (tag, line[1:])
+    return "@%s %s\r\n" % (tag, line)
+
+class FakeClient(LineOnlyReceiver):
+    delimiter = "\r\n"
+    MAX_LENGTH = 16384
+
+    def connectionMade(self):
+        # otherwise nagle's algorithm and the bot's delayed acks add up to 40ms to latencies
+        self.transport.setTcpNoDelay(True)
+        self.nick = None
+        self.user = None
+        self.registered = False
+        self.channels = set()
+
+    def connectionLost(self, reason):
+        for channel in self.channels:
+            self.factory.part(self, channel)
+
+    def lineReceived(self, line):
+        try:
+            message = parse(line)
+        except ParseError:
+            return
+        handler = getattr(self, "irc_" + message.command, None)
+        if handler is not None:
+            handler(message.params)
+        elif self.registered:
+            self.numeric("421", message.command, "Unknown command")
+
+    def numeric(self, number, *params):
+        params = list(params)
+        params[-1] = ":" + params[-1]
+        self.sendLine(":%s %s %s %s"
+                % (self.factory.name, number, self.nick or "*", " ".join(params)))
+
+    def irc_NICK(self, params):
+        self.nick = params[0]
+        self._check_registered()
+
+    def irc_USER(self, params):
+        self.user = params[0]
+        self._check_registered()
+
+    def _check_registered(self):
+        if self.registered or not (self.nick and self.user):
+            return
+        self.registered = True
+        name = self.factory.name
+        self.numeric("001", "Welcome to the fake irc network %s" % self.nick)
+        self.numeric("002", "Your host is %s" % name)
+        self.numeric("003", "This server was created just now")
+        self.sendLine(":%s 004 %s %s fake-1.0 iow ov" % (name, self.nick, name))
+        self.sendLine(":%s 005 %s CASEMAPPING=rfc1459 CHANTYPES=# PREFIX=(ov)@+ NETWORK=Fake "
+                ":are supported by this server" % (name, self.nick))
+        self.numeric("375", "- %s message of the day" % name)
+        self.numeric("372", "- this server is for benchmarks only")
+        self.numeric("376", "End of /MOTD command.")
+
+    @property
+    def mask(self):
+        return "%s!%s@localhost" % (self.nick, self.user)
+
+    def irc_PING(self, params):
+        self.sendLine(":%s PONG %s :%s" % (self.factory.name, self.factory.name, params[-1]))
+
+    def irc_JOIN(self, params):
+        for channel in params[0].split(","):
+            if channel not in self.channels:
+                self.channels.add(channel)
+                self.factory.join(self, channel)
+                self.irc_NAMES([channel])
+
+    def irc_PART(self, params):
+        for channel in params[0].split(","):
+            if channel in self.channels:
+                self.factory.part(self, channel)
+                self.channels.discard(channel)
+
+    def irc_NAMES(self, params):
+        channel = params[0]
+        members = sorted(member.nick for member in self.factory.channels.get(channel, ()))
+        # a few dozen nicks per line, like real servers
+        for start in range(0, len(members), 40):
+            self.numeric("353", "=", channel, " ".join(members[start:start + 40]))
+        self.numeric("366", channel, "End of /NAMES list.")
+
+    def irc_PRIVMSG(self, params, command="PRIVMSG"):
+        target, text = params[0], params[-1]
+        line = ":%s %s %s :%s" % (self.mask, command, target, text)
+        for member in self.factory.channels.get(target, ()):
+            if member is not self:
+                member.sendLine(line)
+
+    def irc_NOTICE(self, params):
+        self.irc_PRIVMSG(params, "NOTICE")
+
+    def irc_QUIT(self, params):
+        self.transport.loseConnection()
+
+class FakeIRCServer(ServerFactory):
+    """
+    Replays rate lines per second of traffic (see synthetic_traffic) into each channel with
+    members, every interval seconds in a batch, written to each member with one write
+    """
+    protocol = FakeClient
+
+    def __init__(self, reactor, rate=1000, traffic=None, interval=0.01, name="irc.fake"):
+        self.reactor = reactor
+        self.rate = rate
+        self.traffic = traffic or synthetic_traffic()
+        self.interval = interval
+        self.name = name
+        self.channels = {}
+        self.replayed = 0
+        self._position = 0
+        self._started = None
+        self._replay = LoopingCall(self._tick)
+        self._replay.clock = reactor
+
+    def join(self, client, channel):
+        members = self.channels.setdefault(channel, set())
+        members.add(client)
+        line = ":%s JOIN %s" % (client.mask, channel)
+        for member in members:
+            member.sendLine(line)
+        if self.rate and not self._replay.running:
+            self._started = self.reactor.seconds()
+            self._replay.start(self.interval, now=False)
+
+    def part(self, client, channel):
+        members = self.channels.get(channel)
+        if not members:
+            return
+        line = ":%s PART %s" % (client.mask, channel)
+        for member in members:
+            member.sendLine(line)
+        members.discard(client)
+        if not members:
+            del self.channels[channel]
+
+    def _tick(self):
+        due = int((self.reactor.seconds() - self._started) * self.rate) - self.replayed
+        if due <= 0:
+            return
+        traffic = self.traffic
+        start = self._position
+        lines = [traffic[(start + i) % len(traffic)] for i in range(due)]
+        self._position = (start + due) % len(traffic)
+        self.replayed += due
+
+        tag = "+crow2.bench/sent=%.6f" % time.time()
+        for channel, members in self.channels.items():
+            data = "".join(tagged(tag, line.replace("{channel}", channel)) for line in lines)
+            for member in members:
+                member.transport.write(data)
+
+def listen(reactor, port=0, **options):
+    "start a FakeIRCServer on localhost; returns the factory and the listening port"
+    factory = FakeIRCServer(reactor, **options)
+    listening = reactor.listenTCP(port, factory, interface="127.0.0.1")
+    return factory, listening
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="fake irc server for benchmarks")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=1000,
+            help="lines per second replayed into each channel")
+    parser.add_argument("--traffic", help="file of raw irc lines to replay")
+    args = parser.parse_args()
+
+    from twisted.internet import reactor
+    traffic = None
+    if args.traffic:
+        with open(args.traffic) as reader:
+            traffic = [line.rstrip("\r\n") for line in reader if line.strip()]
+    factory, listening = listen(reactor, args.port, rate=args.rate, traffic=traffic)
+    print "listening on 127.0.0.1:%d" % listening.getHost().port
+    sys.stdout.flush()
+    reactor.run()
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,34 @@ from zope.interface.common.sequence import IWriteSequence, IExtendedReadSequence
 
 registry = AdapterRegistry()
 
+class AdapterCache(object):
+    """
+    Memo of (source specification, target interface) -> implementor for lookup(), so that adapting
+    the same kind of object again costs a dict lookup instead of a trip through the registry.
+
+    Entries are keyed on what the object provides rather than its raw type, since instances can
+    carry their own declarations (see zope.interface.alsoProvides). Each entry remembers the
+    specification's resolution order (__sro__), which zope.interface replaces whenever the
+    declarations change (eg classImplements on an existing class), so an entry made before such
+    a change is a miss. register() and deregister() invalidate the cache; if you change the
+    registry by any other means, call invalidate() too.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.registry = None
+
+    def invalidate(self, new_registry=None):
+        "forget all cached lookups"
+        self.entries.clear()
+        self.registry = new_registry
+
+    def __repr__(self):
+        return "<AdapterCache: %d entries, %d hits, %d misses>" % (len(self.entries), self.hits, self.misses)
+
+cache = AdapterCache()
+
 class INumber(Interface):
     "A number, whole, real, or otherwise"
 
@@ -95,6 +123,7 @@ def register(implementor, orig, *target_interfaces):
 
     for target_interface in target_interfaces:
         registry.register([orig_interface], target_interface, '', implementor)
+    cache.invalidate(registry)
     return implementor
 
 def adapter_for(orig, *target_interfaces):
@@ -132,6 +161,10 @@ def deregister(implementor, orig, *target_interfaces):
     register(None, orig, *target_interfaces)
 
 
+def _identity(obj):
+    "implementor for adapting an object to what it already is"
+    return obj
+
 def lookup(targetinterface, obj):
     "look up to see if there are any adapters to adapt an obj to a targetinterface"
     try:
@@ -139,12 +172,24 @@ def lookup(targetinterface, obj):
     except KeyError:
         sourceinterface = providedBy(obj)
 
-    if targetinterface == sourceinterface:
-        return obj
+    if cache.registry is not registry:
+        cache.invalidate(registry)
 
-    implementor = registry.lookup1(sourceinterface, targetinterface, '')
-
-    if implementor == None:
+    key = (sourceinterface, targetinterface)
+    resolution = sourceinterface.__sro__
+    entry = cache.entries.get(key)
+    if entry is not None and entry[0] is resolution:
+        cache.hits += 1
+        implementor = entry[1]
+    else:
+        cache.misses += 1
+        if targetinterface == sourceinterface:
+            implementor = _identity
+        else:
+            implementor = registry.lookup1(sourceinterface, targetinterface, '')
+        cache.entries[key] = (resolution, implementor)
+
+    if implementor is None:
         return None
 
     return implementor(obj)
@@ -31,3 +31,14 @@ class ExceptionInCallError(Exception):
 
 class DecoratedFuncMissingError(Exception):
     pass
+
+class CallListChanged(Exception):
+    """
+    Raised by a handler which changed the registrations of the hook calling it (see
+    crow2.plugin.LazyPlugin), to have the rest of the fire call remaining, in order, instead of
+    what was left of the old call list
+    """
+    def __init__(self, remaining):
+        super(CallListChanged, self).__init__(remaining)
+        self.remaining = remaining
+
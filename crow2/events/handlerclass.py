@@ -1,9 +1,10 @@
 import inspect
 import functools
+import weakref
 
 from twisted.python import log
 
-from crow2.util import AttrDict, paramdecorator
+from crow2.util import AttrDict, paramdecorator, WeakMethod
 from crow2.events.util import LazyCall
 from .exceptions import AlreadyRegisteredError, NotRegisteredError, NotInstantiableError
 
@@ -79,7 +80,7 @@ class HookMethodProxy(object):
         """
         pass along a call to all bound methods
         """
-        for bound_method in self.bound_methods:
+        for bound_method in tuple(self.bound_methods): # instances may be freed while we're calling
             bound_method(*args, **keywords)
 
     @property
@@ -162,9 +163,15 @@ class _HandlerClass(object):
     """
     Proxies a class such that when an instance is called, the created instance will be tracked and
     any @hook.method-ed methods will be registered
+
+    If the class sets crow2_weak_instances = True, instances are only weakly referenced, and are
+    freed automatically when they are garbage collected, even if delete() is never called.
     """
     def __init__(self, clazz):
         self.clazz = clazz
+        self.weak = getattr(clazz, "crow2_weak_instances", False)
+        # classes with __slots__ and no __dict__ can't be given a delete attribute
+        self.attach_delete = getattr(clazz, "__dictoffset__", 1) != 0
         flattened = AttrDict()
         self.flattened = flattened
         assert clazz is not None
@@ -174,6 +181,10 @@ class _HandlerClass(object):
 
         self._proxy_for = (clazz,)
 
+        if self.weak and not getattr(clazz, "__weakrefoffset__", 1):
+            raise NotInstantiableError("%r: cannot weakly track class %r without a __weakref__ slot" %
+                                        (self, clazz))
+
         init = flattened['__init__']
         if _get_method_regs(init):
             raise NotInstantiableError("%r: cannot register class %r for instantiation with listening __init__" % 
@@ -187,9 +198,20 @@ class _HandlerClass(object):
                 for reg in regs:
                     self.method_regs.add((name, reg))
 
-        self.instance_methods = {}
+        self.binding_plan = self._make_binding_plan(self.method_regs)
         self.instances = {}
 
+    @staticmethod
+    def _make_binding_plan(method_regs):
+        """
+        Group method registrations by attribute name, so that binding an instance only has to look
+        each method up once
+        """
+        by_name = {}
+        for name, reg in method_regs:
+            by_name.setdefault(name, []).append(reg)
+        return tuple((name, tuple(regs)) for name, regs in sorted(by_name.items()))
+
     def register(self):
         """
         register all method proxies with their respective hooks
@@ -206,41 +228,74 @@ class _HandlerClass(object):
             reg.unregister(self.clazz, name)
         self.registered = False
 
-    def __call__(self, event):
+    def _ensure_registered(self):
         """
-        Instantiate our class and begin tracking it
-
-        1. instantiate the class
-        2. add the instance to all of our method proxies
-        3. shove a callback into the instance to allow it to ask us to delete it
-        4. return the created instance
+        register our method proxies if this is the first instance we're tracking
         """
-        if not len(self.instances):
+        if not self.instances:
             if self.registered: # this is an invalid-internal-state case - pragma: no cover
                 raise AlreadyRegisteredError("%r: about to register proxies, but proxies "
                             "are registered, and no previous instances known!" % self)
             self.register()
 
+    def _instantiate(self, event):
+        """
+        Create and bind a single instance; proxies must already be registered
+        """
         instance = self.clazz(event)
         instance_id = id(instance)
 
-        self.instances[instance_id] = instance
-        methods = self.instance_methods[instance_id] = {}
-        for name, reg in self.method_regs:
+        if self.weak:
+            tracked = weakref.ref(instance, functools.partial(self._reclaim, instance_id))
+            wrap = WeakMethod
+            delete = functools.partial(self._delete_weak, tracked)
+        else:
+            tracked = instance
+            wrap = None
+            delete = functools.partial(self.free_instance, instance)
+
+        bound = []
+        for name, regs in self.binding_plan:
             method = getattr(instance, name)
-            methods[name] = method
-            reg.add_bound_method(method, event)
-
-        @functools.wraps(self.free_instance)
-        def delete():
-            "This docstring to shut pylint up"
-            self.free_instance(instance)
-        if hasattr(instance, "delete"):
-            log.msg("WARNING: about to obliterate instance %r's attribute delete"
-                               " with %r!" % (instance, delete))
-        instance.delete = delete
+            if wrap is not None:
+                method = wrap(method)
+            for reg in regs:
+                reg.add_bound_method(method, event)
+            bound.append((method, regs))
+        self.instances[instance_id] = (tracked, tuple(bound))
+
+        if self.attach_delete:
+            if hasattr(instance, "delete"):
+                log.msg("WARNING: about to obliterate instance %r's attribute delete"
+                                   " with %r!" % (instance, delete))
+            instance.delete = delete
         return instance
 
+    def __call__(self, event):
+        """
+        Instantiate our class and begin tracking it
+
+        1. instantiate the class
+        2. add the instance to all of our method proxies
+        3. shove a callback into the instance to allow it to ask us to delete it
+        4. return the created instance
+        """
+        self._ensure_registered()
+        return self._instantiate(event)
+
+    def instantiate_many(self, events):
+        """
+        Instantiate our class once for each event in events, and return the list of created instances
+
+        Equivalent to calling us once per event, but only checks proxy registration once; meant for
+        when many instances are created at once, such as when reconnecting to lots of servers
+        """
+        events = list(events)
+        if not events:
+            return []
+        self._ensure_registered()
+        instantiate = self._instantiate
+        return [instantiate(event) for event in events]
 
     def free_instance(self, instance):
         """
@@ -250,16 +305,51 @@ class _HandlerClass(object):
         from the class proxy so that it can be garbage collected
         """
         instance_id = id(instance)
-        if instance_id not in self.instances:
+        try:
+            tracked = self.instances[instance_id][0]
+        except KeyError:
+            tracked = None
+        if self.weak and tracked is not None:
+            tracked = tracked()
+        if tracked is not instance:
             raise NotRegisteredError("%r: instance %r (id: %r) is not registered" % (self, instance, instance_id))
 
-        del self.instances[instance_id]
+        self._release(instance_id)
 
-        methods = self.instance_methods[instance_id]
-        for name, reg in self.method_regs:
-            reg.remove_bound_method(methods[name])
+    def _delete_weak(self, ref):
+        """
+        delete() handle for weakly tracked instances; holds only a weak reference so that it
+        doesn't keep the instance alive by itself
+        """
+        instance = ref()
+        if instance is None: # can't be called after collection except by a stray handle - pragma: no cover
+            raise NotRegisteredError("%r: instance was already garbage collected" % self)
+        self.free_instance(instance)
 
-        if not len(self.instances):
+    def _reclaim(self, instance_id, ref):
+        """
+        weakref callback: free a weakly tracked instance which was garbage collected without
+        being deleted
+        """
+        try:
+            tracked = self.instances[instance_id][0]
+        except KeyError:
+            return
+        if tracked is ref:
+            self._release(instance_id)
+
+    def _release(self, instance_id):
+        """
+        Unbind a tracked instance from all method proxies, and unregister the proxies if it was
+        the last instance
+        """
+        tracked, bound = self.instances.pop(instance_id)
+
+        for method, regs in bound:
+            for reg in regs:
+                reg.remove_bound_method(method)
+
+        if not self.instances:
             if not self.registered: # this is an invalid-internal-state case - pragma: no cover
                 raise NotRegisteredError("%r: about to unregister proxies, but proxies are already "
                                         "unregistered, and all instances already unregistered!" % self)
@@ -273,3 +363,25 @@ def handlerclass(clazz, hook, *args, **keywords):
         clazz._crow2_classreg = classreg = _HandlerClass(clazz)
     hook.register(classreg, *args, **keywords)
     return clazz
+
+def instantiate_many(clazz, events):
+    """
+    Bulk version of firing a @handlerclass-ed class's hook: create one instance of clazz per event
+    """
+    try:
+        classreg = clazz._crow2_classreg
+    except AttributeError:
+        raise NotInstantiableError("%r is not a handlerclass" % clazz)
+    return classreg.instantiate_many(events)
+
+def delete_instance(instance):
+    """
+    Release an instance of a @handlerclass-ed class; equivalent to instance.delete(), but also
+    works for classes whose instances can't be given a delete attribute, such as ones with
+    __slots__
+    """
+    try:
+        classreg = type(instance)._crow2_classreg
+    except AttributeError:
+        raise NotRegisteredError("%r is not an instance of a handlerclass" % (instance,))
+    classreg.free_instance(instance)
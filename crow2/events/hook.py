@@ -1,14 +1,16 @@
 from zope.interface import Interface, Attribute, implementer
 from crow2.util import AttrDict
 import functools
+import time
 import types
+import weakref
 from twisted.python.reflect import namedAny
 from twisted.python import log
 from collections import defaultdict
-from crow2.util import paramdecorator
+from crow2.util import paramdecorator, WeakMethod, DEBUG, DEBUG_calling_name
 from .util import topological_sort
 from .exceptions import (NameResolutionError, NotRegisteredError, DuplicateRegistrationError,
-        InvalidOrderRequirementsError, DependencyMissingError)
+        InvalidOrderRequirementsError, DependencyMissingError, CallListChanged)
 
 class IRegistrationContainer(Interface):
     """
@@ -122,6 +124,42 @@ class IPartialRegistration(Interface):
     def copy():
         "Return a full copy of this partial"
 
+# modules whose frames are skipped when debug-naming hooks by where they were created
+_internal_modules = frozenset((__name__, "crow2.events.hooktree"))
+
+# while startup profiling, called with (hook, seconds) each time a hook sorts its call list
+sort_timer = None
+
+# while replaying captured traffic, called with (handler, seconds) after each handler call
+handler_timer = None
+
+def _timed(calllist):
+    "calllist, with each handler wrapped to report how long it took to handler_timer"
+    def timed(handler):
+        def call(event):
+            started = time.time()
+            try:
+                return handler(event)
+            finally:
+                handler_timer(handler, time.time() - started)
+        return call
+    return [timed(handler) for handler in calllist]
+
+# every hook there is, so that the ones a module has handlers on can be found; see owners()
+all_hooks = weakref.WeakSet()
+
+def owners(module):
+    "the hooks which have handlers from the module named module registered"
+    return [hook for hook in list(all_hooks) if module in hook.owned_handlers()]
+
+def owner_module(reference):
+    """
+    The name of the module which defined a registered object, or None if it can't be told
+    """
+    if type(reference) in (types.MethodType, WeakMethod):
+        reference = reference.im_func
+    return getattr(reference, "__module__", None)
+
 @implementer(IHook)
 class BaseHook(object):
     """
@@ -137,10 +175,15 @@ class BaseHook(object):
         self.references = {}
         self.referencenames = {}
         self.registration_groups = set()
+        self.once_wrappers = {}
+        self._owned_handlers = None
         self.tags = TagDict()
         self.stop_exceptions = stop_exceptions
 
+        if DEBUG and name is None:
+            name = "%s.unnamed_%s" % (DEBUG_calling_name(_internal_modules), type(self).__name__)
         self._name = name
+        all_hooks.add(self)
 
         lasttag = ()
         for tagname in default_tags:
@@ -156,13 +199,24 @@ class BaseHook(object):
         Fire the hook. Ensures call list is sorted and calls everything.
         """
 
-        if self.sorted_call_list == None:
-            self._toposort, self.sorted_call_list = self._build_call_list(self.registration_groups)
         event = self._make_eventobj(*args, **keywords)
-        self._fire_call_list(self.sorted_call_list, event)
+        self._fire_call_list(self._get_call_list(), event)
 
         return event
 
+    def _get_call_list(self):
+        """
+        Get the sorted call list, sorting it first if registrations changed since the last sort
+        """
+        if self.sorted_call_list == None:
+            if sort_timer is None:
+                self._toposort, self.sorted_call_list = self._build_call_list(self.registration_groups)
+            else:
+                started = time.time()
+                self._toposort, self.sorted_call_list = self._build_call_list(self.registration_groups)
+                sort_timer(self, time.time() - started)
+        return self.sorted_call_list
+
     def _make_eventobj(self, *dicts, **keywords):
         """
         Prepare the objects which will be passed into handlers
@@ -178,9 +232,13 @@ class BaseHook(object):
         """
         actually call all the handlers in our call list
         """
+        if handler_timer is not None:
+            calllist = _timed(calllist)
         for handler in calllist:
             try:
                 handler(event)
+            except CallListChanged as changed:
+                return self._fire_call_list(changed.remaining, event)
             except:
                 if self.stop_exceptions:
                     log.err()
@@ -197,12 +255,14 @@ class BaseHook(object):
         cachename = '_crow2events_fully_qualified_name_'
 
         try:
-            result = getattr(obj, cachename)
+            return getattr(obj, cachename)
         except AttributeError:
             pass
 
         if type(obj) == types.MethodType:
             return '.'.join((obj.__module__, obj.im_class.__name__, obj.__name__))
+        elif type(obj) == WeakMethod:
+            return '.'.join((obj.im_func.__module__, obj.im_class.__name__, obj.__name__))
         elif type(obj) in (type, types.ClassType, types.FunctionType):
             result = obj.__module__ + "." + obj.__name__
         elif type(obj) == types.ModuleType:
@@ -352,29 +412,47 @@ class BaseHook(object):
 
         self.registration_groups.add(self.handler_references[func])
 
+        self._owned_handlers = None
         self.sorted_call_list = None # need to recalculate
 
         return func
 
     def register_once(self, func, *reg_args, **reg_keywords):
         """
-        Register a handler to be called once
+        Register a handler to be called once; it can be unregistered before it's called by
+        passing the original handler to unregister()
         """
-        #TODO: ensure that unregistration works if someone tries to unregister a register_once'd handler
         @functools.wraps(func)
         def unregister_callback(*call_args, **call_keywords):
             "this docstring to shut pylint up - nobody will ever see it except reading the code itself"
             try:
                 return func(*call_args, **call_keywords)
             finally:
+                self._forget_once(func, unregister_callback)
                 self.unregister(unregister_callback)
+        unregister_callback._crow2_once = True
         self.register(unregister_callback, *reg_args, **reg_keywords)
+        self.once_wrappers.setdefault(func, []).append(unregister_callback)
         return func
 
+    def _forget_once(self, func, wrapper):
+        wrappers = self.once_wrappers.get(func)
+        if wrappers and wrapper in wrappers:
+            wrappers.remove(wrapper)
+            if not wrappers:
+                del self.once_wrappers[func]
+
     def unregister(self, func):
         """
-        Unregister a handler
+        Unregister a handler. If func is registered itself, that registration is removed;
+        otherwise the latest of its registrations with register_once() is.
         """
+        if func not in self.handler_references:
+            wrappers = self.once_wrappers.get(func)
+            if wrappers:
+                wrapper = wrappers[-1]
+                self._forget_once(func, wrapper)
+                func = wrapper
         try:
             references = func._proxy_for
         except AttributeError:
@@ -383,22 +461,49 @@ class BaseHook(object):
             if reference not in self.references:
                 raise NotRegisteredError("%r: cannot unregister %r (%r) as it is not registered" %
                         (self, reference, func))
+        registration = self.handler_references[func]
         for reference in references:
             del self.references[reference]
             try:
-                del self.referencenames[self._get_name(reference)]
+                name = self._get_name(reference)
             except NameResolutionError:
                 log.msg("WARNING: unable to determine name of object %r (%s, %r, %r)" %
                             (reference, str(reference), type(reference), dir(reference)))
+            else:
+                # several instances' methods share a name; only the latest registration owns it
+                if self.referencenames.get(name) is registration:
+                    del self.referencenames[name]
 
-        registration = self.handler_references[func]
         del self.handler_references[func]
         if registration._is_taggroup:
             registration.remove(func)
         else:
             self.registration_groups.remove(registration)
 
-        self.sorted_call_list = None
+        self._owned_handlers = None
+
+        if self.sorted_call_list is not None and getattr(func, "_crow2_once", False):
+            # removing a node never invalidates a topological order, and one-shot registrations
+            # come and go often, so keep the sorted call list instead of sorting again
+            self.sorted_call_list = tuple(target for target in self.sorted_call_list if target is not func)
+            if not registration._is_taggroup:
+                self._toposort.remove(registration)
+        else:
+            self.sorted_call_list = None
+
+    def owned_handlers(self):
+        """
+        module name -> the handlers registered from that module. Only reloading plugins needs
+        this, so it's worked out when asked for, not kept up to date by every registration.
+        """
+        if self._owned_handlers is None:
+            owned = {}
+            for func in self.handler_references:
+                module = owner_module(getattr(func, "_proxy_for", (func,))[0])
+                if module is not None:
+                    owned.setdefault(module, set()).add(func)
+            self._owned_handlers = owned
+        return self._owned_handlers
 
     def tag(self, tagname, before=(), after=()):
         before = self._ensure_list(before)
@@ -428,6 +533,8 @@ class Hook(BaseHook, DecoratorMixin):
     pass
 
 class _CancellerAttrDict(AttrDict):
+    __slots__ = ()
+
     def cancel(self):
         self.cancelled = True
 
@@ -438,9 +545,13 @@ class CancellableHook(Hook):
         return event
 
     def _fire_call_list(self, calllist, event):
+        if handler_timer is not None:
+            calllist = _timed(calllist)
         for handler in calllist:
             try:
                 handler(event)
+            except CallListChanged as changed:
+                return self._fire_call_list(changed.remaining, event)
             except:
                 if self.stop_exceptions:
                     log.err()
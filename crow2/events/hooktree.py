@@ -1,8 +1,10 @@
+import functools
 import weakref
 import itertools
+import time
 
 from crow2.util import paramdecorator, DEBUG, DEBUG_calling_name
-from .hook import Hook, IDecoratorHook, DecoratorMixin
+from .hook import Hook, IDecoratorHook, DecoratorMixin, _internal_modules
 from .exceptions import AlreadyRegisteredError, NameResolutionError, NotRegisteredError
 from crow2.events.util import LazyCall
 from zope.interface import implementer
@@ -78,7 +80,7 @@ class HookTree(_LazyHookTree):
         self._name = name
 
         if DEBUG and self._name is None:
-            self._name = DEBUG_calling_name() + ".unnamed_HookTree"
+            self._name = DEBUG_calling_name(_internal_modules) + ".unnamed_HookTree"
 
         self._lazy = start_lazy
         self._started_lazy = start_lazy
@@ -89,13 +91,22 @@ class HookTree(_LazyHookTree):
         if not start_lazy:
             self._children = {}
 
-    def _unlazy(self):
+    def _unlazy(self, on_resolve=None):
+        """
+        Perform all the calls made while lazy. If on_resolve is passed, it is called with
+        (lazycall, seconds) after each one.
+        """
         if not self._lazy:
             raise AlreadyRegisteredError("%r is not lazy (started lazy: %r)" % (self, self._started_lazy))
         self._children = {}
         self._lazy = False
         for lazycall in itertools.chain(self._lazy_specials, self._lazy_calls):
-            lazycall.resolve(self)
+            if on_resolve is None:
+                lazycall.resolve(self)
+            else:
+                started = time.time()
+                lazycall.resolve(self)
+                on_resolve(lazycall, time.time() - started)
 
     def __getattr__(self, attr):
         if self._lazy:
@@ -143,7 +154,12 @@ class HookTree(_LazyHookTree):
         if self._lazy:
             return super(HookTree, self).createsub(name, *args, **keywords)
 
-        self.createhook(name, hook_class=type(self), *args, **keywords)
+        tree_class = type(self)
+        default_hook_class = keywords.pop("default_hook_class", None)
+        if default_hook_class is not None:
+            # createhook takes hook_class for itself, so pass this one on positionally
+            tree_class = functools.partial(tree_class, default_hook_class)
+        self.createhook(name, hook_class=tree_class, *args, **keywords)
         return self._children[name]
 
     def addhook(self, name, instance, name_child=True):
@@ -160,9 +176,8 @@ class HookTree(_LazyHookTree):
 
 class ChildHook(Hook):
     def __init__(self, parent, name, *args, **keywords):
-        super(ChildHook, self).__init__(*args, **keywords)
+        super(ChildHook, self).__init__(name=name, *args, **keywords)
         self._parent = parent
-        self._name = name
 
     def _attempt_freeing(self):
         if not len(self.registration_groups):
@@ -205,6 +220,8 @@ class HookMultiplexer(DecoratorMixin):
             missing=None):
         self._children = {}
         self._hook_class = hook_class
+        if DEBUG and name is None:
+            name = "%s.unnamed_%s" % (DEBUG_calling_name(_internal_modules), type(self).__name__)
         self._name = name
 
         self.preparer = preparer
@@ -295,6 +312,20 @@ class _InstanceHookProxy(DecoratorMixin):
         kwargs["_instance"] = self.instance_weakref()
         return self.parent.fire(*args, **kwargs)
 
+    def fire_each(self, context, name, values, stop=None):
+        """
+        Fire once for each of values, passed as the keyword name; the instance is only looked up
+        once for the batch. If stop is passed, it's called before each fire after the first, and
+        the rest of the batch is skipped once it returns true.
+        """
+        keywords = {"_instance": self.instance_weakref()}
+        fire = self.parent.fire
+        for index, value in enumerate(values):
+            if index and stop is not None and stop():
+                return
+            keywords[name] = value
+            fire(context, **keywords)
+
     def register(self, handler, *args, **keywords):
         return self.hook.register(handler, *args, **keywords)
 
@@ -324,7 +355,9 @@ class InstanceHook(HookMultiplexer):
         try:
             return self._child_proxies[instance]
         except KeyError:
-            self._children[instance] = self._hook_class()
+            self._children[instance] = child = self._hook_class()
+            if DEBUG:
+                child._name = "%s[%s@%x]" % (self._name, type(instance).__name__, id(instance))
             proxy = _InstanceHookProxy(self._children[instance], weakref.ref(instance), self)
             self._child_proxies[instance] = proxy
             return proxy
@@ -1,3 +1,5 @@
+import gc
+
 import pytest
 
 import crow2.test.setup # pylint: disable = W0611
@@ -5,7 +7,8 @@ from crow2.test.util import Counter
 from crow2.events import exceptions
 from crow2.events.hook import Hook
 from crow2.events.handlerclass import (HookMethodProxy, instancehandler,
-        handlermethod, _get_method_regs, _HandlerClass, handlerclass)
+        handlermethod, _get_method_regs, _HandlerClass, handlerclass, instantiate_many,
+        delete_instance)
 from crow2.util import AttrDict
 
 
@@ -343,6 +346,74 @@ class TestHandlerClass(object):
         with pytest.raises(exceptions.NotInstantiableError):
             otherreg = _HandlerClass(OtherClazz)
 
+    def test_binding_plan(self):
+        class Clazz(object):
+            def __init__(self, event):
+                pass
+            def herp(self):
+                should_never_run()
+            herp._crow2_instancehookregs = [DummyAttributeRegistration(), DummyAttributeRegistration()]
+        herp = vars(Clazz)["herp"]
+        dummy1, dummy2 = herp._crow2_instancehookregs
+
+        reg = _HandlerClass(Clazz)
+        assert len(reg.binding_plan) == 1
+        name, regs = reg.binding_plan[0]
+        assert name == "herp"
+        assert set(regs) == set((dummy1, dummy2))
+
+        instance = reg(AttrDict())
+        assert dummy1.bounds[0][0] == instance.herp
+        assert dummy2.bounds[0][0] == instance.herp
+
+        instance.delete()
+        assert dummy1.unbounds == [instance.herp]
+        assert dummy2.unbounds == [instance.herp]
+
+    def test_instantiate_many(self):
+        class Clazz(object):
+            def __init__(self, event):
+                self.event = event
+            def herp(self):
+                should_never_run()
+            herp._crow2_instancehookregs = [DummyAttributeRegistration()]
+        dummy = vars(Clazz)["herp"]._crow2_instancehookregs[0]
+
+        reg = _HandlerClass(Clazz)
+        assert reg.instantiate_many([]) == []
+        assert dummy.registereds == []
+
+        events = [AttrDict(), AttrDict(), AttrDict()]
+        instances = reg.instantiate_many(iter(events))
+        assert [instance.event for instance in instances] == events
+        assert dummy.registereds == [(Clazz, "herp")]
+        assert dummy.bounds == [(instance.herp, instance.event) for instance in instances]
+
+        for instance in instances:
+            instance.delete()
+        assert dummy.unregistereds == [(Clazz, "herp")]
+        assert not reg.instances
+
+def test_instantiate_many_function():
+    registrations = []
+    hook = AttrDict(register=lambda handler: registrations.append(handler))
+
+    @handlerclass(hook)
+    class Target(object):
+        def __init__(self, event):
+            self.event = event
+
+    events = [AttrDict(), AttrDict()]
+    instances = instantiate_many(Target, events)
+    assert [instance.event for instance in instances] == events
+    assert len(Target._crow2_classreg.instances) == 2
+
+    class NotHandlerClass(object):
+        pass
+
+    with pytest.raises(exceptions.NotInstantiableError):
+        instantiate_many(NotHandlerClass, events)
+
 def test_integration():
     hook1 = Hook()
     hook2 = Hook()
@@ -390,3 +461,85 @@ def test_integration():
     assert result.other_counter.incremented(0)
     hook3_result = hook2_result.hook.fire(counter2=Counter())
     assert hook3_result.counter2.incremented(0)
+
+def test_slotted_class():
+    hook_method = Hook()
+
+    @handlerclass(Hook())
+    class Slotted(object):
+        __slots__ = ("event",)
+        def __init__(self, event):
+            self.event = event
+
+        @handlermethod(hook_method)
+        def a_method(self, event):
+            event.counter.tick()
+
+    instance = Slotted._crow2_classreg(AttrDict())
+    assert not hasattr(instance, "delete")
+
+    result = hook_method.fire(counter=Counter())
+    assert result.counter.incremented(1)
+
+    delete_instance(instance)
+    result = hook_method.fire(counter=Counter())
+    assert result.counter.incremented(0)
+
+    with pytest.raises(exceptions.NotRegisteredError):
+        delete_instance(instance)
+    with pytest.raises(exceptions.NotRegisteredError):
+        delete_instance(object())
+
+def test_weak_instances():
+    hook_method = Hook()
+
+    @handlerclass(Hook())
+    class Weak(object):
+        crow2_weak_instances = True
+        def __init__(self, event):
+            pass
+
+        @handlermethod(hook_method)
+        def a_method(self, event):
+            event.counter.tick()
+
+        @instancehandler.hook
+        def a_handler(self, event):
+            event.counter.tick()
+
+    classreg = Weak._crow2_classreg
+    event = AttrDict(hook=Hook())
+    instance1, instance2 = classreg.instantiate_many([event, event])
+
+    result = hook_method.fire(counter=Counter())
+    assert result.counter.incremented(2)
+    result = event.hook.fire(counter=Counter())
+    assert result.counter.incremented(2)
+
+    # nobody calls delete(); dropping the instance is enough
+    del instance1
+    gc.collect()
+    assert len(classreg.instances) == 1
+    result = hook_method.fire(counter=Counter())
+    assert result.counter.incremented(1)
+    result = event.hook.fire(counter=Counter())
+    assert result.counter.incremented(1)
+
+    instance2.delete()
+    assert not classreg.instances
+    assert not classreg.registered
+    result = hook_method.fire(counter=Counter())
+    assert result.counter.incremented(0)
+
+    with pytest.raises(exceptions.NotRegisteredError):
+        instance2.delete()
+
+def test_weak_requires_weakref_slot():
+    class NoWeakref(object):
+        __slots__ = ()
+        crow2_weak_instances = True
+        def __init__(self, event):
+            should_never_run()
+
+    with pytest.raises(exceptions.NotInstantiableError):
+        _HandlerClass(NoWeakref)
@@ -2,8 +2,10 @@ import pytest
 
 import crow2.test.setup # pylint: disable = W0611
 from crow2.test.util import Counter
-from crow2.events.hook import Hook, CancellableHook
+from crow2.events.hook import Hook, CancellableHook, owners
 from crow2.events import exceptions
+from crow2.events import hook as hook_module
+from crow2.util import WeakMethod
 
 def pytest_generate_tests(metafunc):
     """
@@ -43,6 +45,29 @@ class TestSimpleHook(object):
                 "registering to the same hook twice doesn't work"
                 should_never_run()
 
+    def test_same_name_methods(self, target):
+        hook = target()
+
+        class Handler(object):
+            def __init__(self):
+                self.counter = Counter()
+            def handle(self, event):
+                self.counter.tick()
+
+        handler1 = Handler()
+        handler2 = Handler()
+        hook.register(handler1.handle)
+        hook.register(handler2.handle)
+        hook.fire()
+        assert handler1.counter.incremented(1)
+        assert handler2.counter.incremented(1)
+
+        hook.unregister(handler1.handle)
+        hook.unregister(handler2.handle)
+        hook.fire()
+        assert handler1.counter.incremented(0)
+        assert handler2.counter.incremented(0)
+
     def test_calldicts(self, target):
         hook = target()
         counter = Counter()
@@ -200,6 +225,73 @@ class TestOrderedHook(object):
         with pytest.raises(exceptions.NotRegisteredError):
             hook.unregister(callonce)
 
+    def test_once_unregister(self, target):
+        hook = target()
+        counter = Counter()
+
+        def callonce(event):
+            counter.tick()
+        hook.register_once(callonce)
+        hook.unregister(callonce)
+
+        hook.fire()
+        assert counter.incremented(0)
+        assert not hook.once_wrappers
+
+        with pytest.raises(exceptions.NotRegisteredError):
+            hook.unregister(callonce)
+
+        hook.register_once(callonce)
+        hook.fire()
+        assert counter.incremented(1)
+        assert not hook.once_wrappers
+        with pytest.raises(exceptions.NotRegisteredError):
+            hook.unregister(callonce)
+
+    def test_once_and_plain(self, target):
+        hook = target()
+        calls = []
+
+        def handler(event):
+            calls.append(event.value)
+        hook.register(handler)
+        hook.register_once(handler)
+
+        # the plain registration goes first, leaving the one-shot one
+        hook.unregister(handler)
+        hook.fire(value=1)
+        hook.fire(value=2)
+        assert calls == [1]
+        assert not hook.once_wrappers
+
+        hook.register_once(handler)
+        hook.register(handler)
+        hook.unregister(handler)
+        hook.unregister(handler)
+        hook.fire(value=3)
+        assert calls == [1]
+        assert not hook.once_wrappers
+        with pytest.raises(exceptions.NotRegisteredError):
+            hook.unregister(handler)
+
+    def test_ownership(self, target):
+        hook = target()
+        other_hook = target()
+
+        def handler(event):
+            pass
+        hook.register(handler)
+        other_hook.register_once(handler)
+        assert hook.owned_handlers() == {__name__: set([handler])}
+        assert set(owners(__name__)) >= set([hook, other_hook])
+
+        hook.unregister(handler)
+        other_hook.unregister(handler)
+        assert not hook.owned_handlers()
+        assert not other_hook.owned_handlers()
+        assert hook not in owners(__name__)
+        assert other_hook not in owners(__name__)
+
     def test_dependency_lookup(self, target): 
         hook = target()
         @hook
@@ -224,6 +316,8 @@ class TestOrderedHook(object):
         assert hook._get_name(hook_reference_target) == "crow2.events.test.hook_reference_target"
 
         assert hook._get_name(self.test_dependency_lookup) == "crow2.events.test.test_hook.TestOrderedHook.test_dependency_lookup"
+        weak_method = WeakMethod(self.test_dependency_lookup)
+        assert hook._get_name(weak_method) == "crow2.events.test.test_hook.TestOrderedHook.test_dependency_lookup"
 
         with pytest.raises(Exception):
             hook._get_name(5)
@@ -379,4 +473,21 @@ def test_cancellation():
     assert event.first_called
     assert event.cancelled
 
-    
+def test_handler_timer(monkeypatch):
+    timed = []
+    monkeypatch.setattr(hook_module, "handler_timer",
+            lambda handler, seconds: timed.append((handler, seconds)))
+    hook = CancellableHook()
+
+    @hook(before="second")
+    def first(event):
+        event.cancel()
+
+    @hook
+    def second(event):
+        assert not "reached" # pragma: no cover
+
+    event = hook.fire()
+    assert event.cancelled
+    assert [handler for handler, seconds in timed] == [first]
+    assert timed[0][1] >= 0
@@ -29,6 +29,13 @@ class TestHookTree(object):
         assert isinstance(hooktree.child_hooktree, HookTree)
         assert hooktree.child_hooktree is not hooktree
 
+    def test_createsub_default_hook_class(self):
+        hooktree = HookTree()
+        hooktree.createsub("child_hooktree", default_hook_class=CancellableHook)
+        hooktree.child_hooktree.createhook("child_hook")
+        assert isinstance(hooktree.child_hooktree, HookTree)
+        assert isinstance(hooktree.child_hooktree.child_hook, CancellableHook)
+
     def test_instantiatehook(self):
         hooktree = HookTree()
 
@@ -729,3 +736,62 @@ class TestInstanceHook(object):
         assert event.handled
         event = instance.hook.fire()
         assert "handled" not in event
+
+    def test_fire_each(self):
+        class HasHook(object):
+            hook = InstanceHook()
+
+        instance = HasHook()
+        other = HasHook()
+        values = []
+
+        @instance.hook
+        def handler(event):
+            assert event.context_value == "context"
+            values.append(event.value)
+
+        @other.hook
+        def other_handler(event):
+            should_never_run()
+
+        instance.hook.fire_each({"context_value": "context"}, "value", [1, 2, 3])
+        assert values == [1, 2, 3]
+
+        instance.hook.fire_each({"context_value": "context"}, "value", [4, 5, 6],
+                                stop=lambda: len(values) >= 5)
+        assert values == [1, 2, 3, 4, 5]
+
+@pytest.fixture
+def debug_mode(monkeypatch):
+    import crow2.util
+    import crow2.events.hook
+    import crow2.events.hooktree
+    for module in (crow2.util, crow2.events.hook, crow2.events.hooktree):
+        monkeypatch.setattr(module, "DEBUG", True)
+
+def test_debug_names(debug_mode):
+    here = __name__ + ".test_debug_names"
+
+    assert repr(HookTree()) == "<HookTree %s.unnamed_HookTree>" % here
+    assert repr(Hook()) == "<Hook %s.unnamed_Hook>" % here
+    assert repr(CancellableHook()) == "<CancellableHook %s.unnamed_CancellableHook>" % here
+
+    multiplexer = HookMultiplexer()
+    assert repr(multiplexer) == "<HookMultiplexer %s.unnamed_HookMultiplexer>" % here
+
+    @multiplexer("child")
+    def handler(event):
+        should_never_run()
+    assert repr(multiplexer._children["child"]) == "<ChildHook %s.unnamed_HookMultiplexer['child']>" % here
+
+    # explicit names still win
+    assert repr(Hook(name="explicit")) == "<Hook explicit>"
+
+def test_debug_instancehook_names(debug_mode):
+    class Target(object):
+        instancehook = InstanceHook(name="instancehook")
+
+    target = Target()
+    target.instancehook.register(lambda event: None)
+    child = Target.instancehook._children[target]
+    assert child._name == "instancehook[Target@%x]" % id(target)
@@ -1,7 +1,14 @@
+import gc
+
 from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
 
 from crow2.events.hook import Hook
-from crow2.events.yielding import yielding
+from crow2.events.hooktree import HookMultiplexer
+from crow2.events import yielding as yielding_module
+from crow2.events.yielding import (yielding, timeout, TimeoutError, outstanding, reclaim,
+        first_of, all_of)
+from crow2.test.util import Counter
 from crow2.util import AttrDict
 
 def test_simple():
@@ -88,3 +95,260 @@ def test_deferred_adaptation():
     newevent = AttrDict()
     event.deferred.callback(newevent)
     assert newevent.handler_called
+
+def test_timeout_expires():
+    clock = Clock()
+    hook1 = Hook()
+    hook2 = Hook()
+    results = []
+
+    @hook1
+    @yielding
+    def handler(event):
+        try:
+            yield timeout(hook2, 30, reactor=clock)
+        except TimeoutError:
+            results.append("timed out")
+        else:
+            results.append("fired")
+
+    hook1.fire()
+    assert len(outstanding()) == 1
+    clock.advance(29)
+    assert results == []
+
+    clock.advance(1)
+    assert results == ["timed out"]
+    assert not outstanding()
+    assert not hook2.registration_groups
+
+    hook2.fire()
+    assert results == ["timed out"]
+
+def test_timeout_fired_in_time():
+    clock = Clock()
+    hook1 = Hook()
+    hook2 = Hook()
+    results = []
+
+    @hook1
+    @yielding
+    def handler(event):
+        try:
+            event = yield timeout(hook2, 30, reactor=clock)
+        except TimeoutError:
+            results.append("timed out")
+        else:
+            results.append(event.value)
+
+    hook1.fire()
+    hook2.fire(value="fired")
+    assert results == ["fired"]
+    assert not clock.getDelayedCalls()
+    assert not outstanding()
+
+    clock.advance(60)
+    assert results == ["fired"]
+
+def test_timeout_partial_and_deferred():
+    clock = Clock()
+    hook1 = Hook()
+    multiplexer = HookMultiplexer()
+    results = []
+
+    @hook1
+    @yielding
+    def handler(event):
+        try:
+            yield timeout(multiplexer("reply"), 10, reactor=clock)
+        except TimeoutError:
+            results.append("partial timed out")
+        try:
+            yield timeout(event.deferred, 10, reactor=clock)
+        except TimeoutError:
+            results.append("deferred timed out")
+
+    deferred = Deferred()
+    hook1.fire(deferred=deferred)
+    clock.advance(10)
+    assert results == ["partial timed out"]
+    assert not multiplexer._children
+
+    clock.advance(10)
+    assert results == ["partial timed out", "deferred timed out"]
+
+    # deferreds can't be unregistered from, but firing it late does nothing
+    deferred.callback(AttrDict())
+    assert results == ["partial timed out", "deferred timed out"]
+
+def test_reclaim(monkeypatch):
+    hook1 = Hook()
+    hook2 = Hook()
+    closed = Counter()
+
+    @hook1
+    @yielding
+    def handler(event):
+        try:
+            yield hook2
+        finally:
+            closed.tick()
+
+    now = [1000.0]
+    monkeypatch.setattr(yielding_module.time, "time", lambda: now[0])
+
+    hook1.fire()
+    now[0] += 50
+    hook1.fire()
+    assert len(outstanding()) == 2
+    assert all(callbacks.waiting_on is hook2 for callbacks in outstanding())
+
+    assert reclaim(max_age=60) == 0
+    now[0] += 20
+    assert reclaim(max_age=60) == 1
+    assert closed.incremented(1)
+    assert len(outstanding()) == 1
+
+    assert reclaim() == 1
+    assert closed.incremented(1)
+    assert not outstanding()
+    assert not hook2.registration_groups
+
+def test_outstanding_forgets_collected():
+    hook1 = Hook()
+
+    @hook1
+    @yielding
+    def handler(event):
+        yield Hook()
+
+    hook1.fire()
+    gc.collect()
+    assert not outstanding()
+
+def test_first_of():
+    hook1 = Hook()
+    hook2 = Hook()
+    multiplexer = HookMultiplexer()
+    results = []
+
+    @hook1
+    @yielding
+    def handler(event):
+        results.append((yield first_of(hook2, multiplexer("reply"), event.deferred)))
+
+    deferred = Deferred()
+    hook1.fire(deferred=deferred)
+    assert len(hook2.registration_groups) == 1
+    assert "reply" in multiplexer._children
+
+    multiplexer.fire(name="reply", value=1)
+    assert len(results) == 1
+    index, event = results[0]
+    assert index == 1
+    assert event.value == 1
+
+    # the losers were unregistered
+    assert not hook2.registration_groups
+    assert not multiplexer._children
+    deferred.callback(AttrDict())
+    assert len(results) == 1
+
+def test_first_of_fired_deferred():
+    hook1 = Hook()
+    hook2 = Hook()
+    results = []
+
+    @hook1
+    @yielding
+    def handler(event):
+        results.append((yield first_of(event.deferred, hook2)))
+
+    deferred = Deferred()
+    deferred.callback("already")
+    hook1.fire(deferred=deferred)
+    assert results == [(0, "already")]
+    assert not hook2.registration_groups
+
+def test_all_of():
+    hook1 = Hook()
+    hook2 = Hook()
+    hook3 = Hook()
+    results = []
+
+    @hook1
+    @yielding
+    def handler(event):
+        events = yield all_of(hook2, hook3(), event.deferred)
+        results.append(events)
+        results.append((yield all_of()))
+
+    deferred = Deferred()
+    hook1.fire(deferred=deferred)
+    hook3.fire(value=3)
+    deferred.callback(AttrDict(value=4))
+    assert results == []
+    hook3.fire(value=5)
+
+    hook2.fire(value=2)
+    assert len(results) == 2
+    assert [event.value for event in results[0]] == [2, 3, 4]
+    assert results[1] == []
+    assert not hook2.registration_groups
+    assert not hook3.registration_groups
+
+def test_combinator_timeout():
+    clock = Clock()
+    hook1 = Hook()
+    hook2 = Hook()
+    hook3 = Hook()
+    results = []
+
+    @hook1
+    @yielding
+    def handler(event):
+        try:
+            yield timeout(all_of(hook2, first_of(hook3, event.deferred)), 5, reactor=clock)
+        except TimeoutError:
+            results.append("timed out")
+
+    deferred = Deferred()
+    hook1.fire(deferred=deferred)
+    hook2.fire()
+    clock.advance(5)
+    assert results == ["timed out"]
+    assert not hook2.registration_groups
+    assert not hook3.registration_groups
+    deferred.callback(None)
+    assert results == ["timed out"]
+    assert repr(first_of(hook2)) == "first_of(%r)" % hook2
+
+def test_once_unregister_keeps_order():
+    hook = Hook()
+    hook1 = Hook()
+    sorts = Counter()
+    original_build = hook._build_call_list
+    def build_call_list(registrations):
+        sorts.tick()
+        return original_build(registrations)
+    hook._build_call_list = build_call_list
+
+    @hook1
+    @yielding
+    def handler(event):
+        yield first_of(hook, Hook())
+
+    @hook
+    def stub(event):
+        pass
+
+    hook.fire()
+    assert sorts.incremented(1)
+
+    hook1.fire()
+    hook.fire()
+    assert sorts.incremented(1)
+
+    # unregistering the one-shot wait didn't throw away the sorted call list
+    hook.fire()
+    assert sorts.incremented(0)
@@ -1,7 +1,9 @@
 import functools
+import time
+import weakref
 
 from twisted.python import log
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import Deferred, TimeoutError
 from zope.interface import Interface, Attribute, implementer
 
 from crow2.util import paramdecorator, DecoratorPartial
@@ -15,7 +17,11 @@ def yielding(func):
     with crow2 goodness
 
     note: if a yielded hook is garbage collected without being fired, then the generator
-    will be lost without continuing
+    will be lost without continuing. To avoid waiting forever, yield timeout(hook, seconds)
+    instead; coroutines which are still waiting can be found with outstanding() and stopped
+    with reclaim().
+
+    To wait on several things at once, yield first_of(...) or all_of(...).
     """
     @functools.wraps(func)
     def proxy(*args, **keywords):
@@ -31,6 +37,12 @@ class IYieldedCallback(Interface):
         register a handler to be called once
         """
 
+class IYieldedCanceller(Interface):
+    def __call__(target):
+        """
+        unregister a handler which was registered by IYieldedCallback but not yet called
+        """
+
 @adapter_for(Deferred, IYieldedCallback)
 def adapt_deferred(deferred):
     return deferred.addCallback
@@ -46,6 +58,186 @@ def adapt_partial_hook(partial):
     partial.func = hook.register_once.im_func
     return partial
 
+@adapter_for(IDecoratorHook, IYieldedCanceller)
+def adapt_hook_canceller(hook):
+    return hook.unregister
+
+@adapter_for(IPartialRegistration, IYieldedCanceller)
+def adapt_partial_canceller(partial):
+    return partial.args[0].unregister
+
+class _Combinator(object):
+    """
+    Base for yieldables which wait on several hooks, partial registrations or deferreds at once
+    """
+    def __init__(self, waitables):
+        self.waitables = tuple(waitables)
+        self._waits = {}
+
+    def register(self, callback):
+        "register callback to be called once, when we're done waiting"
+        wait = _CombinatorWait(callback)
+        self._waits[callback] = wait
+        self._start(wait)
+        for index, waitable in enumerate(self.waitables):
+            if self._waits.get(callback) is not wait:
+                break # finished while registering, such as with an already-fired deferred
+            subcallback = self._make_subcallback(wait, index)
+            wait.pending[index] = (waitable, subcallback)
+            IYieldedCallback(waitable)(subcallback)
+
+    def cancel(self, callback):
+        "unregister everything that callback is still waiting on"
+        wait = self._waits.pop(callback, None)
+        if wait is not None:
+            wait.cancel_pending()
+
+    def _make_subcallback(self, wait, index):
+        "produce a callback for one of our waitables"
+        def subcallback(event):
+            "callback for a single waitable of a combinator"
+            if self._waits.get(wait.callback) is not wait:
+                return # already finished or cancelled; only possible for deferreds
+            wait.pending.pop(index, None)
+            self._received(wait, index, event)
+        return subcallback
+
+    def _finish(self, wait, result):
+        "stop waiting on anything else, and pass result along"
+        del self._waits[wait.callback]
+        wait.cancel_pending()
+        wait.callback(result)
+
+    def __repr__(self):
+        return "%s(%s)" % (self.name, ", ".join(repr(waitable) for waitable in self.waitables))
+
+class _CombinatorWait(object):
+    """
+    State of one registration to a combinator
+    """
+    def __init__(self, callback):
+        self.callback = callback
+        self.pending = {}
+        self.results = None
+        self.remaining = 0
+
+    def cancel_pending(self):
+        "unregister all waits which haven't fired; ones which can't be unregistered are ignored later"
+        pending = self.pending
+        self.pending = {}
+        for waitable, subcallback in pending.values():
+            canceller = IYieldedCanceller(waitable, None)
+            if canceller is not None:
+                canceller(subcallback)
+
+class _FirstOf(_Combinator):
+    """
+    Wait on several things, and continue with (index, event) of the first one to fire
+    """
+    name = "first_of"
+
+    def _start(self, wait):
+        pass
+
+    def _received(self, wait, index, event):
+        self._finish(wait, (index, event))
+
+class _AllOf(_Combinator):
+    """
+    Wait on several things, and continue with a list of all their events once all have fired
+    """
+    name = "all_of"
+
+    def _start(self, wait):
+        wait.results = [None] * len(self.waitables)
+        wait.remaining = len(self.waitables)
+        if not wait.remaining:
+            self._finish(wait, [])
+
+    def _received(self, wait, index, event):
+        wait.results[index] = event
+        wait.remaining -= 1
+        if not wait.remaining:
+            self._finish(wait, wait.results)
+
+def first_of(*waitables):
+    """
+    Yieldable which waits on all of the provided hooks, partial registrations or deferreds, and
+    continues as soon as any of them fires:
+
+    .. python::
+        index, event = yield first_of(conn.received("318"), conn.received("401"))
+
+    The others are unregistered as soon as one fires.
+    """
+    return _FirstOf(waitables)
+
+def all_of(*waitables):
+    """
+    Yieldable which waits until all of the provided hooks, partial registrations or deferreds
+    have fired, and continues with a list of their events in the same order
+    """
+    return _AllOf(waitables)
+
+@adapter_for(_Combinator, IYieldedCallback)
+def adapt_combinator(combinator):
+    return combinator.register
+
+@adapter_for(_Combinator, IYieldedCanceller)
+def adapt_combinator_canceller(combinator):
+    return combinator.cancel
+
+class _Timeout(object):
+    """
+    A yieldable wrapper which gives up waiting on something after a deadline
+    """
+    def __init__(self, waitable, seconds, reactor):
+        self.waitable = waitable
+        self.seconds = seconds
+        self.reactor = reactor
+
+    def __repr__(self):
+        return "timeout(%r, %r)" % (self.waitable, self.seconds)
+
+def timeout(waitable, seconds, reactor=None):
+    """
+    Wrap something yieldable so that a yielding generator gives up on it after some seconds:
+
+    .. python::
+        try:
+            event = yield timeout(hook, 30)
+        except TimeoutError:
+            pass
+
+    When the deadline passes, the wait is unregistered and TimeoutError is raised at the yield.
+    """
+    if reactor is None:
+        from twisted.internet import reactor
+    return _Timeout(waitable, seconds, reactor)
+
+_outstanding = weakref.WeakSet()
+
+def outstanding():
+    """
+    List the yielding generators which are currently waiting for something to happen; a generator
+    drops out of this list when it finishes or when whatever it waits on is garbage collected
+    """
+    return list(_outstanding)
+
+def reclaim(max_age=None):
+    """
+    Stop waiting generators which have been waiting for more than max_age seconds, or all of them
+    if max_age is None. Their waits are unregistered and the generators are closed. Returns the
+    number of generators that were reclaimed.
+    """
+    now = time.time()
+    reclaimed = 0
+    for callbacks in outstanding():
+        if max_age is None or now - callbacks.waiting_since > max_age:
+            callbacks.reclaim()
+            reclaimed += 1
+    return reclaimed
+
 class _IteratorCallbacks(object):
     """
     Bulk of yielding() implementation
@@ -54,22 +246,91 @@ class _IteratorCallbacks(object):
         self.iterator = iterator
         self.factory = factory
         self.call_position = 0
+
+        self.waiting_on = None
+        self.waiting_since = None
+        self._callback = None
+        self._canceller = None
+        self._delayed_call = None
+
         self.next()
 
     def next(self, to_send=None):
         "get the next hook from the iterator and register a one-use callback to it"
+        if to_send == None:
+            self._step(self.iterator.next)
+        else:
+            self._step(self.iterator.send, to_send)
+    send = next
+
+    def throw(self, exception):
+        "raise an exception inside the generator at the point where it is waiting"
+        self._step(self.iterator.throw, exception)
+
+    def _step(self, resume, *args):
+        "resume the generator, and wait on whatever it yields next"
         try:
-            if to_send == None:
-                yielded = self.iterator.next()
-            else:
-                yielded = self.iterator.send(to_send)
+            yielded = resume(*args)
         except StopIteration:
             log.msg("generator stopping")
+            _outstanding.discard(self)
         else:
-            callback = self.make_callback()
-            hook = IYieldedCallback(yielded)
-            hook(callback)
-    send = next
+            self._wait(yielded)
+
+    def _wait(self, yielded):
+        "register a one-use callback to a yielded object, optionally with a deadline"
+        deadline = None
+        if type(yielded) is _Timeout:
+            deadline = yielded
+            yielded = deadline.waitable
+
+        register = IYieldedCallback(yielded)
+        callback = self.make_callback()
+
+        self.waiting_on = yielded
+        self.waiting_since = time.time()
+        self._callback = callback
+        self._canceller = IYieldedCanceller(yielded, None)
+        _outstanding.add(self)
+        if deadline is not None:
+            self._delayed_call = deadline.reactor.callLater(deadline.seconds, self._expire, callback)
+
+        register(callback)
+
+    def _stop_waiting(self):
+        "forget about the current wait; returns the callback that was waiting"
+        callback = self._callback
+        if self._delayed_call is not None and self._delayed_call.active():
+            self._delayed_call.cancel()
+        self._delayed_call = None
+        self._callback = None
+        self.waiting_on = None
+        self.waiting_since = None
+        _outstanding.discard(self)
+        return callback
+
+    def _cancel_wait(self):
+        "unregister the current wait where possible; waits which can't be unregistered become no-ops"
+        canceller = self._canceller
+        callback = self._stop_waiting()
+        self.call_position += 1 # anything that calls the old callback now will be ignored
+        if canceller is not None:
+            canceller(callback)
+
+    def _expire(self, callback):
+        "deadline callback: stop waiting and raise TimeoutError in the generator"
+        if callback is not self._callback: # already called - pragma: no cover
+            return
+        self._delayed_call = None
+        waiting_on = self.waiting_on
+        self._cancel_wait()
+        self.throw(TimeoutError("%r: timed out waiting on %r" % (self, waiting_on)))
+
+    def reclaim(self):
+        "stop waiting and close the generator"
+        if self._callback is not None:
+            self._cancel_wait()
+        self.iterator.close()
 
     def make_callback(self):
         "produce a callback which can only be called once"
@@ -77,9 +338,15 @@ class _IteratorCallbacks(object):
         @functools.wraps(self.factory)
         def callback(event):
             "callback which will check that it's called at the right time"
+            if self.call_position >= next_call_position:
+                return # the wait timed out or was reclaimed
             self.call_position += 1
             assert self.call_position == next_call_position
 
+            self._stop_waiting()
             self.next(event)
         callback.__name__ += "/%d" % next_call_position # pylint: disable=E1101
         return callback
+
+    def __repr__(self):
+        return "<yielding %s/%d>" % (self.factory.__name__, self.call_position)
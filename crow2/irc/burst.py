@@ -0,0 +1,98 @@
+"""
+Collecting NAMES and WHO replies, which come in bursts of thousands of lines after joining big
+channels, so they can be handled once per burst instead of once per line
+"""
+
+from crow2.irc.message import parse, ParseError
+
+#: the numerics that are collected, and the numeric that ends each of them
+collected = {
+    "353": "366", # RPL_NAMREPLY, RPL_ENDOFNAMES
+    "352": "315", # RPL_WHOREPLY, RPL_ENDOFWHO
+    "354": "315", # RPL_WHOSPCRPL (WHOX), RPL_ENDOFWHO
+}
+ends = frozenset(collected.values())
+
+def numeric(line):
+    """
+    the three characters where the command of a raw line would be, after any tags and prefix,
+    without parsing the rest of it; only meaningful if they turn out to be a numeric
+    """
+    start = 0
+    if line.startswith("@"):
+        start = line.find(" ") + 1
+    if line.startswith(":", start):
+        start = line.find(" ", start) + 1
+    if line[start + 3:start + 4] not in (" ", ""):
+        return ""
+    return line[start:start + 3]
+
+#: replies held at most by one connection, and seconds held at most, before giving up on the
+#: end numeric arriving; see BurstCollector
+default_limit = 20000
+default_timeout = 60.0
+
+class BurstCollector(object):
+    """
+    Holds on to the parsed NAMES and WHO replies of a connection until the numeric that ends
+    them arrives. Servers answer one query at a time, so everything collected when an end
+    numeric comes in belongs to it.
+
+    Replies nobody asked for may never be ended, so once limit replies are held, or the oldest
+    for an end numeric has waited timeout seconds by clock, the connection should give_up()
+    on them and handle them as ordinary lines.
+    """
+    def __init__(self, clock, limit=default_limit, timeout=default_timeout):
+        self.clock = clock
+        self.limit = limit
+        self.timeout = timeout
+        self._pending = dict((end, []) for end in ends)
+        self._started = {}
+        self._count = 0
+
+    def add(self, kind, line):
+        "collect line, a kind reply; False if it couldn't be parsed, so wasn't collected"
+        try:
+            message = parse(line)
+        except ParseError:
+            return False
+        pending = self._pending[collected[kind]]
+        if not pending:
+            self._started[collected[kind]] = self.clock.seconds()
+        pending.append(message)
+        self._count += 1
+        return True
+
+    def take(self, end):
+        "the replies collected for the end numeric end, which are forgotten"
+        replies = self._pending[end]
+        if replies:
+            self._pending[end] = []
+            del self._started[end]
+            self._count -= len(replies)
+        return replies
+
+    def pending(self):
+        "how many replies are waiting for their end numeric"
+        return self._count
+
+    def full(self):
+        "whether limit replies are waiting"
+        return self._count >= self.limit
+
+    def overdue(self):
+        "the end numerics whose oldest reply has waited longer than timeout"
+        deadline = self.clock.seconds() - self.timeout
+        return [end for end, started in self._started.items() if started < deadline]
+
+    def give_up(self, ends=None):
+        """
+        forget and return the replies waiting for each of ends (by default all of them), oldest
+        end numeric first
+        """
+        if ends is None:
+            ends = list(self._started)
+        replies = []
+        for end in sorted(ends, key=self._started.get):
+            replies.extend(self.take(end))
+        return replies
@@ -0,0 +1,121 @@
+"""
+Recording the raw lines connections receive, to replay them later (see crow2.irc.replay)
+
+A capture file starts with magic, then holds records: a header (see record_header) of kind,
+time.time(), connection id and payload length, followed by the payload. Lines are LINE records;
+each connection is announced by a CONNECTION record with its name before its first line. Every
+time a file is opened for capturing a SESSION record is appended, after which connection ids
+start over.
+"""
+
+import mmap
+import os
+import struct
+import time
+
+magic = "CROW2CAP\x02"
+record_header = struct.Struct("<BdII")
+LINE, CONNECTION, SESSION = range(3)
+
+class CaptureError(ValueError):
+    "The file is not a capture file"
+
+class Capture(object):
+    """
+    Appends the lines of any number of connections to the capture file at path. Each batch of
+    lines is written with one write and flushed, so a capture survives the bot crashing.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "ab")
+        self._file.seek(0, os.SEEK_END)
+        if not self._file.tell():
+            self._file.write(magic)
+        self._next_id = 0
+        self._write([record_header.pack(SESSION, time.time(), 0, 0)])
+
+    def connection(self, name):
+        "a new connection id, for a connection called name"
+        connection_id = self._next_id
+        self._next_id += 1
+        self._write([record_header.pack(CONNECTION, time.time(), connection_id, len(name)), name])
+        return connection_id
+
+    def write_lines(self, connection_id, lines):
+        "record lines as received all at once, now, by the connection connection_id"
+        now = time.time()
+        pack = record_header.pack
+        data = []
+        for line in lines:
+            data.append(pack(LINE, now, connection_id, len(line)))
+            data.append(line)
+        self._write(data)
+
+    def _write(self, data):
+        self._file.write("".join(data))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class CaptureReader(object):
+    """
+    Reads a capture file through a memory map. Connections are keyed by (session, id); names
+    maps those keys to connection names. A record cut short at the end of the file (eg by a
+    crash while it was written) is ignored.
+    """
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(magic):
+            self._file.close()
+            raise CaptureError("%r is too short to be a capture file" % path)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(magic)] != magic:
+            self.close()
+            raise CaptureError("%r is not a capture file" % path)
+        self.names = {}
+
+    def records(self):
+        "(kind, time, connection key, payload) for each record"
+        data = self._map
+        end = len(data)
+        offset = len(magic)
+        unpack_from = record_header.unpack_from
+        header_size = record_header.size
+        session = -1
+        while offset + header_size <= end:
+            kind, when, connection_id, length = unpack_from(data, offset)
+            offset += header_size
+            if offset + length > end:
+                break
+            payload = data[offset:offset + length]
+            offset += length
+            if kind == SESSION:
+                session += 1
+            key = (session, connection_id)
+            if kind == CONNECTION:
+                self.names[key] = payload
+            yield kind, when, key, payload
+
+    def chunks(self):
+        """
+        (time, connection key, lines) for each batch of lines a connection received at once,
+        in the order they were received
+        """
+        chunk_when = chunk_key = None
+        lines = []
+        for kind, when, key, payload in self.records():
+            if kind != LINE:
+                continue
+            if when != chunk_when or key != chunk_key:
+                if lines:
+                    yield chunk_when, chunk_key, lines
+                chunk_when, chunk_key, lines = when, key, []
+            lines.append(payload)
+        if lines:
+            yield chunk_when, chunk_key, lines
+
+    def close(self):
+        self._map.close()
+        self._file.close()
@@ -0,0 +1,197 @@
+"""
+Starting and restarting many irc connections without connect storms
+"""
+
+import random
+from collections import deque
+
+from twisted.internet.abstract import isIPAddress, isIPv6Address
+from twisted.internet.defer import Deferred, succeed
+from twisted.python.failure import Failure
+
+from crow2 import log
+
+class DNSCache(object):
+    """
+    Resolves hostnames with reactor.resolve, remembering each answer for ttl seconds. Lookups
+    of a name that's already being resolved wait for that lookup instead of starting another,
+    so a few hundred connections to the same network cost one lookup. Failures aren't cached.
+    """
+    def __init__(self, reactor, ttl=300):
+        self.reactor = reactor
+        self.ttl = ttl
+        self._cache = {}
+        self._waiting = {}
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, host):
+        "a Deferred firing with the address of host"
+        if isIPAddress(host) or isIPv6Address(host):
+            return succeed(host)
+        cached = self._cache.get(host)
+        if cached is not None and cached[1] > self.reactor.seconds():
+            self.hits += 1
+            return succeed(cached[0])
+
+        result = Deferred()
+        waiting = self._waiting.get(host)
+        if waiting is None:
+            self.misses += 1
+            # the lookup may fire straight away (eg from a hosts file), so wait for it first
+            self._waiting[host] = [result]
+            self.reactor.resolve(host).addBoth(self._resolved, host)
+        else:
+            self.hits += 1
+            waiting.append(result)
+        return result
+
+    def _resolved(self, result, host):
+        waiting = self._waiting.pop(host)
+        if isinstance(result, Failure):
+            for deferred in waiting:
+                deferred.errback(result)
+        else:
+            self._cache[host] = (result, self.reactor.seconds() + self.ttl)
+            for deferred in waiting:
+                deferred.callback(result)
+
+class ConnectionManager(object):
+    """
+    Connects servers (see crow2.irc.main.Server) a few at a time: at most max_connecting are
+    resolving or connecting at once, and connects start at least stagger seconds apart.
+
+    When a connection fails or is lost, the server is queued again after a jittered exponential
+    backoff: initial_delay * factor ** (failures in a row), capped at max_delay, and then
+    shortened by a random fraction of up to jitter, so servers that dropped together (eg in a
+    netsplit) don't all come back at the same moment.
+    """
+    states = ("waiting", "resolving", "connecting", "connected", "backoff")
+
+    def __init__(self, reactor, max_connecting=10, stagger=0.2, initial_delay=1.0,
+            max_delay=300.0, factor=2.0, jitter=0.5, dns_ttl=300, random=random.random):
+        self.reactor = reactor
+        self.max_connecting = max_connecting
+        self.stagger = stagger
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.random = random
+        self.dns = DNSCache(reactor, dns_ttl)
+
+        self.state = {}
+        self._failures = {}
+        self._retries = {}
+        self._pending = deque()
+        self._in_flight = 0
+        self._next_start = 0
+        self._pump_call = None
+        self._pumping = False
+
+    def add(self, server):
+        "start connecting server as soon as there's room"
+        server.manager = self
+        self._queue(server)
+
+    def remove(self, server):
+        "stop connecting and reconnecting server; a connection it already has is left alone"
+        self._done_connecting(server)
+        retry = self._retries.pop(server, None)
+        if retry is not None:
+            retry.cancel()
+        if server in self._pending:
+            self._pending.remove(server)
+        self.state.pop(server, None)
+        self._failures.pop(server, None)
+
+    def counts(self):
+        "the number of servers in each state"
+        counts = dict.fromkeys(self.states, 0)
+        for state in self.state.itervalues():
+            counts[state] += 1
+        return counts
+
+    def report(self):
+        counts = self.counts()
+        return "irc connections: " + ", ".join("%d %s" % (counts[state], state)
+                for state in self.states)
+
+    def _queue(self, server):
+        self.state[server] = "waiting"
+        self._pending.append(server)
+        if self._pump_call is None:
+            self._pump()
+
+    def _pump(self):
+        if self._pumping:
+            # a connect that failed straight away, from within _start; the loop carries on
+            return
+        self._pump_call = None
+        self._pumping = True
+        try:
+            while self._pending and self._in_flight < self.max_connecting:
+                now = self.reactor.seconds()
+                if now < self._next_start:
+                    self._pump_call = self.reactor.callLater(self._next_start - now, self._pump)
+                    return
+                self._next_start = now + self.stagger
+                self._start(self._pending.popleft())
+        finally:
+            self._pumping = False
+
+    def _start(self, server):
+        self.state[server] = "resolving"
+        self._in_flight += 1
+        deferred = self.dns.resolve(server.address)
+        deferred.addCallbacks(self._resolved, self._resolve_failed,
+                callbackArgs=(server,), errbackArgs=(server,))
+
+    def _resolved(self, address, server):
+        if self.state.get(server) != "resolving":
+            return # removed while it was being resolved
+        self.state[server] = "connecting"
+        server.connect(address)
+
+    def _resolve_failed(self, failure, server):
+        if self.state.get(server) != "resolving":
+            return
+        log.msg("Couldn't resolve %r for irc connection %r: %s"
+                % (server.address, server.name, failure.getErrorMessage()))
+        self.failed(server, failure)
+
+    def _done_connecting(self, server):
+        if self.state.get(server) in ("resolving", "connecting"):
+            self._in_flight -= 1
+            if self._pump_call is None:
+                self._pump()
+
+    def connected(self, server):
+        "called by the server's factory once the connection is made"
+        self._done_connecting(server)
+        self.state[server] = "connected"
+        self._failures.pop(server, None)
+        log.msg(self.report())
+
+    def failed(self, server, reason):
+        "called by the server's factory when a connection attempt fails"
+        self._done_connecting(server)
+        self._backoff(server)
+        log.msg(self.report())
+
+    def lost(self, server, reason):
+        "called by the server's factory when an established connection is lost"
+        self._backoff(server)
+        log.msg(self.report())
+
+    def _backoff(self, server):
+        failures = self._failures.get(server, 0)
+        self._failures[server] = failures + 1
+        delay = min(self.max_delay, self.initial_delay * self.factor ** failures)
+        delay *= 1 - self.jitter * self.random()
+        self.state[server] = "backoff"
+        self._retries[server] = self.reactor.callLater(delay, self._retry, server)
+
+    def _retry(self, server):
+        del self._retries[server]
+        self._queue(server)
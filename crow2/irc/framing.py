@@ -0,0 +1,70 @@
+"""
+Line framing for IRC connections
+"""
+
+from itertools import imap
+
+from twisted.internet.protocol import Protocol
+
+class BufferedLineReceiver(Protocol):
+    """
+    Splits incoming data into lines, like twisted's LineOnlyReceiver, but hands every complete
+    line of a chunk of data to linesReceived() in one call. Partial lines are kept in a
+    bytearray instead of rebuilding a string for each line, and a chunk is split with a single
+    rfind and split, so a large burst costs a few operations per chunk rather than several per
+    line.
+
+    A line (or unfinished line) longer than max_line_length bytes calls lineLengthExceeded().
+    As with LineOnlyReceiver, the lines before it are delivered first, unless that made the
+    connection start disconnecting, and the lines after it are dropped.
+    """
+    delimiter = "\r\n"
+    max_line_length = 16384
+
+    def __init__(self, delimiter=None, max_line_length=None):
+        if delimiter is not None:
+            self.delimiter = delimiter
+        if max_line_length is not None:
+            self.max_line_length = max_line_length
+        self._buffer = bytearray()
+
+    def dataReceived(self, data):
+        delimiter = self.delimiter
+        buffer = self._buffer
+        if buffer:
+            buffer.extend(data)
+            data = buffer
+        end = data.rfind(delimiter)
+        if end == -1:
+            if not buffer:
+                buffer.extend(data)
+            if len(buffer) > self.max_line_length:
+                return self.lineLengthExceeded(str(buffer))
+            return
+
+        lines = str(data[:end]).split(delimiter)
+        rest = data[end + len(delimiter):]
+        if buffer:
+            del buffer[:]
+        buffer.extend(rest)
+
+        max_line_length = self.max_line_length
+        too_long = None
+        if end > max_line_length and max(imap(len, lines)) > max_line_length:
+            index = next(index for index, line in enumerate(lines) if len(line) > max_line_length)
+            too_long = lines[index]
+            lines = lines[:index]
+        elif len(buffer) > max_line_length:
+            too_long = str(buffer)
+        if lines:
+            self.linesReceived(lines)
+        if too_long is not None and not getattr(self.transport, "disconnecting", False):
+            return self.lineLengthExceeded(too_long)
+
+    def linesReceived(self, lines):
+        "override this to handle the lines from a chunk of data"
+        raise NotImplementedError
+
+    def lineLengthExceeded(self, line):
+        "called with a line that is too long; drops the connection by default"
+        return self.transport.loseConnection()
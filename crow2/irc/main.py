@@ -1,10 +1,15 @@
 from twisted.internet.protocol import Protocol, ReconnectingClientFactory
-from twisted.protocols.basic import LineOnlyReceiver
 
 from crow2 import hook, log
+from crow2.irc.framing import BufferedLineReceiver
+from crow2.irc import burst, sendqueue
+from crow2.irc.capture import Capture
+from crow2.irc.connections import ConnectionManager
+from crow2.irc.state import NetworkState
 from crow2.lib import config
 from crow2.events.hook import Hook
 from crow2.events.hooktree import InstanceHook, HookMultiplexer, CommandHook
+from crow2.events.exceptions import NotRegisteredError
 
 example_connection = {
     "server": "irc.example.net",
@@ -20,7 +25,21 @@ hook.connection.addhook("made", Hook())
 class ProtocolMultiplexer(HookMultiplexer):
     def __init__(self):
         super(ProtocolMultiplexer, self).__init__(preparer=Hook(),
-                hook_class=CommandHook, raise_on_noname=False, childarg="command")
+                hook_class=CommandHook, raise_on_noname=False, raise_on_missing=False,
+                childarg="command")
+
+    def fire(self, *contexts, **keywords):
+        # HookMultiplexer.fire, specialized for the one path every irc line takes: most lines
+        # (numerics, during joins and WHO/NAMES bursts) have no handlers, so those return right
+        # after the preparer, without a KeyError being raised and caught or a child event built
+        keywords["multiplexer"] = self
+        event = self.preparer.fire(*contexts, **keywords)
+        if getattr(event, "cancelled", False):
+            return event
+        command = self._children.get(event.get("command"))
+        if command is None:
+            return event
+        return command.fire(event)
 
     def _get_or_create_child(self, handler, name):
         if not name:
@@ -38,35 +57,142 @@ class ProtocolMultiplexer(HookMultiplexer):
         super(ProtocolMultiplexer, self).unregister(handler, registrations)
 
 
-class TwistedConnection(LineOnlyReceiver):
+class TwistedConnection(BufferedLineReceiver):
     disconnect = hook.connection.addhook("disconnect", InstanceHook())
     received = hook.connection.addhook("received", InstanceHook(hook_class=ProtocolMultiplexer))
     sent = hook.connection.addhook("sent", InstanceHook(hook_class=ProtocolMultiplexer))
 
     def __init__(self, server):
+        BufferedLineReceiver.__init__(self, server.delimiter,
+                getattr(server, "max_line_length", None))
         self.server = server
-        self.delimiter = server.delimiter
         self.context = {"conn": self, "server": server}
+        self.state = NetworkState()
+        self.burst = burst.BurstCollector(server.reactor)
+        self.sendqueue = sendqueue.SendQueue(self._write_lines, server.reactor, server.flood_burst,
+                server.flood_rate, server.send_queue_limit)
+        self.capture = server.capture
+        if self.capture is not None:
+            self._capture_id = self.capture.connection(server.name)
 
     def connectionMade(self):
         hook.connection.made.fire(self.context)
 
     def connectionLost(self, reason):
+        self.sendqueue.clear()
         self.disconnect.fire(self.context, reason=reason)
 
+    def send(self, line, priority=None):
+        """
+        Queue a line (without its delimiter) to be sent to the server, subject to flood
+        control; see crow2.irc.sendqueue. Lines queued in the same reactor tick are written
+        together, and connection.sent fires for each of them once they're written.
+        """
+        self.sendqueue.send(line, priority)
+
+    def _write_lines(self, lines):
+        if self.transport is None or self.transport.disconnecting:
+            self.sendqueue.dropped += len(lines)
+            return
+        delimiter = self.delimiter
+        self.transport.write(delimiter.join(lines) + delimiter)
+        self.sent.fire_each(self.context, "line", lines)
+
     def lineReceived(self, line):
+        if self.capture is not None:
+            self.capture.write_lines(self._capture_id, [line])
         self.received.fire(self.context, line=line)
 
+    def linesReceived(self, lines):
+        """
+        Fire the received hook for each line, except NAMES and WHO replies: those are collected
+        until their end numeric (366 or 315), which is fired with the parsed replies as
+        event.replies; see crow2.irc.burst. Replies that pile up or wait too long for their
+        end numeric are fired as ordinary lines instead.
+        """
+        if self.capture is not None:
+            self.capture.write_lines(self._capture_id, lines)
+        collector = self.burst
+        if collector.pending():
+            overdue = collector.overdue()
+            if overdue and not self._fire_lines([reply.line for reply in collector.give_up(overdue)]):
+                return
+        run = []
+        for line in lines:
+            kind = burst.numeric(line)
+            if kind in burst.collected:
+                if collector.add(kind, line):
+                    if collector.full():
+                        if not self._fire_lines(run + [reply.line for reply in collector.give_up()]):
+                            return
+                        run = []
+                    continue
+            elif kind in burst.ends:
+                if not self._fire_lines(run):
+                    return
+                run = []
+                self.received.fire(self.context, line=line, replies=collector.take(kind))
+                continue
+            run.append(line)
+        self._fire_lines(run)
+
+    def _fire_lines(self, lines):
+        "fire the received hook for each of lines; False if the connection is going away"
+        if self._stop_receiving():
+            return False
+        if lines:
+            self.received.fire_each(self.context, "line", lines, self._stop_receiving)
+        return True
+
+    def _stop_receiving(self):
+        # like LineOnlyReceiver, stop handing out lines once a handler has dropped the connection
+        return self.transport is not None and self.transport.disconnecting
+
 class ConnectionFactory(ReconnectingClientFactory):
+    """
+    Reconnects on its own unless the server belongs to a ConnectionManager, which then decides
+    when to retry. Either way, stopTrying() stops it reconnecting.
+    """
     def __init__(self, server):
         self.server = server
 
+    def _managed(self):
+        "whether the server's ConnectionManager should hear about this connection"
+        manager = self.server.manager
+        if manager is not None and not self.continueTrying:
+            manager.remove(self.server) # stopTrying() was called, or continueTrying cleared
+            return False
+        return manager is not None
+
+    def stopTrying(self):
+        ReconnectingClientFactory.stopTrying(self)
+        if self.server.manager is not None:
+            self.server.manager.remove(self.server)
+
     def buildProtocol(self, addr):
         log.msg("Connected to irc server %r" % addr)
+        continue_trying = self.continueTrying
         self.resetDelay()
+        self.continueTrying = continue_trying # resetDelay would undo stopTrying()
+        if self._managed():
+            self.server.manager.connected(self.server)
         self.server._reactor_connection = TwistedConnection(self.server)
         return self.server._reactor_connection
 
+    def clientConnectionFailed(self, connector, reason):
+        if not self._managed():
+            return ReconnectingClientFactory.clientConnectionFailed(self, connector, reason)
+        log.msg("Connecting to irc server %r failed: %s"
+                % (self.server.name, reason.getErrorMessage()))
+        self.server.manager.failed(self.server, reason)
+
+    def clientConnectionLost(self, connector, reason):
+        if not self._managed():
+            return ReconnectingClientFactory.clientConnectionLost(self, connector, reason)
+        log.msg("Lost connection to irc server %r: %s"
+                % (self.server.name, reason.getErrorMessage()))
+        self.server.manager.lost(self.server, reason)
+
 class Server(object):
     def __init__(self, reactor, name, options):
         self.name = name
@@ -77,13 +203,22 @@ class Server(object):
         self.realname = options.get("realname", self.user)
         self.channels = options["channels"]
         self.delimiter = options.get("newline", "\r\n")
+        self.max_line_length = options.get("max_line_length", BufferedLineReceiver.max_line_length)
+        self.flood_burst = options.get("flood_burst", sendqueue.default_burst)
+        self.flood_rate = options.get("flood_rate", sendqueue.default_rate)
+        self.send_queue_limit = options.get("send_queue_limit", sendqueue.default_limit)
 
         self._reactor_connection = None
+        self.manager = None
+        self.capture = None
         self.reactor = reactor
         self.factory = ConnectionFactory(self)
 
-    def connect(self):
-        self.reactor.connectTCP(self.address, self.port, self.factory)
+    def connect(self, address=None):
+        "connect now, to address if given (eg already resolved) rather than self.address"
+        if address is None:
+            address = self.address
+        self.reactor.connectTCP(address, self.port, self.factory)
 
 @hook.config.new
 def defaultconfig(event):
@@ -105,14 +240,21 @@ def init(event):
     import sys
     log.startLogging(sys.stdout, setStdout=False)
 
+    if event.config.connections.get("example") == example_connection:
+        raise UnconfiguredError("Please configure your irc bot before starting it "
+                        "(ie, replace the example connection)")
+
+    manager = ConnectionManager(event.reactor, **event.config.get("connection_manager", {}))
+    event.connection_manager = manager
+    capture = None
+    if event.config.get("capture"):
+        # record everything received, for crow2.irc.replay
+        capture = Capture(event.config.capture)
     for conn_name in event.config.connections:
         conn_options = event.config.connections[conn_name]
-        if conn_name == "example" and conn_options == example_connection:
-            raise UnconfiguredError("Please configure your irc bot before starting it "
-                            "(ie, replace the example connection)")
-
         server = Server(event.reactor, conn_name, conn_options)
-        server.connect()
+        server.capture = capture
+        manager.add(server)
 
 @hook.mainloop
 def mainloop(event):
@@ -0,0 +1,191 @@
+"""
+IRC message parsing (RFC 1459, plus the IRCv3 message tags prefix)
+"""
+
+from collections import Mapping
+
+class ParseError(ValueError):
+    "The line is not an IRC message"
+
+_escapes = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+
+def unescape_tag_value(value):
+    "decode the escapes of an IRCv3 tag value"
+    if "\\" not in value:
+        return value
+    result = []
+    pieces = iter(value.split("\\"))
+    result.append(next(pieces))
+    for piece in pieces:
+        if not piece:
+            # an escaped backslash splits into an empty piece; a lone trailing backslash is dropped
+            try:
+                result.append("\\" + next(pieces))
+            except StopIteration:
+                pass
+            continue
+        result.append(_escapes.get(piece[0], piece[0]))
+        result.append(piece[1:])
+    return "".join(result)
+
+_missing = object() # the tag isn't there
+_unknown = object() # we haven't looked yet
+
+class Tags(Mapping):
+    """
+    The IRCv3 tags of a message, found in the raw tag string and unescaped only when asked
+    for. A tag without a value has the value "". If a key appears more than once, the last one
+    counts.
+    """
+    __slots__ = ("raw", "_cache", "_complete")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._cache = {}
+        self._complete = False
+
+    def _find(self, key):
+        if not key:
+            return _missing # there are no empty keys, and looking for "" finds it everywhere
+        raw = self.raw
+        end = len(raw)
+        while end >= 0: # a negative end would count from the end of raw, and never finish
+            start = raw.rfind(key, 0, end)
+            if start == -1:
+                return _missing
+            after = start + len(key)
+            if (start == 0 or raw[start - 1] == ";") and (after == len(raw) or raw[after] in "=;"):
+                if after == len(raw) or raw[after] == ";":
+                    return ""
+                value_end = raw.find(";", after)
+                if value_end == -1:
+                    value_end = len(raw)
+                return unescape_tag_value(raw[after + 1:value_end])
+            end = start + len(key) - 1
+        return _missing
+
+    def __getitem__(self, key):
+        value = self._cache.get(key, _unknown)
+        if value is _unknown:
+            if self._complete:
+                raise KeyError(key)
+            value = self._cache[key] = self._find(key)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def _parse_all(self):
+        if self._complete:
+            return
+        cache = {}
+        for tag in self.raw.split(";"):
+            key, equals, value = tag.partition("=")
+            if key:
+                cache[key] = unescape_tag_value(value)
+        self._cache = cache
+        self._complete = True
+
+    def __iter__(self):
+        self._parse_all()
+        return iter(self._cache)
+
+    def __len__(self):
+        self._parse_all()
+        return len(self._cache)
+
+    def __repr__(self):
+        return "<Tags %r>" % self.raw
+
+class Message(object):
+    """
+    A parsed IRC line. params holds the middle parameters followed by the trailing one, if there
+    was one; the prefix is only split into nick, user and host when one of them is asked for, and
+    tags are only decoded as they're looked up (see Tags).
+    """
+    __slots__ = ("line", "raw_tags", "prefix", "command", "params", "_source", "_tags")
+
+    def __init__(self, line, raw_tags, prefix, command, params):
+        self.line = line
+        self.raw_tags = raw_tags
+        self.prefix = prefix
+        self.command = command
+        self.params = params
+        self._source = None
+        self._tags = None
+
+    @property
+    def tags(self):
+        tags = self._tags
+        if tags is None:
+            tags = self._tags = Tags(self.raw_tags or "")
+        return tags
+
+    def _split_prefix(self):
+        prefix = self.prefix
+        if prefix is None:
+            source = (None, None, None)
+        else:
+            rest, at, host = prefix.partition("@")
+            nick, bang, user = rest.partition("!")
+            source = (nick, user if bang else None, host if at else None)
+        self._source = source
+        return source
+
+    @property
+    def nick(self):
+        "the nick (or server name) from the prefix, or None if there was no prefix"
+        return (self._source or self._split_prefix())[0]
+
+    @property
+    def user(self):
+        return (self._source or self._split_prefix())[1]
+
+    @property
+    def host(self):
+        return (self._source or self._split_prefix())[2]
+
+    def __eq__(self, other):
+        if not isinstance(other, Message):
+            return NotImplemented
+        return (self.raw_tags, self.prefix, self.command, self.params) == (
+                other.raw_tags, other.prefix, other.command, other.params)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return "<Message %r>" % self.line
+
+def parse(line):
+    """
+    Parse a line (without its line ending) into a Message, in one pass of partition and split
+    """
+    rest = line
+    raw_tags = prefix = None
+    if rest[:1] == "@":
+        raw_tags, space, rest = rest[1:].partition(" ")
+        rest = rest.lstrip(" ")
+    if rest[:1] == ":":
+        prefix, space, rest = rest[1:].partition(" ")
+        rest = rest.lstrip(" ")
+
+    if rest[:1] == ":": # no command, only a trailing parameter
+        raise ParseError("no command in %r" % line)
+    middle, colon, trailing = rest.partition(" :")
+    params = middle.split()
+    if not params:
+        raise ParseError("no command in %r" % line)
+    command = params.pop(0).upper()
+    if colon:
+        params.append(trailing)
+    return Message(line, raw_tags, prefix, command, params)
@@ -2,41 +2,12 @@ from crow2.irc import main
 from crow2 import hook, log
 
 from crow2.events.handlerclass import handlerclass, instancehandler
-
-import re
-
-# TODO: rewrite back to using re_gen; re_gen needs work first
-space = r"\ +"
-prefix = """
-    (?P<prefix>
-        {servername} | {nick} (?:!{user})? (?:@{host})?
-    )
-"""
-
-message = re.compile("""
-    ^
-    (?:
-        :{prefix}{space}
-    )?
-    (?P<command>
-        [a-zA-Z]+ | [0-9]{3}
-    )
-    (?P<params>
-        {space}.+
-    )
-    $
-""".format(prefix=prefix, space=space), flags=re.VERBOSE)
-
-params = re.compile("""
-    (?:
-        [^:]
-    )
-""".format(), flags=re.VERBOSE)
+from crow2.irc.message import parse, ParseError
 
 @handlerclass(hook.connection.made)
 class IRCProtocol(object):
     def __init__(self, event):
-        pass
+        self.state = event.conn.state
 
     @instancehandler.conn.disconnect
     def disconnected(self, event):
@@ -44,15 +15,26 @@ class IRCProtocol(object):
 
     @instancehandler.conn.received.preparer
     def line_received(self, event):
-        if not len(event.message):
-            event.cancel()
-            return
-        
-        event.command = "derp"
-
-    @instancehandler.conn.received(name="derp")
-    def derp_received(self, event):
-        pass
+        if self._parse(event):
+            # before any command handlers run, so they see the state as of this line
+            replies = event.get("replies")
+            if replies is not None:
+                self.state.handle_burst(event.message, replies)
+            self.state.handle(event.message)
+
+    @instancehandler.conn.sent.preparer
+    def line_sent(self, event):
+        self._parse(event)
+
+    def _parse(self, event):
+        try:
+            event.message = parse(event.line)
+        except ParseError:
+            log.msg("WARNING: unparseable irc line: %r" % event.line)
+            event.cancelled = True
+            return False
+        event.command = event.message.command
+        return True
 
 @hook.connection.received.preparer
 def irc_log(event):
@@ -0,0 +1,161 @@
+"""
+Replaying a capture (see crow2.irc.capture) through connection.received, without sockets,
+either as fast as possible or at the pace it was recorded, and reporting where the time went
+
+    python -m crow2.irc.replay CAPTURE [PLUGIN ...] [--paced] [--speed N] [--top N]
+"""
+
+import time
+
+from twisted.internet.error import ConnectionDone
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+
+from crow2.events import hook as hook_module
+from crow2.irc.capture import CaptureReader
+
+class NullTransport(object):
+    "stands in for a connection's socket; everything written to it is counted and dropped"
+    disconnecting = False
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+
+    def writeSequence(self, data):
+        self.written += sum(len(item) for item in data)
+
+    def loseConnection(self):
+        self.disconnecting = True
+
+def describe(handler):
+    "module.name of a handler, looking through the method and class wrappers hooks keep"
+    target = getattr(handler, "methodfunc", handler)
+    target = getattr(target, "clazz", target)
+    name = getattr(target, "__name__", None) or repr(target)
+    module = getattr(target, "__module__", None)
+    if module:
+        return "%s.%s" % (module, name)
+    return name
+
+class HandlerTimes(object):
+    "Counts the calls and total time of every handler called between start() and stop()"
+    def __init__(self):
+        self.handlers = {}
+
+    def start(self):
+        hook_module.handler_timer = self.called
+
+    def stop(self):
+        if hook_module.handler_timer == self.called:
+            hook_module.handler_timer = None
+
+    def called(self, handler, seconds):
+        name = describe(handler)
+        count, total = self.handlers.get(name, (0, 0.0))
+        self.handlers[name] = (count + 1, total + seconds)
+
+    def slowest(self, top=None):
+        "(name, calls, total seconds) for the handlers that took longest in total"
+        result = sorted(((name, count, total) for name, (count, total) in self.handlers.items()),
+                key=lambda item: -item[2])
+        return result[:top]
+
+class ReplayResult(object):
+    def __init__(self, lines, connections, elapsed, times):
+        self.lines = lines
+        self.connections = connections
+        self.elapsed = elapsed
+        self.times = times
+
+    def format(self, top=20):
+        "the report as a human-readable table, handlers slowest first"
+        slowest = self.times.slowest(top)
+        width = max([40] + [len(name) for name, count, total in slowest])
+        rate = self.lines / self.elapsed if self.elapsed else 0
+        lines = ["replayed %d lines on %d connections in %.2fs (%.0f lines/s)"
+                 % (self.lines, self.connections, self.elapsed, rate),
+                 "%-*s %10s %10s %10s" % (width, "handler", "total", "calls", "per call")]
+        for name, count, total in slowest:
+            lines.append("%-*s %8.2fms %10d %8.2fus" % (width, name, total * 1000, count,
+                    total * 1e6 / count))
+        return "\n".join(lines)
+
+def default_connect(clock, name):
+    "a TwistedConnection for a connection called name, set up as crow2.irc.main would"
+    from crow2.irc.main import Server
+    server = Server(clock, name, {"server": name, "nick": "crow2", "channels": [],
+                                  "flood_rate": None})
+    connection = server.factory.buildProtocol(None)
+    connection.makeConnection(NullTransport())
+    return connection
+
+def replay(reader, connect=default_connect, paced=False, speed=1.0, sleep=time.sleep):
+    """
+    Feed every batch of lines in reader, a CaptureReader, to linesReceived of a connection made
+    by connect(clock, name) for each captured connection, timing every handler called. The
+    clock is a twisted Clock, advanced to the capture's time before each batch. If paced,
+    batches are fed at the pace they were received, sped up by speed.
+    """
+    clock = Clock()
+    connections = {}
+    times = HandlerTimes()
+    lines = 0
+    first = None
+    times.start()
+    started = time.time()
+    try:
+        for when, key, batch in reader.chunks():
+            if first is None:
+                first = when
+            offset = when - first
+            if offset > clock.seconds():
+                clock.advance(offset - clock.seconds())
+            if paced:
+                delay = offset / speed - (time.time() - started)
+                if delay > 0:
+                    sleep(delay)
+            connection = connections.get(key)
+            if connection is None:
+                name = reader.names.get(key, "%d-%d" % key)
+                connection = connections[key] = connect(clock, name)
+            connection.linesReceived(batch)
+            lines += len(batch)
+        for connection in connections.values():
+            connection.connectionLost(Failure(ConnectionDone()))
+    finally:
+        elapsed = time.time() - started
+        times.stop()
+    return ReplayResult(lines, len(connections), elapsed, times)
+
+def main(sysargs=None):
+    import argparse
+    from crow2 import hook
+    from crow2.main import Main
+
+    parser = argparse.ArgumentParser(description="replay a crow2.irc capture through the hooks")
+    parser.add_argument("capture", help="capture file, as written with the capture config option")
+    parser.add_argument("plugins", nargs="*", default=["crow2.irc"],
+            help="plugin package-modules to load (default: crow2.irc)")
+    parser.add_argument("--paced", action="store_true",
+            help="replay at the pace the lines were received, rather than as fast as possible")
+    parser.add_argument("--speed", type=float, default=1.0,
+            help="with --paced, how many times faster than received to replay")
+    parser.add_argument("--top", type=int, default=20, help="how many handlers to report")
+    args = parser.parse_args(sysargs)
+
+    # load plugins the way crow2.main does, but don't fire init: nothing should connect
+    Main(hook, args.plugins[0], args.plugins[1:])
+    hook._unlazy()
+
+    reader = CaptureReader(args.capture)
+    try:
+        result = replay(reader, paced=args.paced, speed=args.speed)
+    finally:
+        reader.close()
+    print result.format(args.top)
+
+if __name__ == "__main__":
+    main()
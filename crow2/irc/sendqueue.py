@@ -0,0 +1,132 @@
+"""
+Outbound flood control for IRC connections
+"""
+
+from collections import deque
+
+#: lower numbers go out first; commands that aren't listed get default_priority
+default_priorities = {
+    "PONG": 0,
+    "PING": 0,
+    "QUIT": 0,
+}
+default_priority = 1
+
+default_burst = 5
+default_rate = 0.5 # most ircds add about two seconds of penalty per line
+default_limit = 1000
+
+def _command(line):
+    "the command of an outgoing line, skipping any tags and prefix"
+    if line.startswith("@"):
+        line = line.partition(" ")[2]
+    if line.startswith(":"):
+        line = line.partition(" ")[2]
+    return line.partition(" ")[0].upper()
+
+class SendQueue(object):
+    """
+    Queues outgoing lines and hands them to write() in batches, at most once per reactor
+    tick, throttled by a token bucket: up to burst lines can go out at once, and after that
+    rate lines per second. With rate None, lines are never held back; they're only coalesced.
+
+    Lines are sent in order of priority (lower first, see default_priorities), and in the order
+    they were queued within a priority. Once limit lines are waiting, queueing another drops
+    the newest line of the lowest priority, which may be the new line itself; with limit None,
+    nothing is dropped.
+
+    Priorities run from 0 to the highest in priorities (or default_priority, if that's higher);
+    anything else is a ValueError, as is a limit below 1.
+    """
+    def __init__(self, write, clock, burst=default_burst, rate=default_rate, limit=default_limit,
+            priorities=None):
+        self.write = write
+        self.clock = clock
+        self.burst = burst
+        self.rate = rate
+        if limit is not None and limit < 1:
+            raise ValueError("send queue limit must be at least 1, or None for no limit: %r" % (limit,))
+        self.limit = limit
+        if priorities is None:
+            priorities = default_priorities
+        if any(priority < 0 for priority in priorities.values()):
+            raise ValueError("priorities can't be negative: %r" % (priorities,))
+        self.priorities = priorities
+        levels = max(priorities.values() + [default_priority]) + 1
+        self._queues = [deque() for level in range(levels)]
+
+        self.tokens = float(self.burst)
+        self._updated = clock.seconds()
+        self._flush_call = None
+
+        self.depth = 0
+        self.sent = 0
+        self.writes = 0
+        self.dropped = 0
+
+    def send(self, line, priority=None):
+        "queue a line (without its delimiter) to be written on a later reactor tick"
+        if priority is None:
+            priority = self.priorities.get(_command(line), default_priority)
+        elif not 0 <= priority < len(self._queues):
+            raise ValueError("priority must be from 0 to %d: %r" % (len(self._queues) - 1, priority))
+        queue = self._queues[priority]
+        if self.limit is not None and self.depth >= self.limit:
+            lowest = max(level for level, waiting in enumerate(self._queues) if waiting)
+            self.dropped += 1
+            if lowest <= priority:
+                return
+            self._queues[lowest].pop()
+        else:
+            self.depth += 1
+        queue.append(line)
+        if self._flush_call is None:
+            self._schedule(0)
+
+    def _schedule(self, delay):
+        self._flush_call = self.clock.callLater(delay, self.flush)
+
+    def _refill(self):
+        now = self.clock.seconds()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def flush(self):
+        "write out as many queued lines as the token bucket allows, in one call to write()"
+        self._flush_call = None
+        if not self.depth:
+            return
+
+        if self.rate is None:
+            count = self.depth
+        else:
+            self._refill()
+            count = min(int(self.tokens), self.depth)
+            self.tokens -= count
+
+        lines = []
+        for queue in self._queues:
+            while queue and len(lines) < count:
+                lines.append(queue.popleft())
+        self.depth -= count
+
+        if self.depth:
+            self._schedule((1 - self.tokens) / self.rate)
+        if lines:
+            self.sent += count
+            self.writes += 1
+            self.write(lines)
+
+    def depths(self):
+        "the number of waiting lines at each priority"
+        return [len(queue) for queue in self._queues]
+
+    def clear(self):
+        "drop everything that's waiting, eg because the connection was lost"
+        if self._flush_call is not None:
+            self._flush_call.cancel()
+            self._flush_call = None
+        self.dropped += self.depth
+        self.depth = 0
+        for queue in self._queues:
+            queue.clear()
@@ -0,0 +1,458 @@
+"""
+What a connection knows about the channels it's in and the users in them
+"""
+
+import string
+
+_upper = string.ascii_uppercase
+_lower = string.ascii_lowercase
+
+#: translation tables folding names to lowercase, by ISUPPORT CASEMAPPING value
+casemappings = {
+    "ascii": string.maketrans(_upper, _lower),
+    "rfc1459": string.maketrans(_upper + "[]\\~", _lower + "{}|^"),
+    "strict-rfc1459": string.maketrans(_upper + "[]\\", _lower + "{}|"),
+}
+
+class User(object):
+    """
+    A user we share at least one channel with (or ourselves). The same object is shared by all
+    of those channels. Fields we haven't seen yet (eg before a WHO reply) are None.
+    """
+    __slots__ = ("nick", "ident", "host", "realname", "account", "away", "channels")
+
+    def __init__(self, nick):
+        self.nick = nick
+        self.ident = None
+        self.host = None
+        self.realname = None
+        self.account = None
+        self.away = None
+        self.channels = set()
+
+    def __repr__(self):
+        return "<User %s!%s@%s>" % (self.nick, self.ident, self.host)
+
+class Channel(object):
+    """
+    A channel we're in. users maps casemapping-folded nicks to User objects; prefixes maps the
+    folded nicks of the members that have any prefix modes (op, voice...) to a bitmask of them,
+    in the order of NetworkState.prefix_modes. Most members have none, so most have no entry.
+    """
+    __slots__ = ("name", "users", "prefixes")
+
+    def __init__(self, name):
+        self.name = name
+        self.users = {}
+        self.prefixes = {}
+
+    def __repr__(self):
+        return "<Channel %s (%d users)>" % (self.name, len(self.users))
+
+class NetworkState(object):
+    """
+    Tracks channels and their members from the messages a connection receives: JOIN, PART,
+    QUIT, NICK, KICK, MODE, the NAMES (353) and WHO (352, or WHOX 354) replies, and the
+    server's ISUPPORT (005) CASEMAPPING, PREFIX and CHANMODES. Lookups take names in any case.
+
+    Unless the multi-prefix capability was acknowledged (CAP ACK), NAMES and WHO only show a
+    member's highest prefix; that one replaces the ones above it, and the ones below it are kept.
+
+    Nicks and channel names are interned, since the same few thousand strings come up over and
+    over again on a big network.
+    """
+    def __init__(self, casemapping="rfc1459"):
+        self.nick = None
+        self._my_key = None
+        self.casemapping = None
+        self._table = None
+        self.users = {}
+        self.channels = {}
+
+        self.prefix_modes = "ov"
+        self.prefix_symbols = "@+"
+        self.multi_prefix = False
+        # channel modes that take a parameter both when set and unset, and only when set
+        self._param_modes = set("beIkovhqa")
+        self._param_set_modes = set("l")
+        self.whox_fields = "tcuhnfar"
+
+        self.set_casemapping(casemapping)
+
+    @property
+    def whox_fields(self):
+        """
+        the fields requested in WHO <mask> %<fields> queries, which is how WHOX (354) replies
+        are read; servers send them in a fixed order, whatever order they're asked for in
+        """
+        return self._whox_fields
+
+    @whox_fields.setter
+    def whox_fields(self, fields):
+        self._whox_fields = fields
+        self._whox_order = [field for field in "tcuihsnfdlaor" if field in fields]
+
+    def fold(self, name):
+        "the key name is stored under"
+        return intern(name.translate(self._table))
+
+    def set_casemapping(self, casemapping):
+        "switch to another casemapping (see casemappings), refolding everything already known"
+        table = casemappings.get(casemapping.lower())
+        if table is None or table == self._table:
+            return
+        self.casemapping = casemapping.lower()
+        self._table = table
+        self.users = dict((self.fold(user.nick), user) for user in self.users.itervalues())
+        channels = {}
+        for channel in self.channels.itervalues():
+            channel.users = dict((self.fold(user.nick), user)
+                    for user in channel.users.itervalues())
+            channel.prefixes = dict((self.fold(nick), bits)
+                    for nick, bits in channel.prefixes.iteritems())
+            channels[self.fold(channel.name)] = channel
+        self.channels = channels
+        if self.nick is not None:
+            self._my_key = self.fold(self.nick)
+
+    ### queries -----------------------------------------
+
+    def user(self, nick):
+        "the User with this nick, or None"
+        return self.users.get(self.fold(nick))
+
+    def channel(self, name):
+        "the Channel with this name, or None if we're not in it"
+        return self.channels.get(self.fold(name))
+
+    def is_on(self, nick, channel):
+        "whether nick is in channel"
+        channel = self.channels.get(self.fold(channel))
+        return channel is not None and self.fold(nick) in channel.users
+
+    def has_mode(self, channel, nick, mode):
+        "whether nick has the prefix mode (eg 'o') in channel"
+        channel = self.channels.get(self.fold(channel))
+        index = self.prefix_modes.find(mode)
+        if channel is None or index == -1:
+            return False
+        return bool(channel.prefixes.get(self.fold(nick), 0) & (1 << index))
+
+    def prefix(self, channel, nick):
+        "the prefix symbols (eg '@+') nick has in channel, highest first"
+        channel = self.channels.get(self.fold(channel))
+        if channel is None:
+            return ""
+        bits = channel.prefixes.get(self.fold(nick), 0)
+        return "".join(symbol for index, symbol in enumerate(self.prefix_symbols)
+                if bits & (1 << index))
+
+    ### updating ----------------------------------------
+
+    def handle(self, message):
+        "update from a received crow2.irc.message.Message"
+        handler = getattr(self, "irc_" + message.command, None)
+        if handler is not None:
+            handler(message)
+
+    def _get_user(self, nick, key=None):
+        if key is None:
+            key = self.fold(nick)
+        user = self.users.get(key)
+        if user is None:
+            self.users[key] = user = User(intern(nick))
+        return user
+
+    def _add_member(self, channel, nick, key=None):
+        if key is None:
+            key = self.fold(nick)
+        user = self._get_user(nick, key)
+        channel.users[key] = user
+        user.channels.add(channel)
+        return key, user
+
+    def _remove_member(self, channel, key):
+        user = channel.users.pop(key, None)
+        channel.prefixes.pop(key, None)
+        if user is not None:
+            user.channels.discard(channel)
+            self._forget(user, key)
+
+    def _forget(self, user, key):
+        if not user.channels and key != self._my_key:
+            self.users.pop(key, None)
+
+    def _leave(self, key):
+        channel = self.channels.pop(key)
+        for member_key, user in channel.users.iteritems():
+            user.channels.discard(channel)
+            self._forget(user, member_key)
+
+    def irc_001(self, message):
+        self.nick = intern(message.params[0])
+        self._my_key = self.fold(self.nick)
+
+    def irc_005(self, message):
+        for token in message.params[1:-1]:
+            name, equals, value = token.partition("=")
+            if name == "CASEMAPPING":
+                self.set_casemapping(value)
+            elif name == "PREFIX" and value.startswith("("):
+                modes, paren, symbols = value[1:].partition(")")
+                if len(modes) == len(symbols):
+                    self.prefix_modes = modes
+                    self.prefix_symbols = symbols
+                    self._param_modes.update(modes)
+            elif name == "CHANMODES":
+                groups = value.split(",")
+                if len(groups) >= 3:
+                    self._param_modes = set(groups[0] + groups[1] + self.prefix_modes)
+                    self._param_set_modes = set(groups[2])
+
+    def irc_JOIN(self, message):
+        nick = message.nick
+        if nick is None:
+            return
+        channel_key = self.fold(message.params[0])
+        channel = self.channels.get(channel_key)
+        if channel is None:
+            if self.fold(nick) != self._my_key:
+                return
+            self.channels[channel_key] = channel = Channel(intern(message.params[0]))
+        key, user = self._add_member(channel, nick)
+        user.ident = message.user or user.ident
+        user.host = message.host or user.host
+        if len(message.params) >= 3:
+            # extended-join: account and realname
+            account = message.params[1]
+            user.account = None if account == "*" else account
+            user.realname = message.params[2]
+
+    def irc_PART(self, message):
+        if message.nick is None:
+            return
+        for name in message.params[0].split(","):
+            channel_key = self.fold(name)
+            if channel_key not in self.channels:
+                continue
+            key = self.fold(message.nick)
+            if key == self._my_key:
+                self._leave(channel_key)
+            else:
+                self._remove_member(self.channels[channel_key], key)
+
+    def irc_KICK(self, message):
+        if len(message.params) < 2:
+            return
+        channel_key = self.fold(message.params[0])
+        if channel_key not in self.channels:
+            return
+        key = self.fold(message.params[1])
+        if key == self._my_key:
+            self._leave(channel_key)
+        else:
+            self._remove_member(self.channels[channel_key], key)
+
+    def irc_QUIT(self, message):
+        if message.nick is None:
+            return
+        key = self.fold(message.nick)
+        user = self.users.get(key)
+        if user is None:
+            return
+        for channel in list(user.channels):
+            self._remove_member(channel, key)
+        self.users.pop(key, None)
+
+    def irc_NICK(self, message):
+        if message.nick is None or not message.params:
+            return
+        old_key = self.fold(message.nick)
+        new_nick = intern(message.params[0])
+        new_key = self.fold(new_nick)
+        if old_key == self._my_key:
+            self.nick = new_nick
+            self._my_key = new_key
+        user = self.users.pop(old_key, None)
+        if user is None:
+            return
+        user.nick = new_nick
+        self.users[new_key] = user
+        for channel in user.channels:
+            del channel.users[old_key]
+            channel.users[new_key] = user
+            bits = channel.prefixes.pop(old_key, None)
+            if bits is not None:
+                channel.prefixes[new_key] = bits
+
+    def irc_MODE(self, message):
+        params = message.params
+        if len(params) < 2:
+            return
+        channel = self.channels.get(self.fold(params[0]))
+        if channel is None:
+            return
+        args = iter(params[2:])
+        adding = True
+        for mode in params[1]:
+            if mode == "+":
+                adding = True
+            elif mode == "-":
+                adding = False
+            elif mode in self._param_modes or (adding and mode in self._param_set_modes):
+                arg = next(args, None)
+                index = self.prefix_modes.find(mode)
+                if index == -1 or arg is None:
+                    continue
+                key = self.fold(arg)
+                if key not in channel.users:
+                    continue
+                bits = channel.prefixes.get(key, 0)
+                if adding:
+                    bits |= 1 << index
+                else:
+                    bits &= ~(1 << index)
+                if bits:
+                    channel.prefixes[key] = bits
+                else:
+                    channel.prefixes.pop(key, None)
+
+    def _split_prefix(self, name):
+        "(bits, rest) for a nick with prefix symbols in front, eg from NAMES"
+        bits = 0
+        symbols = self.prefix_symbols
+        start = 0
+        while start < len(name):
+            index = symbols.find(name[start])
+            if index == -1:
+                break
+            bits |= 1 << index
+            start += 1
+        return bits, name[start:]
+
+    def _reported_prefix(self, old, bits):
+        "a member's prefix bits, given old ones and the bits a NAMES or WHO reply showed"
+        if not bits or self.multi_prefix:
+            return bits
+        # the lowest bit is the highest prefix shown; only the ones below it may be hidden
+        highest = bits & -bits
+        return bits | (old & ~(highest | (highest - 1)))
+
+    def irc_CAP(self, message):
+        # CAP <nick or *> ACK|DEL :<capabilities>
+        params = message.params
+        if len(params) < 3:
+            return
+        subcommand = params[1].upper()
+        for capability in params[-1].split():
+            if capability.lstrip("-~=") != "multi-prefix":
+                continue
+            if subcommand == "ACK":
+                self.multi_prefix = not capability.startswith("-")
+            elif subcommand == "DEL":
+                self.multi_prefix = False
+
+    def handle_burst(self, end, replies):
+        """
+        update from the NAMES (353) or WHO (352, 354) replies that came before end, their 366 or
+        315, all at once; see crow2.irc.burst
+        """
+        if end.command == "366":
+            self._names(replies)
+        elif end.command == "315":
+            self._who(replies)
+
+    def irc_353(self, message):
+        self._names((message,))
+
+    def irc_352(self, message):
+        self._who((message,))
+
+    irc_354 = irc_352
+
+    def _names(self, replies):
+        # RPL_NAMREPLY: me, channel type, channel, names
+        split_prefix = self._split_prefix
+        add_member = self._add_member
+        multi_prefix = self.multi_prefix
+        channel_name = channel = None
+        for reply in replies:
+            params = reply.params
+            if len(params) < 4:
+                continue
+            if params[2] != channel_name:
+                # a burst is nearly always a single channel
+                channel_name = params[2]
+                channel = self.channels.get(self.fold(channel_name))
+            if channel is None:
+                continue
+            prefixes = channel.prefixes
+            for name in params[3].split():
+                bits, name = split_prefix(name)
+                nick, bang, hostmask = name.partition("!")
+                key, user = add_member(channel, nick)
+                if bang:
+                    # userhost-in-names
+                    user.ident, at, user.host = hostmask.partition("@")
+                if bits:
+                    if not multi_prefix:
+                        bits = self._reported_prefix(prefixes.get(key, 0), bits)
+                    prefixes[key] = bits
+                elif key in prefixes:
+                    del prefixes[key]
+
+    def _who_reply(self, reply):
+        "(channel, ident, host, nick, flags, account, realname) of a WHO or WHOX reply"
+        params = reply.params
+        if reply.command == "352":
+            # RPL_WHOREPLY: me, channel, ident, host, server, nick, flags, "hopcount realname"
+            if len(params) < 8:
+                return None
+            return (params[1], params[2], params[3], params[5], params[6], None,
+                    params[7].partition(" ")[2])
+        # RPL_WHOSPCRPL: me, then the fields of whox_fields in the server's fixed order
+        fields = self._whox_order
+        if len(params) != len(fields) + 1:
+            return None
+        values = dict(zip(fields, params[1:]))
+        account = values.get("a")
+        if account == "0":
+            account = None
+        return (values.get("c"), values.get("u"), values.get("h"), values.get("n"),
+                values.get("f"), account, values.get("r"))
+
+    def _who(self, replies):
+        fold = self.fold
+        channel_name = channel = None
+        for reply in replies:
+            fields = self._who_reply(reply)
+            if fields is None or fields[3] is None:
+                continue
+            name, ident, host, nick, flags, account, realname = fields
+            if name != channel_name:
+                channel_name = name
+                channel = None if name is None else self.channels.get(fold(name))
+            key = fold(nick)
+            if channel is not None:
+                key, user = self._add_member(channel, nick, key)
+            else:
+                user = self.users.get(key)
+                if user is None:
+                    continue
+            if ident is not None:
+                user.ident = ident
+            if host is not None:
+                user.host = host
+            if realname is not None:
+                user.realname = realname
+            if account is not None:
+                user.account = account
+            if flags is not None:
+                user.away = flags.startswith("G")
+                if channel is not None:
+                    bits = self._split_prefix(flags[1:].lstrip("*"))[0]
+                    if bits:
+                        channel.prefixes[key] = self._reported_prefix(
+                                channel.prefixes.get(key, 0), bits)
+                    else:
+                        channel.prefixes.pop(key, None)
@@ -0,0 +1,55 @@
+import pytest
+from twisted.internet.task import Clock
+
+from crow2.irc.burst import numeric, BurstCollector
+
+@pytest.mark.parametrize(("line", "expected"), [
+    (":irc.example.net 353 crow2 = #channel :alice bob", "353"),
+    ("@time=2012-01-01T00:00:00Z :irc.example.net 366 crow2 #channel :End", "366"),
+    ("@time=2012-01-01T00:00:00Z 315 crow2 #channel :End", "315"),
+    ("353 crow2 = #channel :alice", "353"),
+    (":irc.example.net 315", "315"),
+    (":nick!user@host PRIVMSG #channel :353 bottles", ""),
+    ("WHO #channel", "WHO"),
+    (":irc.example.net 3530 crow2", ""),
+    (":irc.example.net", ""),
+    ("", ""),
+])
+def test_numeric(line, expected):
+    assert numeric(line) == expected
+
+def test_collector():
+    collector = BurstCollector(Clock())
+    assert collector.add("353", ":irc.example.net 353 crow2 = #a :alice")
+    assert collector.add("352", ":irc.example.net 352 crow2 #a ~a host irc alice H :0 Alice")
+    assert collector.add("354", ":irc.example.net 354 crow2 #a alice")
+    assert not collector.add("353", "")
+    assert collector.pending() == 3
+
+    replies = collector.take("366")
+    assert [reply.command for reply in replies] == ["353"]
+    assert collector.take("366") == []
+    assert [reply.command for reply in collector.take("315")] == ["352", "354"]
+    assert collector.pending() == 0
+
+def test_give_up():
+    clock = Clock()
+    collector = BurstCollector(clock, limit=3, timeout=10)
+    collector.add("352", ":irc.example.net 352 crow2 #a ~a host irc alice H :0 Alice")
+    clock.advance(5)
+    collector.add("353", ":irc.example.net 353 crow2 = #a :alice")
+    assert not collector.full()
+    assert collector.overdue() == []
+
+    clock.advance(6)
+    assert collector.overdue() == ["315"]
+    assert [reply.command for reply in collector.give_up(collector.overdue())] == ["352"]
+    assert collector.pending() == 1
+
+    collector.add("352", ":irc.example.net 352 crow2 #a ~b host irc bob H :0 Bob")
+    collector.add("354", ":irc.example.net 354 crow2 #a carol")
+    assert collector.full()
+    assert [reply.command for reply in collector.give_up()] == ["353", "352", "354"]
+    assert collector.pending() == 0
+    assert collector.overdue() == []
+
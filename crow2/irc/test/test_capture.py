@@ -0,0 +1,88 @@
+import pytest
+
+from crow2.irc.capture import (Capture, CaptureReader, CaptureError, magic, LINE, CONNECTION,
+        SESSION)
+
+def read(path):
+    reader = CaptureReader(path)
+    try:
+        return list(reader.chunks()), reader.names
+    finally:
+        reader.close()
+
+def test_round_trip(tmpdir):
+    path = str(tmpdir.join("capture"))
+    capture = Capture(path)
+    first = capture.connection("freenode")
+    second = capture.connection("efnet")
+    capture.write_lines(first, ["PING :a", ":a 001 crow2 :Welcome"])
+    capture.write_lines(second, ["PING :b"])
+    capture.write_lines(first, [":a 002 crow2 :Your host"])
+    capture.close()
+
+    reader = CaptureReader(path)
+    kinds = [kind for kind, when, key, payload in reader.records()]
+    reader.close()
+    assert kinds == [SESSION, CONNECTION, CONNECTION, LINE, LINE, LINE, LINE]
+
+    chunks, names = read(path)
+    assert [(key, lines) for when, key, lines in chunks] == [
+        ((0, 0), ["PING :a", ":a 001 crow2 :Welcome"]),
+        ((0, 1), ["PING :b"]),
+        ((0, 0), [":a 002 crow2 :Your host"]),
+    ]
+    assert names == {(0, 0): "freenode", (0, 1): "efnet"}
+    assert [when for when, key, lines in chunks] == sorted(when for when, key, lines in chunks)
+
+def test_sessions(tmpdir):
+    path = str(tmpdir.join("capture"))
+    for name in ("before", "after"):
+        capture = Capture(path)
+        capture.write_lines(capture.connection(name), ["PING :%s" % name])
+        capture.close()
+
+    with open(path, "rb") as reader:
+        assert reader.read().count(magic) == 1
+    chunks, names = read(path)
+    assert [(key, lines) for when, key, lines in chunks] == [
+        ((0, 0), ["PING :before"]),
+        ((1, 0), ["PING :after"]),
+    ]
+    assert names == {(0, 0): "before", (1, 0): "after"}
+
+def test_truncated(tmpdir):
+    path = str(tmpdir.join("capture"))
+    capture = Capture(path)
+    connection = capture.connection("freenode")
+    capture.write_lines(connection, ["PING :one"])
+    capture.write_lines(connection, ["PING :two"])
+    capture.close()
+
+    with open(path, "rb") as reader:
+        data = reader.read()
+    for cut in (1, len("PING :two") + 1):
+        with open(path, "wb") as writer:
+            writer.write(data[:-cut])
+        chunks, names = read(path)
+        assert [lines for when, key, lines in chunks] == [["PING :one"]]
+
+def test_not_a_capture(tmpdir):
+    path = tmpdir.join("capture")
+    path.write("PING :this is a log, not a capture\r\n")
+    with pytest.raises(CaptureError):
+        CaptureReader(str(path))
+
+    path.write("")
+    with pytest.raises(CaptureError):
+        CaptureReader(str(path))
+
+def test_many_connections(tmpdir):
+    # every connection, reconnects included, gets an id of its own
+    path = str(tmpdir.join("capture"))
+    capture = Capture(path)
+    capture._next_id = 70000
+    capture.write_lines(capture.connection("freenode"), ["PING :a"])
+    capture.close()
+
+    chunks, names = read(path)
+    assert [(key, lines) for when, key, lines in chunks] == [((0, 70000), ["PING :a"])]
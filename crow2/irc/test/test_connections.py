@@ -0,0 +1,222 @@
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+
+from crow2.util import AttrDict
+from crow2.irc import main
+from crow2.irc.connections import ConnectionManager, DNSCache
+
+class FakeReactor(Clock):
+    def __init__(self):
+        Clock.__init__(self)
+        self.lookups = []
+        self.connects = []
+
+    def resolve(self, host):
+        deferred = Deferred()
+        self.lookups.append((host, deferred))
+        return deferred
+
+    def connectTCP(self, address, port, factory):
+        self.connects.append((address, factory.server))
+
+class FakeServer(object):
+    def __init__(self, reactor, name, address="irc.example.net"):
+        self.name = name
+        self.address = address
+        self.reactor = reactor
+
+    def connect(self, address):
+        self.reactor.connectTCP(address, 6667, AttrDict(server=self))
+
+def make_servers(reactor, count, **keywords):
+    return [FakeServer(reactor, "server%d" % i, **keywords) for i in range(count)]
+
+def test_dns_cache():
+    reactor = FakeReactor()
+    cache = DNSCache(reactor, ttl=10)
+    results = []
+    cache.resolve("irc.example.net").addCallback(results.append)
+    cache.resolve("irc.example.net").addCallback(results.append)
+    assert len(reactor.lookups) == 1
+    reactor.lookups[0][1].callback("192.0.2.1")
+    assert results == ["192.0.2.1", "192.0.2.1"]
+
+    cache.resolve("irc.example.net").addCallback(results.append)
+    cache.resolve("192.0.2.7").addCallback(results.append)
+    cache.resolve("2001:db8::1").addCallback(results.append)
+    assert results[2:] == ["192.0.2.1", "192.0.2.7", "2001:db8::1"]
+    assert len(reactor.lookups) == 1
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    reactor.advance(10)
+    cache.resolve("irc.example.net")
+    assert len(reactor.lookups) == 2
+
+    errors = []
+    cache.resolve("nowhere.example.net").addErrback(errors.append)
+    reactor.lookups[-1][1].errback(Failure(ValueError("no such host")))
+    assert len(errors) == 1
+    cache.resolve("nowhere.example.net")
+    assert len(reactor.lookups) == 4
+
+class FailingReactor(FakeReactor):
+    "a resolver that knows straight away that there's no such host"
+    def resolve(self, host):
+        self.lookups.append((host, None))
+        return fail(ValueError("no such host"))
+
+def test_resolve_failure_synchronous():
+    reactor = FailingReactor()
+    manager = ConnectionManager(reactor, max_connecting=2, stagger=1, initial_delay=100,
+            random=lambda: 0.0)
+    servers = make_servers(reactor, 4)
+    for server in servers:
+        manager.add(server)
+    def pump_calls():
+        return [call for call in reactor.getDelayedCalls() if call.func == manager._pump]
+
+    # each failure frees its slot from within _pump, which mustn't start another pump
+    assert len(reactor.lookups) == 1
+    assert len(pump_calls()) == 1
+    reactor.advance(1)
+    assert len(reactor.lookups) == 2
+    assert len(pump_calls()) == 1
+    reactor.advance(1)
+    reactor.advance(1)
+    assert [host for host, deferred in reactor.lookups] == ["irc.example.net"] * 4
+    assert manager.counts()["backoff"] == 4
+    assert not pump_calls()
+
+class SynchronousReactor(FakeReactor):
+    "a resolver answering from a hosts file or cache: lookups have fired when they're returned"
+    def resolve(self, host):
+        self.lookups.append((host, None))
+        return succeed("192.0.2.1")
+
+def test_dns_cache_synchronous():
+    reactor = SynchronousReactor()
+    cache = DNSCache(reactor)
+    results = []
+    cache.resolve("irc.example.net").addCallback(results.append)
+    cache.resolve("irc.example.net").addCallback(results.append)
+    assert results == ["192.0.2.1", "192.0.2.1"]
+    assert len(reactor.lookups) == 1
+
+    manager = ConnectionManager(reactor, stagger=0)
+    server, = make_servers(reactor, 1, address="irc.other.example.net")
+    manager.add(server)
+    assert reactor.connects == [("192.0.2.1", server)]
+    assert manager.counts()["connecting"] == 1
+
+def test_bounded_and_staggered():
+    reactor = FakeReactor()
+    manager = ConnectionManager(reactor, max_connecting=2, stagger=1)
+    servers = make_servers(reactor, 4, address="192.0.2.1")
+    for server in servers:
+        manager.add(server)
+    assert [server for address, server in reactor.connects] == servers[:1]
+    reactor.advance(1)
+    assert [server for address, server in reactor.connects] == servers[:2]
+    assert manager.counts() == {"waiting": 2, "resolving": 0, "connecting": 2, "connected": 0,
+            "backoff": 0}
+
+    reactor.advance(5)
+    assert len(reactor.connects) == 2
+    manager.connected(servers[0])
+    assert len(reactor.connects) == 3
+    manager.connected(servers[1])
+    # still within a second of the last connect
+    assert len(reactor.connects) == 3
+    reactor.advance(1)
+    assert len(reactor.connects) == 4
+    assert manager.report() == ("irc connections: 0 waiting, 0 resolving, 2 connecting, "
+            "2 connected, 0 backoff")
+
+def test_backoff():
+    reactor = FakeReactor()
+    randoms = [0.0, 0.0, 0.0, 1.0]
+    manager = ConnectionManager(reactor, stagger=0, initial_delay=2, max_delay=5, jitter=0.5,
+            random=lambda: randoms.pop(0))
+    server = FakeServer(reactor, "server", "192.0.2.1")
+    manager.add(server)
+    for delay in [2, 4, 5, 2.5]:
+        assert len(reactor.connects) == 1
+        del reactor.connects[:]
+        manager.failed(server, None)
+        assert manager.state[server] == "backoff"
+        reactor.advance(delay - 0.01)
+        assert not reactor.connects
+        reactor.advance(0.01)
+
+    # a connection that worked starts over from initial_delay
+    randoms.append(0.0)
+    manager.connected(server)
+    manager.lost(server, None)
+    del reactor.connects[:]
+    reactor.advance(2)
+    assert len(reactor.connects) == 1
+
+def test_resolve_failure():
+    reactor = FakeReactor()
+    manager = ConnectionManager(reactor, max_connecting=1, random=lambda: 0.0)
+    first, second = make_servers(reactor, 2)
+    manager.add(first)
+    manager.add(second)
+    assert manager.state[first] == "resolving"
+    assert manager.state[second] == "waiting"
+
+    reactor.lookups[0][1].errback(Failure(ValueError("no such host")))
+    assert manager.state[first] == "backoff"
+    reactor.advance(0.2)
+    assert manager.state[second] == "resolving"
+    reactor.lookups[1][1].callback("192.0.2.1")
+    assert reactor.connects == [("192.0.2.1", second)]
+
+def test_factory():
+    reactor = FakeReactor()
+    manager = ConnectionManager(reactor, random=lambda: 0.0)
+    options = {"server": "192.0.2.1", "nick": "crow2", "channels": []}
+    server = main.Server(reactor, "example", options)
+    manager.add(server)
+    assert reactor.connects == [("192.0.2.1", server)]
+
+    factory = server.factory
+    factory.clientConnectionFailed(None, Failure(ValueError("refused")))
+    assert manager.state[server] == "backoff"
+    reactor.advance(1)
+    assert manager.state[server] == "connecting"
+
+    protocol = factory.buildProtocol("192.0.2.1")
+    assert manager.state[server] == "connected"
+    assert protocol is server._reactor_connection
+
+    factory.clientConnectionLost(None, Failure(ValueError("netsplit")))
+    assert manager.state[server] == "backoff"
+
+def test_factory_stop_trying():
+    reactor = FakeReactor()
+    manager = ConnectionManager(reactor, random=lambda: 0.0)
+    options = {"server": "192.0.2.1", "nick": "crow2", "channels": []}
+    server = main.Server(reactor, "example", options)
+    manager.add(server)
+    factory = server.factory
+    factory.buildProtocol("192.0.2.1")
+
+    factory.stopTrying()
+    assert server not in manager.state
+    factory.clientConnectionLost(None, Failure(ValueError("quit")))
+    assert server not in manager.state
+    reactor.advance(600)
+    assert len(reactor.connects) == 1
+
+    # stopping while a connect is on its way frees its slot, and a failure then isn't retried
+    other = main.Server(reactor, "other", options)
+    manager.add(other)
+    assert manager.counts()["connecting"] == 1
+    other.factory.continueTrying = 0
+    other.factory.clientConnectionFailed(None, Failure(ValueError("refused")))
+    assert manager.counts() == dict.fromkeys(manager.states, 0)
+    assert manager._in_flight == 0
+    reactor.advance(600)
+    assert len(reactor.connects) == 2
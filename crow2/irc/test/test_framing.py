@@ -0,0 +1,80 @@
+import pytest
+
+from crow2.irc.framing import BufferedLineReceiver
+
+class Receiver(BufferedLineReceiver):
+    def __init__(self, *args, **keywords):
+        BufferedLineReceiver.__init__(self, *args, **keywords)
+        self.batches = []
+        self.too_long = []
+
+    def linesReceived(self, lines):
+        self.batches.append(lines)
+
+    def lineLengthExceeded(self, line):
+        self.too_long.append(line)
+
+def test_batches():
+    receiver = Receiver()
+    receiver.dataReceived("PING :a\r\nPING :b\r\nPING :c\r\n")
+    receiver.dataReceived("PING :d\r\n")
+    assert receiver.batches == [["PING :a", "PING :b", "PING :c"], ["PING :d"]]
+    assert not receiver._buffer
+
+def test_partial_lines():
+    receiver = Receiver()
+    receiver.dataReceived("PING :a\r\nPI")
+    receiver.dataReceived("NG :b")
+    receiver.dataReceived("\r")
+    assert receiver.batches == [["PING :a"]]
+    receiver.dataReceived("\nPING :c\r\nPING")
+    assert receiver.batches == [["PING :a"], ["PING :b", "PING :c"]]
+    assert receiver._buffer == bytearray("PING")
+
+def test_delimiter():
+    receiver = Receiver("\n")
+    receiver.dataReceived("a\nb\r\nc")
+    assert receiver.batches == [["a", "b\r"]]
+
+@pytest.mark.parametrize(("chunks", "batches"), [
+    (["a" * 11 + "\r\n"], []),
+    (["first\r\nshort\r\n" + "a" * 11 + "\r\nafter\r\n"], [["first", "short"]]),
+    (["a" * 6, "a" * 6], []),
+    (["short\r\n" + "a" * 11], [["short"]]),
+])
+def test_line_length(chunks, batches):
+    receiver = Receiver(max_line_length=10)
+    for chunk in chunks:
+        receiver.dataReceived(chunk)
+    # like LineOnlyReceiver, lines before the long one are delivered, and lines after it aren't
+    assert [len(line) > 10 for line in receiver.too_long] == [True]
+    assert receiver.batches == batches
+
+def test_line_length_disconnecting():
+    class Transport(object):
+        disconnecting = False
+
+    class Disconnecting(Receiver):
+        def linesReceived(self, lines):
+            Receiver.linesReceived(self, lines)
+            self.transport.disconnecting = True
+
+    receiver = Disconnecting(max_line_length=10)
+    receiver.transport = Transport()
+    receiver.dataReceived("short\r\n" + "a" * 11 + "\r\n")
+    assert receiver.batches == [["short"]]
+    assert not receiver.too_long
+
+def test_default_drops_connection():
+    class Transport(object):
+        lost = False
+        def loseConnection(self):
+            self.lost = True
+
+    receiver = BufferedLineReceiver(max_line_length=4)
+    receiver.transport = Transport()
+    receiver.dataReceived("toolong")
+    assert receiver.transport.lost
+
+    with pytest.raises(NotImplementedError):
+        BufferedLineReceiver().dataReceived("line\r\n")
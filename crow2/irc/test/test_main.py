@@ -1,10 +1,12 @@
 import sys
 
 import pytest
+from twisted.internet.task import Clock
 
 from crow2 import hook
 from crow2.util import AttrDict
 from crow2.events.hook import Hook
+from crow2.events.exceptions import NotRegisteredError
 from crow2.test.util import Counter
 from ...irc import main
 
@@ -38,11 +40,19 @@ def test_init(monkeypatch):
             self.connected = False
             fakeservers[name] = self
 
-        def connect(self):
-            self.connected = True
+    class FakeManager(object):
+        def __init__(self, reactor, **options):
+            self.reactor = reactor
+            self.options = options
+            managers.append(self)
+
+        def add(self, server):
+            server.connected = True
+    managers = []
 
     monkeypatch.setattr(main, "log", logstub)
     monkeypatch.setattr(main, "Server", FakeServer)
+    monkeypatch.setattr(main, "ConnectionManager", FakeManager)
 
     reactor_sentinel = object()
 
@@ -50,15 +60,21 @@ def test_init(monkeypatch):
         "test_1": object(),
         "test_2": object()
     }
-    config = AttrDict(connections=connections)
+    config = AttrDict(connections=connections, connection_manager={"max_connecting": 3})
     event = AttrDict(config=config, reactor=reactor_sentinel)
 
     main.init(event)
 
+    manager, = managers
+    assert event.connection_manager is manager
+    assert manager.reactor is reactor_sentinel
+    assert manager.options == {"max_connecting": 3}
+
     assert startLogging_counter.incremented(1)
     assert len(fakeservers) == len(connections)
     assert all(fakeserver.reactor is reactor_sentinel for fakeserver in fakeservers.values())
     assert all(fakeserver.connected for fakeserver in fakeservers.values())
+    assert all(fakeserver.capture is None for fakeserver in fakeservers.values())
 
     assert fakeservers["test_1"].options is connections["test_1"]
     assert fakeservers["test_2"].options is connections["test_2"]
@@ -182,7 +198,8 @@ def test_protocol(monkeypatch):
     monkeypatch.setattr(hook, "connection", conn_hooks)
 
     delimiter_sentinel = object()
-    server = AttrDict(delimiter=delimiter_sentinel)
+    server = AttrDict(delimiter=delimiter_sentinel, reactor=Clock(), flood_burst=5,
+            flood_rate=0.5, send_queue_limit=1000, manager=None, capture=None)
     factory = main.ConnectionFactory(server)
     assert factory.server is server
 
@@ -220,6 +237,9 @@ def test_protocol(monkeypatch):
     protocol.lineReceived("incoming line")
     assert commands.incremented(1)
 
+    protocol.linesReceived(["incoming line", "incoming line"])
+    assert commands.incremented(2)
+
     disconnect_count = Counter()
     reason_sentinel = object()
     @result.conn.disconnect
@@ -229,3 +249,170 @@ def test_protocol(monkeypatch):
 
     protocol.connectionLost(reason_sentinel)
     assert disconnect_count.incremented(1)
+
+def test_unhandled_command():
+    multiplexer = main.ProtocolMultiplexer()
+    @multiplexer.preparer
+    def prepare(event):
+        event.command = "UNHANDLED"
+    event = multiplexer.fire(line="UNHANDLED")
+    assert event.command == "UNHANDLED"
+
+def test_send(monkeypatch):
+    conn_hooks = AttrDict()
+    monkeypatch.setattr(hook, "connection", conn_hooks)
+
+    clock = Clock()
+    server = AttrDict(delimiter="\r\n", reactor=clock, flood_burst=2, flood_rate=1.0,
+            send_queue_limit=10, manager=None, capture=None)
+    protocol = main.ConnectionFactory(server).buildProtocol("irc.example.net")
+    writes = []
+    protocol.transport = AttrDict(disconnecting=False, write=writes.append)
+
+    sent = []
+    @protocol.sent.preparer
+    def onsent(event):
+        sent.append(event.line)
+        event.command = event.line.split()[0]
+
+    protocol.send("PRIVMSG #a :one")
+    protocol.send("PRIVMSG #a :two")
+    protocol.send("PRIVMSG #a :three")
+    protocol.send("PONG :irc.example.net")
+    assert not writes
+
+    clock.advance(0)
+    assert writes == ["PONG :irc.example.net\r\nPRIVMSG #a :one\r\n"]
+    assert sent == ["PONG :irc.example.net", "PRIVMSG #a :one"]
+    assert protocol.sendqueue.depth == 2
+
+    clock.advance(1)
+    assert writes[1:] == ["PRIVMSG #a :two\r\n"]
+    protocol.connectionLost(None)
+    assert protocol.sendqueue.depth == 0
+    assert protocol.sendqueue.dropped == 1
+    clock.advance(10)
+    assert len(writes) == 2
+
+def test_multiplexer_dispatch():
+    multiplexer = main.ProtocolMultiplexer()
+    @multiplexer.preparer
+    def prepare(event):
+        if event.line == "cancel":
+            event.cancelled = True
+        elif event.line != "no command":
+            event.command = event.line
+
+    handled = Counter()
+    @multiplexer("PRIVMSG")
+    def privmsg(event):
+        assert event.line == "PRIVMSG"
+        handled.tick()
+
+    multiplexer.fire(line="PRIVMSG")
+    assert handled.incremented(1)
+    for line in ["001", "cancel", "no command"]:
+        event = multiplexer.fire(line=line)
+        assert event.line == line
+    assert handled.incremented(0)
+
+    multiplexer.unregister(privmsg)
+    multiplexer.fire(line="PRIVMSG")
+    assert handled.incremented(0)
+    with pytest.raises(NotRegisteredError):
+        multiplexer.unregister(privmsg)
+
+def test_bursts(monkeypatch):
+    monkeypatch.setattr(hook, "connection", AttrDict())
+    server = AttrDict(delimiter="\r\n", reactor=Clock(), flood_burst=5, flood_rate=0.5,
+            send_queue_limit=1000, manager=None, capture=None)
+    protocol = main.ConnectionFactory(server).buildProtocol("irc.example.net")
+    protocol.transport = AttrDict(disconnecting=False)
+
+    seen = []
+    @protocol.received.preparer
+    def received(event):
+        seen.append((event.line, [reply.line for reply in event.get("replies", ())]))
+        event.command = None
+
+    names = [":irc.example.net 353 crow2 = #a :crow2 alice",
+             ":irc.example.net 353 crow2 = #a :bob"]
+    protocol.linesReceived([
+        ":crow2!bot@host JOIN #a",
+        names[0],
+        ":irc.example.net 352 crow2 #a ~a host irc alice H :0 Alice",
+    ])
+    assert seen == [(":crow2!bot@host JOIN #a", [])]
+    protocol.linesReceived([
+        names[1],
+        ":irc.example.net 366 crow2 #a :End of /NAMES list.",
+        "PING :irc.example.net",
+        ":irc.example.net 315 crow2 #a :End of /WHO list.",
+    ])
+    assert seen[1:] == [
+        (":irc.example.net 366 crow2 #a :End of /NAMES list.", names),
+        ("PING :irc.example.net", []),
+        (":irc.example.net 315 crow2 #a :End of /WHO list.",
+            [":irc.example.net 352 crow2 #a ~a host irc alice H :0 Alice"]),
+    ]
+    assert protocol.burst.pending() == 0
+
+    protocol.transport.disconnecting = True
+    protocol.linesReceived(["PING :irc.example.net",
+                            ":irc.example.net 366 crow2 #a :End of /NAMES list."])
+    assert len(seen) == 4
+
+def test_unended_bursts(monkeypatch):
+    monkeypatch.setattr(hook, "connection", AttrDict())
+    clock = Clock()
+    server = AttrDict(delimiter="\r\n", reactor=clock, flood_burst=5, flood_rate=0.5,
+            send_queue_limit=1000, manager=None, capture=None)
+    protocol = main.ConnectionFactory(server).buildProtocol("irc.example.net")
+    protocol.transport = AttrDict(disconnecting=False)
+    protocol.burst.limit = 3
+
+    seen = []
+    @protocol.received.preparer
+    def received(event):
+        seen.append(event.line)
+        event.command = None
+
+    who = [":irc.example.net 352 crow2 #a ~u%d host irc nick%d H :0 User" % (i, i)
+           for i in range(4)]
+    # a WHO nobody ended, given up on once it has waited too long
+    protocol.linesReceived(who[:1])
+    clock.advance(protocol.burst.timeout + 1)
+    protocol.linesReceived(["PING :a"])
+    assert seen == [who[0], "PING :a"]
+
+    # and once too many replies are waiting
+    del seen[:]
+    protocol.linesReceived(["PING :b"] + who[1:] + ["PING :c"])
+    assert seen == ["PING :b"] + who[1:] + ["PING :c"]
+    assert protocol.burst.pending() == 0
+
+def test_capture(monkeypatch, tmpdir):
+    from crow2.irc.capture import Capture, CaptureReader
+    monkeypatch.setattr(hook, "connection", AttrDict())
+    path = str(tmpdir.join("capture"))
+    server = AttrDict(name="freenode", delimiter="\r\n", reactor=Clock(), flood_burst=5,
+            flood_rate=0.5, send_queue_limit=1000, manager=None, capture=Capture(path))
+    protocol = main.ConnectionFactory(server).buildProtocol("irc.example.net")
+    protocol.transport = AttrDict(disconnecting=False)
+
+    @protocol.received.preparer
+    def received(event):
+        event.command = None
+
+    protocol.lineReceived("PING :one")
+    protocol.linesReceived(["PING :two", ":irc.example.net 353 crow2 = #a :alice"])
+    server.capture.close()
+
+    reader = CaptureReader(path)
+    try:
+        assert [lines for when, key, lines in reader.chunks()] == [
+            ["PING :one"], ["PING :two", ":irc.example.net 353 crow2 = #a :alice"]]
+        assert reader.names == {(0, 0): "freenode"}
+    finally:
+        reader.close()
+
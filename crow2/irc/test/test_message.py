@@ -0,0 +1,121 @@
+import pytest
+
+from crow2.irc.message import parse, ParseError, unescape_tag_value
+
+cases = [
+    ("PING :irc.example.net", None, None, "PING", ["irc.example.net"]),
+    (":nick!user@host PRIVMSG #channel :hello there", None, "nick!user@host", "PRIVMSG",
+        ["#channel", "hello there"]),
+    (":irc.example.net 001 crow2 :Welcome to IRC", None, "irc.example.net", "001",
+        ["crow2", "Welcome to IRC"]),
+    (":irc.example.net 353 crow2 = #channel :a @b +c", None, "irc.example.net", "353",
+        ["crow2", "=", "#channel", "a @b +c"]),
+    (":nick!user@host JOIN #channel", None, "nick!user@host", "JOIN", ["#channel"]),
+    (":nick MODE #channel +o other", None, "nick", "MODE", ["#channel", "+o", "other"]),
+    ("privmsg #channel ::)", None, None, "PRIVMSG", ["#channel", ":)"]),
+    ("PRIVMSG #channel :", None, None, "PRIVMSG", ["#channel", ""]),
+    ("QUIT", None, None, "QUIT", []),
+    (":a  PRIVMSG   #c   :two  spaces ", None, "a", "PRIVMSG", ["#c", "two  spaces "]),
+    ("NOTICE a:b :c", None, None, "NOTICE", ["a:b", "c"]),
+    ("@time=2012-06-30T23:59:60.419Z;msgid=abc :nick!u@h PRIVMSG #c :hi",
+        "time=2012-06-30T23:59:60.419Z;msgid=abc", "nick!u@h", "PRIVMSG", ["#c", "hi"]),
+    ("@a=b PING :x", "a=b", None, "PING", ["x"]),
+]
+
+@pytest.mark.parametrize(("line", "raw_tags", "prefix", "command", "params"), cases)
+def test_parse(line, raw_tags, prefix, command, params):
+    message = parse(line)
+    assert message.line == line
+    assert message.raw_tags == raw_tags
+    assert message.prefix == prefix
+    assert message.command == command
+    assert message.params == params
+
+@pytest.mark.parametrize("line", ["", " ", ":prefix", ":prefix ", ":prefix :trailing", "@tags", "@tags :prefix"])
+def test_parse_errors(line):
+    with pytest.raises(ParseError):
+        parse(line)
+
+def test_prefix():
+    message = parse(":nick!user@host PRIVMSG #channel :hi")
+    assert message._source is None
+    assert (message.nick, message.user, message.host) == ("nick", "user", "host")
+    assert message._source is not None
+
+    assert (parse(":irc.example.net NOTICE * :hi").nick, parse(":irc.example.net NOTICE * :hi").user) == (
+            "irc.example.net", None)
+    assert parse(":nick@host PRIVMSG a :b").host == "host"
+    assert parse(":nick@host PRIVMSG a :b").user is None
+    assert parse("PING :x").nick is None
+
+def test_equality():
+    assert parse(":a PING :x") == parse(":a  PING  :x")
+    assert parse(":a PING :x") != parse(":b PING :x")
+    assert parse("PING :x") != "PING :x"
+    assert "Message" in repr(parse("PING :x"))
+
+@pytest.mark.parametrize(("escaped", "value"), [
+    ("plain", "plain"),
+    (r"a\:b", "a;b"),
+    (r"a\sb", "a b"),
+    ("a\\\\b", "a\\b"),
+    (r"\r\n", "\r\n"),
+    (r"\q", "q"),
+    ("\\\\s", "\\s"),
+    ("trailing\\", "trailing"),
+    ("", ""),
+])
+def test_unescape(escaped, value):
+    assert unescape_tag_value(escaped) == value
+
+def test_tags():
+    message = parse(r"@time=2012-06-30T23:59:60.419Z;account=alice;+draft/reply=a\sb;flag;"
+                    r"empty=;dup=1;dup=2;acc=x :nick PRIVMSG #c :hi")
+    tags = message.tags
+    assert tags is message.tags
+    assert not tags._cache
+
+    assert tags["account"] == "alice"
+    assert tags["+draft/reply"] == "a b"
+    assert tags["flag"] == ""
+    assert tags["empty"] == ""
+    assert tags["dup"] == "2"
+    assert tags["acc"] == "x"
+    assert tags.get("missing") is None
+    assert "missing" not in tags
+    assert "time" in tags
+    assert set(tags._cache) == set(["account", "+draft/reply", "flag", "empty", "dup", "acc",
+                                    "missing", "time"])
+
+    assert len(tags) == 7
+    assert dict(tags) == {
+        "time": "2012-06-30T23:59:60.419Z",
+        "account": "alice",
+        "+draft/reply": "a b",
+        "flag": "",
+        "empty": "",
+        "dup": "2",
+        "acc": "x",
+    }
+    with pytest.raises(KeyError):
+        tags["missing"]
+
+@pytest.mark.parametrize("raw", ["a=1;b", "=1;a=1;b", "a=1;b;", ""])
+def test_tags_empty_key(raw):
+    tags = parse("@%s PING :x" % raw).tags if raw else parse("PING :x").tags
+    assert "" not in tags
+    assert "" not in dict(tags)
+
+def test_tags_suffix_key():
+    # a key that ends another one is only found as a whole tag
+    tags = parse("@msgid=1;xid;id=2;y-id=3 PING :x").tags
+    assert tags["id"] == "2"
+    assert tags["msgid"] == "1"
+    assert "d" not in tags
+    assert parse("@msgid=1;id=2;xid PING :x").tags["id"] == "2"
+    assert "id" not in parse("@msgid=1;xid PING :x").tags
+
+def test_no_tags():
+    tags = parse("PING :x").tags
+    assert len(tags) == 0
+    assert "a" not in tags
@@ -1,4 +1,32 @@
+from crow2.util import AttrDict
+from crow2.irc import protocol
+from crow2.irc.state import NetworkState
+from crow2.irc.message import parse
 
-from ...irc import protocol
+def test_line_received():
+    instance = protocol.IRCProtocol(AttrDict(conn=AttrDict(state=NetworkState())))
+    event = AttrDict(line=":nick!user@host PRIVMSG #channel :hello")
+    instance.line_received(event)
+    assert event.command == "PRIVMSG"
+    assert event.message.params == ["#channel", "hello"]
+    assert event.message.nick == "nick"
+    assert not event.get("cancelled")
 
-def test_
+def test_line_received_unparseable():
+    instance = protocol.IRCProtocol(AttrDict(conn=AttrDict(state=NetworkState())))
+    event = AttrDict(line="")
+    instance.line_received(event)
+    assert event.cancelled
+    assert "command" not in event
+
+def test_state_updates():
+    state = NetworkState()
+    instance = protocol.IRCProtocol(AttrDict(conn=AttrDict(state=state)))
+    instance.line_received(AttrDict(line=":irc.example.net 001 crow2 :Welcome"))
+    instance.line_sent(AttrDict(line="JOIN #channel"))
+    assert state.channel("#channel") is None
+    instance.line_received(AttrDict(line=":crow2!bot@host JOIN #channel"))
+    assert state.is_on("crow2", "#channel")
+    instance.line_received(AttrDict(line=":irc.example.net 366 crow2 #channel :End",
+            replies=[parse(":irc.example.net 353 crow2 = #channel :crow2 @alice")]))
+    assert state.has_mode("#channel", "alice", "o")
@@ -0,0 +1,113 @@
+from crow2.irc import capture as capture_module
+from crow2.irc.capture import Capture, CaptureReader
+from crow2.irc.replay import replay, describe, NullTransport
+from crow2.events import hook as hook_module
+from crow2.events.hook import Hook
+from crow2.util import AttrDict
+
+class FakeConnection(object):
+    def __init__(self, clock, name, hook):
+        self.clock = clock
+        self.name = name
+        self.hook = hook
+        self.received = []
+        self.lost = False
+
+    def linesReceived(self, lines):
+        for line in lines:
+            self.hook.fire(line=line, now=self.clock.seconds())
+        self.received.append(lines)
+
+    def connectionLost(self, reason):
+        self.lost = True
+
+def capture_file(tmpdir):
+    path = str(tmpdir.join("capture"))
+    capture = Capture(path)
+    first = capture.connection("freenode")
+    second = capture.connection("efnet")
+    capture.write_lines(first, ["PING :a", "PING :b"])
+    capture.write_lines(second, ["PING :c"])
+    capture.close()
+    return path
+
+def test_replay(tmpdir):
+    hook = Hook()
+    seen = []
+    @hook
+    def handler(event):
+        seen.append(event.line)
+
+    connections = {}
+    def connect(clock, name):
+        connection = connections[name] = FakeConnection(clock, name, hook)
+        return connection
+
+    reader = CaptureReader(capture_file(tmpdir))
+    try:
+        result = replay(reader, connect)
+    finally:
+        reader.close()
+
+    assert seen == ["PING :a", "PING :b", "PING :c"]
+    assert connections["freenode"].received == [["PING :a", "PING :b"]]
+    assert connections["efnet"].received == [["PING :c"]]
+    assert all(connection.lost for connection in connections.values())
+    assert hook_module.handler_timer is None
+
+    assert (result.lines, result.connections) == (3, 2)
+    assert [(name, count) for name, count, total in result.times.slowest()] == [
+        ("crow2.irc.test.test_replay.handler", 3)]
+    report = result.format()
+    assert "replayed 3 lines on 2 connections" in report
+    assert "crow2.irc.test.test_replay.handler" in report
+
+def test_paced(tmpdir, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(capture_module, "time", AttrDict(time=lambda: now[0]))
+    path = str(tmpdir.join("capture"))
+    capture = Capture(path)
+    connection = capture.connection("freenode")
+    capture.write_lines(connection, ["PING :a"])
+    now[0] += 10
+    capture.write_lines(connection, ["PING :b"])
+    capture.close()
+
+    clocks = []
+    def connect(clock, name):
+        connection = FakeConnection(clock, name, Hook())
+        connection.linesReceived = lambda lines: clocks.append(clock.seconds())
+        return connection
+
+    sleeps = []
+    reader = CaptureReader(path)
+    try:
+        replay(reader, connect, paced=True, speed=2.0, sleep=sleeps.append)
+    finally:
+        reader.close()
+    assert clocks == [0, 10]
+    assert len(sleeps) == 1 and 4 < sleeps[0] <= 5
+
+def test_default_connect(tmpdir):
+    # the real TwistedConnection, with the crow2.irc plugins' handlers absent
+    reader = CaptureReader(capture_file(tmpdir))
+    try:
+        result = replay(reader)
+    finally:
+        reader.close()
+    assert (result.lines, result.connections) == (3, 2)
+
+def test_describe():
+    class Wrapper(object):
+        def __init__(self, methodfunc):
+            self.methodfunc = methodfunc
+    assert describe(test_describe) == "crow2.irc.test.test_replay.test_describe"
+    assert describe(Wrapper(test_describe)) == "crow2.irc.test.test_replay.test_describe"
+
+def test_null_transport():
+    transport = NullTransport()
+    transport.write("PONG :a\r\n")
+    transport.writeSequence(["PONG :b\r\n", "PONG :c\r\n"])
+    transport.loseConnection()
+    assert transport.written == 27
+    assert transport.disconnecting
@@ -0,0 +1,111 @@
+import pytest
+
+from twisted.internet.task import Clock
+
+from crow2.irc.sendqueue import SendQueue
+
+def make_queue(**keywords):
+    clock = Clock()
+    writes = []
+    queue = SendQueue(writes.append, clock, **keywords)
+    return queue, clock, writes
+
+def test_coalesce():
+    queue, clock, writes = make_queue(rate=None)
+    for i in range(20):
+        queue.send("PRIVMSG #channel :%d" % i)
+    assert queue.depth == 20
+    assert not writes
+
+    clock.advance(0)
+    assert writes == [["PRIVMSG #channel :%d" % i for i in range(20)]]
+    assert queue.depth == 0
+    assert queue.sent == 20
+    assert queue.writes == 1
+
+def test_token_bucket():
+    queue, clock, writes = make_queue(burst=3, rate=2.0)
+    for i in range(6):
+        queue.send("NOTICE nick :%d" % i)
+    clock.advance(0)
+    assert writes == [["NOTICE nick :0", "NOTICE nick :1", "NOTICE nick :2"]]
+
+    clock.advance(0.4)
+    assert len(writes) == 1
+    clock.advance(0.1)
+    assert writes[1:] == [["NOTICE nick :3"]]
+    clock.advance(0.5)
+    assert writes[2:] == [["NOTICE nick :4"]]
+    clock.advance(0.5)
+    assert writes[3:] == [["NOTICE nick :5"]]
+    assert not clock.getDelayedCalls()
+
+    # idle time refills the bucket, but only up to the burst size
+    clock.advance(60)
+    for i in range(5):
+        queue.send("NOTICE nick :%d" % i)
+    clock.advance(0)
+    assert len(writes[4]) == 3
+    assert queue.depth == 2
+
+def test_priorities():
+    queue, clock, writes = make_queue(burst=2, rate=1.0)
+    queue.send("PRIVMSG #a :first")
+    queue.send("PRIVMSG #a :second")
+    queue.send("@label=1 PONG :server")
+    queue.send("PRIVMSG #a :urgent", priority=0)
+    assert queue.depths() == [2, 2]
+    clock.advance(0)
+    assert writes == [["@label=1 PONG :server", "PRIVMSG #a :urgent"]]
+    clock.advance(1)
+    assert writes[1:] == [["PRIVMSG #a :first"]]
+
+def test_limit():
+    queue, clock, writes = make_queue(burst=10, limit=3, priorities={"PONG": 0, "MODE": 2})
+    queue.send("PRIVMSG #a :1")
+    queue.send("MODE #a +o nick")
+    queue.send("PRIVMSG #a :2")
+    # the newest line of the lowest priority makes room
+    queue.send("PONG :server")
+    assert queue.dropped == 1
+    # a line that would be the first to go is dropped itself
+    queue.send("MODE #a +v nick")
+    assert queue.dropped == 2
+    queue.send("PRIVMSG #a :3")
+    assert queue.dropped == 3
+    assert queue.depth == 3
+
+    clock.advance(0)
+    assert writes == [["PONG :server", "PRIVMSG #a :1", "PRIVMSG #a :2"]]
+
+def test_no_limit():
+    queue, clock, writes = make_queue(burst=10, limit=None)
+    for number in range(20):
+        queue.send("PRIVMSG #a :%d" % number)
+    assert queue.depth == 20
+    assert not queue.dropped
+
+@pytest.mark.parametrize("limit", [0, -1])
+def test_bad_limit(limit):
+    with pytest.raises(ValueError):
+        make_queue(limit=limit)
+
+def test_bad_priority():
+    queue, clock, writes = make_queue(priorities={"PONG": 0, "MODE": 2})
+    queue.send("MODE #a +o nick", priority=2)
+    for priority in [3, -1]:
+        with pytest.raises(ValueError):
+            queue.send("PRIVMSG #a :hi", priority=priority)
+    assert queue.depths() == [0, 0, 1]
+    with pytest.raises(ValueError):
+        make_queue(priorities={"PONG": -1})
+
+def test_clear():
+    queue, clock, writes = make_queue()
+    queue.send("PRIVMSG #a :1")
+    queue.send("PRIVMSG #a :2")
+    queue.clear()
+    assert queue.dropped == 2
+    assert queue.depth == 0
+    clock.advance(10)
+    assert not writes
@@ -0,0 +1,194 @@
+import pytest
+
+from crow2.irc.message import parse
+from crow2.irc.state import NetworkState
+
+def feed(state, *lines):
+    for line in lines:
+        state.handle(parse(line))
+
+@pytest.fixture
+def state():
+    state = NetworkState()
+    feed(state,
+        ":irc.example.net 001 crow2 :Welcome to the network",
+        ":irc.example.net 005 crow2 CASEMAPPING=rfc1459 PREFIX=(ohv)@%+ "
+                "CHANMODES=beI,k,l,imnpst :are supported by this server",
+        ":crow2!bot@bot.example.com JOIN #Channel",
+        ":irc.example.net 353 crow2 = #Channel :crow2 @Alice +bob %@Carol[away]",
+        ":irc.example.net 366 crow2 #Channel :End of /NAMES list.",
+    )
+    return state
+
+def test_join_and_names(state):
+    channel = state.channel("#CHANNEL")
+    assert channel.name == "#Channel"
+    assert sorted(user.nick for user in channel.users.values()) == [
+            "Alice", "Carol[away]", "bob", "crow2"]
+    assert state.is_on("alice", "#channel")
+    assert state.is_on("CAROL{AWAY}", "#channel")
+    assert not state.is_on("dave", "#channel")
+    assert not state.is_on("alice", "#elsewhere")
+
+    assert state.has_mode("#channel", "alice", "o")
+    assert not state.has_mode("#channel", "alice", "v")
+    assert state.has_mode("#channel", "bob", "v")
+    assert state.prefix("#channel", "carol[away]") == "@%"
+    assert state.prefix("#channel", "crow2") == ""
+    # only members with prefixes take up space
+    assert len(channel.prefixes) == 3
+
+    feed(state, ":dave!d@dave.example.com JOIN #channel")
+    assert state.user("Dave").host == "dave.example.com"
+
+def test_shared_users(state):
+    feed(state,
+        ":crow2!bot@bot.example.com JOIN #other",
+        ":irc.example.net 353 crow2 = #other :crow2 alice",
+    )
+    alice = state.user("alice")
+    assert state.channel("#other").users["alice"] is alice
+    assert state.channel("#channel").users["alice"] is alice
+    assert alice.channels == set([state.channel("#other"), state.channel("#channel")])
+
+def test_part_kick_quit(state):
+    feed(state, ":bob!b@host PART #channel :bye")
+    assert not state.is_on("bob", "#channel")
+    assert state.user("bob") is None
+
+    feed(state, ":Alice!a@host KICK #channel Carol[away] :out")
+    assert not state.is_on("carol[away]", "#channel")
+    assert state.prefix("#channel", "carol[away]") == ""
+
+    feed(state, ":alice!a@host QUIT :gone")
+    assert state.user("alice") is None
+    assert sorted(state.channel("#channel").users) == ["crow2"]
+
+    feed(state, ":crow2!bot@host PART #channel")
+    assert state.channel("#channel") is None
+    assert state.user("crow2") is not None
+
+def test_we_are_kicked(state):
+    feed(state, ":alice!a@host KICK #channel crow2 :out")
+    assert state.channels == {}
+    assert state.users.keys() == ["crow2"]
+
+def test_nick(state):
+    feed(state, ":alice!a@host NICK :Alicia")
+    alicia = state.user("alicia")
+    assert alicia.nick == "Alicia"
+    assert state.user("alice") is None
+    assert state.has_mode("#channel", "alicia", "o")
+    assert "alice" not in state.channel("#channel").prefixes
+
+    feed(state, ":crow2!bot@host NICK crow3")
+    assert state.nick == "crow3"
+    feed(state, ":crow3!bot@host PART #channel")
+    assert state.channel("#channel") is None
+
+def test_mode(state):
+    feed(state, ":alice!a@host MODE #channel +kov-o+lb key bob bob alice 10 *!*@spam")
+    assert state.has_mode("#channel", "bob", "o")
+    assert state.has_mode("#channel", "bob", "v")
+    assert not state.has_mode("#channel", "alice", "o")
+    assert "alice" not in state.channel("#channel").prefixes
+
+    # -l takes no parameter, so bob is still the target of -v
+    feed(state, ":alice!a@host MODE #channel -lv bob")
+    assert not state.has_mode("#channel", "bob", "v")
+    assert state.has_mode("#channel", "bob", "o")
+
+    feed(state, ":alice!a@host MODE crow2 +i")
+    feed(state, ":alice!a@host MODE #channel +o nobody")
+    assert state.user("nobody") is None
+
+def test_who(state):
+    feed(state, ":irc.example.net 352 crow2 #channel ~alice alice.example.com irc.example.net "
+                "Alice G*+ :3 Alice Liddell")
+    alice = state.user("alice")
+    assert alice.ident == "~alice"
+    assert alice.host == "alice.example.com"
+    assert alice.realname == "Alice Liddell"
+    assert alice.away
+    assert state.prefix("#channel", "alice") == "+"
+
+@pytest.mark.parametrize("multi_prefix", [False, True])
+def test_single_prefix_replies(state, multi_prefix):
+    if multi_prefix:
+        feed(state, ":irc.example.net CAP crow2 ACK :multi-prefix")
+    assert state.multi_prefix == multi_prefix
+    feed(state, ":alice!a@host MODE #channel +hv alice alice")
+    assert state.prefix("#channel", "alice") == "@%+"
+
+    # without multi-prefix, a reply shows only the highest prefix, which says nothing of lower ones
+    feed(state, ":irc.example.net 353 crow2 = #channel :@alice")
+    assert state.prefix("#channel", "alice") == ("@" if multi_prefix else "@%+")
+    feed(state, ":irc.example.net 352 crow2 #channel ~alice host irc alice H% :0 Alice")
+    assert state.prefix("#channel", "alice") == ("%" if multi_prefix else "%+")
+    feed(state, ":irc.example.net 353 crow2 = #channel :alice")
+    assert state.prefix("#channel", "alice") == ""
+
+    feed(state, ":irc.example.net CAP crow2 DEL :multi-prefix")
+    assert not state.multi_prefix
+
+def test_casemapping():
+    state = NetworkState()
+    feed(state,
+        ":irc.example.net 001 Crow[2] :Welcome",
+        ":Crow[2]!bot@host JOIN #Chan[1]",
+        ":irc.example.net 353 Crow[2] = #Chan[1] :Crow[2] Nick^",
+    )
+    assert state.is_on("nick~", "#chan{1}")
+    feed(state, ":irc.example.net 005 Crow[2] CASEMAPPING=ascii :are supported")
+    assert state.casemapping == "ascii"
+    assert not state.is_on("nick~", "#chan{1}")
+    assert state.is_on("NICK^", "#CHAN[1]")
+    feed(state, ":Crow[2]!bot@host PART #chan[1]")
+    assert state.channels == {}
+    assert state.users.keys() == ["crow[2]"]
+
+def test_extended_join(state):
+    feed(state, ":erin!e@host JOIN #channel erin_account :Erin E",
+                ":frank!f@host JOIN #channel * :Frank F")
+    assert state.user("erin").account == "erin_account"
+    assert state.user("erin").realname == "Erin E"
+    assert state.user("frank").account is None
+
+def test_userhost_in_names(state):
+    feed(state, ":irc.example.net 353 crow2 = #channel :@grace!g@grace.example.com")
+    grace = state.user("grace")
+    assert (grace.ident, grace.host) == ("g", "grace.example.com")
+    assert state.has_mode("#channel", "grace", "o")
+
+def test_bursts(state):
+    names = [parse(":irc.example.net 353 crow2 = #channel :@dave +erin"),
+             parse(":irc.example.net 353 crow2 = #channel :frank alice"),
+             parse(":irc.example.net 353 crow2 = #nowhere :ghost")]
+    state.handle_burst(parse(":irc.example.net 366 crow2 #channel :End"), names)
+    assert state.is_on("frank", "#channel")
+    assert state.has_mode("#channel", "dave", "o")
+    # alice lost her op
+    assert not state.has_mode("#channel", "alice", "o")
+    assert state.user("ghost") is None
+
+    state.whox_fields = "nfcuahtr"
+    assert state._whox_order == list("tcuhnfar")
+    who = [parse(":irc.example.net 352 crow2 #channel ~dave dave.example.com irc dave H@ :0 Dave"),
+           parse(":irc.example.net 354 crow2 42 #channel ~erin erin.example.com erin G+ erin_acct "
+                 ":Erin E"),
+           parse(":irc.example.net 354 crow2 42 #channel ~frank frank.example.com frank H 0 :F"),
+           parse(":irc.example.net 354 crow2 too few"),
+           parse(":irc.example.net 352 crow2 * ~out out.example.com irc stranger H :0 S")]
+    state.handle_burst(parse(":irc.example.net 315 crow2 #channel :End"), who)
+    dave, erin, frank = state.user("dave"), state.user("erin"), state.user("frank")
+    assert (dave.ident, dave.host, dave.realname, dave.away) == (
+            "~dave", "dave.example.com", "Dave", False)
+    assert (erin.ident, erin.account, erin.realname, erin.away) == (
+            "~erin", "erin_acct", "Erin E", True)
+    assert frank.account is None
+    assert state.prefix("#channel", "erin") == "+"
+    assert state.user("stranger") is None
+
+    # single replies work the same way
+    state.handle(parse(":irc.example.net 354 crow2 42 #channel ~h h.example.com harry H 0 :H"))
+    assert state.is_on("harry", "#channel")
@@ -1,3 +1,5 @@
+import os
+
 from crow2 import hook
 from crow2 import plugin
 from crow2 import util
@@ -34,15 +36,25 @@ class MainloopHook(object):
     __call__ = register
 
 class Main(object):
-    def __init__(self, hook, core, plugins):
+    def __init__(self, hook, core, plugins, cache_dir=None, lazy=False, preload_threads=0,
+                 startup_report=None):
         self.hook = hook
         self.hook.createhook("init")
         self.hook.createhook("deinit")
         self.hook.createhook("stopmainloop")
         self.hook.createhook("mainloop", hook_class=MainloopHook)
 
-        self.core_loader = plugin.Tracker(core)
-        self.plugin_loaders = [plugin.Tracker(package) for package in plugins]
+        self.startup_report = startup_report
+        self.profile = None
+        if startup_report is not None:
+            from crow2.startup import StartupProfile
+            self.profile = StartupProfile(hook)
+            self.profile.start()
+
+        options = dict(cache_dir=cache_dir, lazy=lazy, hook=hook, preload_threads=preload_threads,
+                       profile=self.profile)
+        self.core_loader = plugin.Tracker(core, **options)
+        self.plugin_loaders = [plugin.Tracker(package, **options) for package in plugins]
 
         self.load()
 
@@ -52,14 +64,28 @@ class Main(object):
             loader.load()
 
     def run(self):
-        self.hook._unlazy()
-        event = self.hook.init.fire(main=self)
+        if self.profile is None:
+            self.hook._unlazy()
+            event = self.hook.init.fire(main=self)
+        else:
+            try:
+                self.hook._unlazy(on_resolve=self.profile.replayed)
+                event = self.hook.init.fire(main=self)
+            finally:
+                # report what startup cost up to the failure too, if it failed
+                self.profile.stop()
+                self.profile.write(self.startup_report)
         self.hook.mainloop.fire(event, main=self)
         self.hook.deinit.fire(event, main=self)
 
     def quit(self, exitcode=0):
         self.hook.stopmainloop.fire(main=self, exitcode=exitcode)
 
+def user_cache_dir():
+    "crow2's directory in the user's cache directory ($XDG_CACHE_HOME, or ~/.cache)"
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "crow2")
+
 def scriptmain(sysargs=None):
     if sysargs is None:
         import sys
@@ -80,7 +106,21 @@ def scriptmain(sysargs=None):
     parser.add_argument("plugins", nargs="*",
             help="Plugin package-modules to load in addition to core-set "
                 "(can be specified multiple times)")
+    parser.add_argument("--cache", dest="cache_dir", action="store_const", const=user_cache_dir(),
+            help="Keep plugin manifests and bytecode in %s, to speed up startup" % user_cache_dir())
+    parser.add_argument("--cache-dir", metavar="DIR",
+            help="Keep plugin manifests and bytecode in DIR, to speed up startup")
+    parser.add_argument("--no-cache", dest="cache_dir", action="store_const", const=None,
+            help="Don't read or write plugin manifests and bytecode (the default)")
+    parser.add_argument("--lazy", action="store_true",
+            help="Don't load plugins listed in crow2_lazy until their hooks are used")
+    parser.add_argument("--preload-threads", type=int, default=0, metavar="N",
+            help="Read and compile the whole plugin tree with N threads before running any of it")
+    parser.add_argument("--startup-report", nargs="?", const="-", metavar="FILE",
+            help="Profile plugin loading and log a report once init is done, "
+                 "or write it to FILE as JSON; memory use needs tracemalloc, so is n/a on python 2")
     args = parser.parse_args(sysargs)
 
-    main = Main(hook, args.core, args.plugins)
+    main = Main(hook, args.core, args.plugins, cache_dir=args.cache_dir, lazy=args.lazy,
+                preload_threads=args.preload_threads, startup_report=args.startup_report)
     main.run()
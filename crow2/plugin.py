@@ -2,12 +2,32 @@
 Plugin loading/unloading utilities
 """
 
+import hashlib
 import imp
+import json
+import marshal
 import os
+import Queue
 import sys
+import threading
+import time
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir # backport for python 2
+    except ImportError:
+        scandir = None
+
+from twisted.python import log
 from twisted.python.reflect import namedAny, namedModule
 
+from crow2.events.exceptions import NotRegisteredError, CallListChanged
+from crow2.events import hook as hook_module
+from crow2.events.handlerclass import HookMethodProxy
+from crow2.events.hooktree import InstanceHook
+
 class AlreadyLoadedError(Exception): #TODO: these exceptions are duplicated in crow2.events
     "Trying to load when already loaded"
 
@@ -20,12 +40,353 @@ class LoadError(Exception):
 class LoadRedirectError(LoadError):
     "Load failed because the modules redirected unresolvably"
 
+class Manifest(object):
+    """
+    Record of what load() found for a plugin tree: the redirect chain of each module it loaded,
+    and the children it found by scanning package directories, along with the mtime and size of
+    every file and directory those came from. While none of them change, load() follows the
+    recorded chains and children instead of importing redirect modules and scanning directories.
+    If anything changed, the whole manifest is thrown away and rebuilt by the next load.
+    """
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.files = {}
+        self.valid = False
+        self.dirty = False
+
+    @classmethod
+    def for_module(cls, modulename, cache_dir):
+        "the manifest for a top-level plugin module, kept in a crow2 cache directory"
+        return cls(os.path.join(cache_dir, "manifests", modulename + ".json"))
+
+    def read(self):
+        "load the manifest from disk; returns whether it exists and is still current"
+        try:
+            with open(self.path) as reader:
+                data = json.load(reader)
+        except (IOError, ValueError):
+            return False
+        if data.get("version") != self.version:
+            return False
+        for path, stat in data["files"].items():
+            if _stat(path) != stat:
+                return False
+        self.entries = data["entries"]
+        self.files = data["files"]
+        self.valid = True
+        return True
+
+    def write(self):
+        "save the manifest if anything new was recorded; failing to save is not an error"
+        if not self.dirty:
+            return
+        data = {"version": self.version, "entries": self.entries, "files": self.files}
+        temp_path = self.path + ".tmp"
+        try:
+            directory = os.path.dirname(self.path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(temp_path, "w") as writer:
+                json.dump(data, writer, indent=1, sort_keys=True)
+            os.rename(temp_path, self.path)
+        except (IOError, OSError) as e:
+            log.msg("WARNING: unable to write plugin manifest %r: %s" % (self.path, e))
+        else:
+            self.dirty = False
+
+    def lookup(self, modulename):
+        "get the recorded entry for a module name, or None"
+        return self.entries.get(modulename)
+
+    def record(self, modulename, chain, scanned, modules, directories):
+        """
+        record how a module name was loaded
+
+        chain is the list of module names followed through crow2_module redirects; scanned is the
+        list of children found with listpackage(), or None if there was no directory scan; modules
+        and directories are what those came from
+        """
+        self.entries[modulename] = {"chain": chain, "scanned": scanned}
+        for module in modules:
+            path = _source_file(module)
+            if path is not None:
+                self.files[path] = _stat(path)
+        for directory in directories:
+            self.files[directory] = _stat(directory)
+        self.dirty = True
+
+def _stat(path):
+    "[mtime, size] of a path, or None if it doesn't exist"
+    try:
+        result = os.stat(path)
+    except OSError:
+        return None
+    return [result.st_mtime, result.st_size]
+
+def _source_file(module):
+    "the file a module was loaded from, preferring its source over compiled bytecode"
+    filename = getattr(module, "__file__", None)
+    if filename is None:
+        return None
+    base, extension = os.path.splitext(filename)
+    if extension in (".pyc", ".pyo") and os.path.exists(base + ".py"):
+        return base + ".py"
+    return filename
+
+class BytecodeCache(object):
+    """
+    Import hook which keeps compiled plugin code in a directory of its own instead of in .pyc
+    files next to the source.
+
+    load() turns off writing bytecode so that stale .pyc files never outlive or shadow the
+    source they came from, which matters when reloading. Cache entries here are keyed by a hash
+    of the source and its path, so a changed source file is simply a cache miss, and code is
+    never loaded for a source that doesn't exist any more.
+
+    Only modules that load() asks for are handled; anything they import goes through the
+    normal import machinery. For each module handled, stats has (hit, seconds_saved), where
+    seconds_saved is how long compiling took when the entry was made minus how long loading it
+    took this time.
+
+    Entries for sources that changed or went away are only removed by prune(), which removes
+    everything not loaded since the cache was created; Tracker.load() calls it whenever its
+    manifest is rebuilt, giving each tracker a directory of its own.
+
+    If directory is None, nothing is cached and code is just compiled. With threads, load()
+    has the whole tree under the top pluginset read and compiled concurrently by preload()
+    before it imports anything below it, one module at a time.
+    """
+    def __init__(self, directory, threads=0):
+        self.directory = directory
+        self.threads = threads
+        self.expected = set()
+        self.stats = {}
+        self.used = set()
+        self.preloaded_count = 0
+        self.preload_time = 0.0
+        self._found = {}
+        self._preloaded = {}
+
+    def __enter__(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        sys.meta_path.remove(self)
+        for fullname in self._preloaded: # compiled, but never imported
+            self.stats.pop(fullname, None)
+        self.expected.clear()
+        self._found.clear()
+        self._preloaded.clear()
+
+    def expect(self, modulename):
+        "handle modulename if it's imported while we're installed"
+        self.expected.add(modulename)
+
+    def find_module(self, fullname, path=None):
+        if fullname not in self.expected:
+            return None
+        if fullname in self._preloaded:
+            return self
+        found = self._find(fullname, path)
+        if found is None:
+            return None
+        self._found[fullname] = found
+        return self
+
+    def _find(self, fullname, path):
+        "(source filename, package directory or None) for a module we can handle, or None"
+        try:
+            openfile, pathname, (suffix, mode, kind) = imp.find_module(fullname.rpartition(".")[2], path)
+        except ImportError:
+            return None
+        if openfile is not None:
+            openfile.close()
+        if kind == imp.PY_SOURCE:
+            return pathname, None
+        elif kind == imp.PKG_DIRECTORY and os.path.isfile(os.path.join(pathname, "__init__.py")):
+            return os.path.join(pathname, "__init__.py"), pathname
+        return None
+
+    def _read(self, fullname, filename):
+        with open(filename, "rU") as reader:
+            source = reader.read()
+        return self._get_code(fullname, filename, source)
+
+    def preload(self, parent_name, path, child_names):
+        """
+        Read and compile the children of a pluginset, and everything in the packages among
+        them, concurrently, ahead of load() importing them. The tree is walked first, so the
+        workers share one queue of every module in it; module code is still executed one at a
+        time, in load()'s order, and whatever load() doesn't end up importing is dropped.
+        """
+        if not self.threads:
+            return
+        queue = Queue.Queue()
+        self._walk(parent_name, path, child_names, queue)
+        if queue.empty():
+            return
+        compiled = []
+        def worker():
+            while True:
+                try:
+                    fullname, filename, package_path = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    code = self._read(fullname, filename)
+                except Exception:
+                    continue # importing it will raise the error again, where it can be handled
+                self._preloaded[fullname] = (filename, package_path, code)
+                compiled.append(fullname)
+
+        started = time.time()
+        threads = [threading.Thread(target=worker) for i in range(min(self.threads, queue.qsize()))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.preload_time += time.time() - started
+        self.preloaded_count += len(compiled)
+
+    def _walk(self, parent_name, path, child_names, queue):
+        "put (module name, source filename, package directory or None) for the tree on queue"
+        for child_name in sorted(child_names):
+            fullname = parent_name + "." + child_name
+            if fullname in sys.modules or fullname in self._preloaded:
+                continue
+            found = self._find(fullname, path)
+            if found is None:
+                continue
+            filename, package_path = found
+            queue.put((fullname, filename, package_path))
+            if package_path is not None:
+                self._walk(fullname, [package_path], listpackage([package_path]), queue)
+
+    def load_module(self, fullname):
+        try:
+            filename, package_path, code = self._preloaded.pop(fullname)
+        except KeyError:
+            filename, package_path = self._found.pop(fullname)
+            code = self._read(fullname, filename)
+
+        existing = sys.modules.get(fullname)
+        module = existing if existing is not None else imp.new_module(fullname)
+        module.__file__ = filename
+        module.__loader__ = self
+        if package_path is not None:
+            module.__path__ = [package_path]
+            module.__package__ = fullname
+        else:
+            module.__package__ = fullname.rpartition(".")[0] or None
+        sys.modules[fullname] = module
+        try:
+            exec code in module.__dict__
+        except:
+            if existing is None:
+                sys.modules.pop(fullname, None)
+            raise
+        return sys.modules[fullname]
+
+    def _get_code(self, fullname, filename, source):
+        if self.directory is None:
+            self.stats[fullname] = (False, 0.0)
+            return compile(source, filename, "exec", 0, True)
+
+        key = hashlib.sha1(filename + "\0" + source).hexdigest()
+        cache_path = os.path.join(self.directory, key)
+        self.used.add(key)
+
+        started = time.time()
+        try:
+            with open(cache_path, "rb") as reader:
+                if reader.read(4) == imp.get_magic():
+                    compile_time, code = marshal.load(reader)
+                    self.stats[fullname] = (True, compile_time - (time.time() - started))
+                    return code
+        except (IOError, EOFError, ValueError, TypeError):
+            pass
+
+        started = time.time()
+        code = compile(source, filename, "exec", 0, True)
+        compile_time = time.time() - started
+        self.stats[fullname] = (False, 0.0)
+
+        temp_path = cache_path + ".tmp"
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(temp_path, "wb") as writer:
+                writer.write(imp.get_magic())
+                marshal.dump((compile_time, code), writer)
+            os.rename(temp_path, cache_path)
+        except (IOError, OSError) as e:
+            log.msg("WARNING: unable to write bytecode cache %r: %s" % (cache_path, e))
+        return code
+
+    def prune(self):
+        "remove the cache entries that weren't loaded or written since we were created"
+        try:
+            names = os.listdir(self.directory)
+        except (OSError, TypeError):
+            return
+        for name in names:
+            if name not in self.used:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError as e:
+                    log.msg("WARNING: unable to remove stale bytecode %r: %s" % (name, e))
+
+    def report(self):
+        "describe the time saved for each plugin loaded from the cache, and by preloading"
+        hits = sorted((name, saved) for name, (hit, saved) in self.stats.items() if hit)
+        if not hits:
+            result = "bytecode cache: no hits (%d compiled)" % len(self.stats)
+        else:
+            result = "bytecode cache: saved %.1fms over %d plugins (%s)" % (
+                    sum(saved for name, saved in hits) * 1000, len(hits),
+                    ", ".join("%s: %.2fms" % (name, saved * 1000) for name, saved in hits))
+        if self.threads:
+            # the wall time taken; how much that saves is measured by benchmarks/bench_preload.py
+            result += "; preloaded %d modules with %d threads in %.1fms" % (
+                    self.preloaded_count, self.threads, self.preload_time * 1000)
+        return result
+
+def _import(modulename, current_module_name, bytecode=None, profile=None):
+    "import a plugin module, turning import errors into LoadErrors"
+    if bytecode is not None:
+        bytecode.expect(current_module_name)
+    try:
+        if profile is not None:
+            with profile.importing(current_module_name):
+                return namedModule(current_module_name)
+        return namedModule(current_module_name)
+    except ImportError as e:
+        # TODO: need to ensure this maintains context - it will eat any errors from bad code in plugins if it doesn't!
+        import traceback
+        formatted = traceback.format_exc()
+        raise LoadError("Failed to load %r (%r): %s" % (modulename, current_module_name, formatted))
+
 # TODO: while not tired, verify this code and then remove excessive comments
 # TODO: this needs a sprinkle of zen
-def load(modulename, is_pluginset=True, filter_children=None, seen=None):
+def load(modulename, is_pluginset=True, filter_children=None, seen=None, manifest=None,
+         bytecode=None, lazy=None, profile=None):
     """
     Load a module as whatever it looks like. Heavily commented due to being tired-code.
+
+    If a Manifest is passed, recorded redirect chains and directory scans are used where
+    available, and anything that had to be discovered is recorded in it. If an installed
+    BytecodeCache is passed, it is used for the modules that get loaded.
+
+    If lazy is passed, children which a pluginset lists in its crow2_lazy dict are not loaded;
+    instead lazy(child_module_name, targets) is called with the targets listed for them.
+
+    If a crow2.startup.StartupProfile is passed, each import is measured with it.
     """
+    is_top = seen is None
     if seen is None:
         seen = set()
 
@@ -34,78 +395,349 @@ def load(modulename, is_pluginset=True, filter_children=None, seen=None):
     old_dont_write_bytecode = sys.dont_write_bytecode # if someone else messed with dont_write_bytecode (such as this function when recursing) store it so it can be restored
     sys.dont_write_bytecode = True # this is for reloading reasons - allowing python to write bytecode results in nastyness when reloading (though maybe it's pointless because reloading is so nasty anyway)
     try:
-        current_module_name = modulename # copy the reference so that we don't lose sight of what we're loading as we resove references
-        while current_module_name: # while we still have a reference to resolve
-            if current_module_name in seen: # this needs to be inside the while loop so that the reference resolution gets checked
-                raise LoadRedirectError("Going in loop")  # if the module we're being asked to load has already been loaded by this recursion, then we're going in a loop
+        entry = manifest.lookup(modulename) if manifest is not None else None
+        loaded_modules = [] # every module whose file went into resolving this name, for the manifest
 
-            try:
-                module = namedModule(current_module_name)
-            except ImportError as e:
-                # TODO: need to ensure this maintains context - it will eat any errors from bad code in plugins if it doesn't!
-                import traceback
-                formatted = traceback.format_exc()
-                raise LoadError("Failed to load %r (%r): %s" % (modulename, current_module_name, formatted))
-
-            seen.add(current_module_name) # immediately mark the name as seen
-
-            # save the name we ended up on so we can use it to find children
-            # (this is overwritten each run of the loop, so it will only stick on the last run)
-            final_module_name = current_module_name 
-            try:
-                current_module_name = module.crow2_module # try to grab a next name
-            except AttributeError:
-                current_module_name = None # no name? exit the loop
+        if entry is not None:
+            # the manifest knows where the redirects end up, so only the last module needs importing
+            chain = entry["chain"]
+            for current_module_name in chain:
+                if current_module_name in seen:
+                    raise LoadRedirectError("Going in loop")
+                seen.add(current_module_name)
+            final_module_name = chain[-1]
+            module = _import(modulename, final_module_name, bytecode, profile)
+        else:
+            chain = []
+            current_module_name = modulename # copy the reference so that we don't lose sight of what we're loading as we resove references
+            while current_module_name: # while we still have a reference to resolve
+                if current_module_name in seen: # this needs to be inside the while loop so that the reference resolution gets checked
+                    raise LoadRedirectError("Going in loop")  # if the module we're being asked to load has already been loaded by this recursion, then we're going in a loop
+
+                module = _import(modulename, current_module_name, bytecode, profile)
+
+                seen.add(current_module_name) # immediately mark the name as seen
+                chain.append(current_module_name)
+                loaded_modules.append(module)
+
+                # save the name we ended up on so we can use it to find children
+                # (this is overwritten each run of the loop, so it will only stick on the last run)
+                final_module_name = current_module_name 
+                try:
+                    current_module_name = module.crow2_module # try to grab a next name
+                except AttributeError:
+                    current_module_name = None # no name? exit the loop
 
         found.add(module) # we found a module, so add it to the results
 
-        load_children = getattr(module, "crow2_load_children_override", is_pluginset)
-        if not load_children:
-            return found
+        scanned = None # children found by scanning the package directory, if we had to
+        scanned_paths = ()
+        try:
+            load_children = getattr(module, "crow2_load_children_override", is_pluginset)
+            if not load_children:
+                return found
 
-        loadable = getattr(module, "crow2_pluginset", False)
-        if load_children and not loadable:
-            raise LoadError(("tried to load non-pluginset module %r as a pluginset\n"
-                            "perhaps try setting crow2_pluginset in your __init__.py") % final_module_name)
+            loadable = getattr(module, "crow2_pluginset", False)
+            if load_children and not loadable:
+                raise LoadError(("tried to load non-pluginset module %r as a pluginset\n"
+                                "perhaps try setting crow2_pluginset in your __init__.py") % final_module_name)
 
-        # if the module has an override for the child filtering, use that
-        children = getattr(module, "crow2_children", filter_children)
+            # if the module has an override for the child filtering, use that
+            children = getattr(module, "crow2_children", filter_children)
 
-        if not children: # loadchildren's True but no children were specified, autodetect them
-            try:
-                module_path = module.__path__ # try to get the path,
-            except AttributeError:
-                return found                  # but if it's not there then there are no children to be had, so just return what was found so far
-            children = listpackage(module_path) # get the names from the path
+            if not children: # loadchildren's True but no children were specified, autodetect them
+                try:
+                    module_path = module.__path__ # try to get the path,
+                except AttributeError:
+                    return found                  # but if it's not there then there are no children to be had, so just return what was found so far
+                if entry is not None and entry["scanned"] is not None:
+                    children = entry["scanned"] # the manifest already scanned the directory for us
+                else:
+                    children = listpackage(module_path) # get the names from the path
+                    scanned = sorted(children)
+                    scanned_paths = module_path
+        finally:
+            if manifest is not None and entry is None:
+                manifest.record(modulename, chain, scanned, loaded_modules, scanned_paths)
 
+        if isinstance(children, (set, frozenset)):
+            children = sorted(children) # keep the load order the same from run to run
+        lazy_children = getattr(module, "crow2_lazy", {}) if lazy is not None else {}
+        if bytecode is not None and is_top and hasattr(module, "__path__"):
+            # the whole tree, before importing any of it; pluginsets further down are covered
+            bytecode.preload(final_module_name, module.__path__,
+                             [child_name for child_name in children if child_name not in lazy_children])
         for child_name in children:
+            if child_name in lazy_children: # the child said what it's for, so it can wait until it's needed
+                lazy(final_module_name + "." + child_name, lazy_children[child_name])
+                continue
             # recurse to load the child - this is a big part of why we track seen; if the tree gets too complex, there could be whacky collisions. Errors should never pass silently!
-            child_set = load(final_module_name + "." + child_name, False, None, seen)
+            child_set = load(final_module_name + "." + child_name, False, None, seen, manifest, bytecode, lazy, profile)
             found.update(child_set) # okay, we have the child loaded, along with any children it may have explicitly specified for itself. add its results to our own (this could be a list currently because seen ensures uniqueness)
 
         return found # and lastly, we have done all we know how to to load this silly module. finish off by returning our handiwork
     finally:
         sys.dont_write_bytecode = old_dont_write_bytecode 
 
+class LazyPlugin(object):
+    """
+    Stand-in for a plugin which hasn't been imported yet.
+
+    A pluginset lists the hooks each lazy child serves in its crow2_lazy dict, eg:
+
+        crow2_lazy = {
+            "weather": ["irc.command:weather", "irc.command:forecast"],
+            "logger": ["connection.made"]
+        }
+
+    A target is a dotted path to a hook in the hook tree, or a path to a HookMultiplexer and the
+    name of one of its children, separated by a colon. InstanceHooks (eg connection.received)
+    can't be targets, as their handlers are registered per instance. A stub handler is
+    registered for each target; the first time one of them is called, all of the stubs are
+    unregistered, the plugin is loaded, and the rest of the event is handled by the hook's new
+    call list, so the plugin's handlers run in their sorted places. If loading fails, the stubs
+    are registered again and the next event tries again.
+    """
+    def __init__(self, tracker, modulename, targets):
+        self.tracker = tracker
+        self.modulename = modulename
+        self.active = False
+        self.stubs = []
+
+        for target in targets:
+            path, colon, name = target.partition(":")
+            if isinstance(self._resolve(path), InstanceHook):
+                raise LoadError("%s: lazy target %r is an InstanceHook, which can't be lazy"
+                                % (modulename, target))
+            self.stubs.append((path, name or None, self._make_stub(path, name or None)))
+        self._register_stubs()
+
+    def _register_stubs(self):
+        for path, name, stub in self.stubs:
+            hook = self._resolve(path)
+            if name is not None:
+                hook(name=name)(stub)
+            else:
+                hook(stub)
+
+    def _make_stub(self, path, name):
+        def stub(event):
+            self._dispatch(path, name, stub, event)
+        stub.__name__ = "lazy_" + self.modulename.replace(".", "_")
+        return stub
+
+    def _resolve(self, path):
+        hook = self.tracker.hook
+        for attribute in path.split("."):
+            hook = getattr(hook, attribute)
+        return hook
+
+    def _dispatch(self, path, name, stub, event):
+        calling_hook = event.calling_hook
+        calllist = calling_hook._get_call_list()
+        self.activate()
+
+        # a multiplexer frees a child when its last handler (our stub) goes away
+        hook = self._resolve(path)
+        if name is not None:
+            hook = hook._children.get(name)
+            if hook is None:
+                return
+        if hook is not calling_hook:
+            hook._fire_call_list(hook._get_call_list(), event)
+            return
+        # everything up to the stub has run; the hook carries on with the rest of its new list
+        ran = set(calllist[:calllist.index(stub) + 1]) if stub in calllist else set()
+        raise CallListChanged([handler for handler in hook._get_call_list() if handler not in ran])
+
+    def activate(self):
+        "load the plugin now, if it hasn't been already; the stubs come back if loading fails"
+        if self.active:
+            return
+        self.active = True
+        # before loading, since a CommandHook takes only one main handler per command
+        for path, name, stub in self.stubs:
+            try:
+                self._resolve(path).unregister(stub)
+            except NotRegisteredError:
+                pass
+        try:
+            self.tracker._activate(self)
+        except:
+            self.active = False
+            self._register_stubs()
+            raise
+
+    def __repr__(self):
+        return "<plugin.LazyPlugin(%r)%s>" % (self.modulename, " active" if self.active else "")
+
+def _serves_live_instance(handler):
+    """
+    whether a registered handler belongs to live instances of a handlerclass: a method proxy
+    which instances are bound to, or a method bound to a tracked instance
+    """
+    if isinstance(handler, HookMethodProxy):
+        return bool(handler.classes_registered)
+    instance = getattr(handler, "im_self", None)
+    classreg = getattr(type(instance), "_crow2_classreg", None)
+    return classreg is not None and id(instance) in classreg.instances
+
 class Tracker(object):
     """
     manages a plugin package - loads submodules as packages
+
+    In lazy mode, children that are listed in their pluginset's crow2_lazy are not loaded until
+    one of the hooks they serve is fired; see LazyPlugin
     """
-    def __init__(self, modulename, description="plugins"):
+    def __init__(self, modulename, description="plugins", cache_dir=None, lazy=False, hook=None,
+                 preload_threads=0, profile=None):
         self.modulename = modulename
         self.loaded = False
         self.plugins = set()
         self.description = description
+        self.cache_dir = cache_dir
+        self.bytecode_stats = {}
+        self.preload_threads = preload_threads
+        self.load_time = None
+        self.profile = profile
+        self.stamps = {}
+        self.lazy = lazy
+        self.lazy_plugins = {}
+        if hook is None:
+            from crow2 import hook
+        self.hook = hook
 
     def load(self):
         """
         Load all modules in the package that this packageloader is in charge of
+
+        If we have a cache directory, a Manifest of the plugin tree and a BytecodeCache of its
+        modules are kept there to speed up the next load
         """
         if self.loaded:
             raise AlreadyLoadedError(repr(self))
-        self.plugins = load(self.modulename)
+        lazy = self._defer if self.lazy else None
+        manifest = bytecode = None
+        if self.cache_dir is not None:
+            manifest = Manifest.for_module(self.modulename, self.cache_dir)
+            manifest.read()
+            bytecode = BytecodeCache(os.path.join(self.cache_dir, "bytecode", self.modulename),
+                                     self.preload_threads)
+        elif self.preload_threads:
+            bytecode = BytecodeCache(None, self.preload_threads)
+
+        started = time.time()
+        if bytecode is None:
+            self.plugins = load(self.modulename, lazy=lazy, profile=self.profile)
+        else:
+            with bytecode:
+                self.plugins = load(self.modulename, manifest=manifest, bytecode=bytecode, lazy=lazy,
+                                    profile=self.profile)
+            self.bytecode_stats = bytecode.stats
+        self.load_time = time.time() - started
+        if manifest is not None:
+            if manifest.dirty:
+                # something was added, changed or deleted; drop the code of what's gone
+                bytecode.prune()
+            manifest.write()
+
+        log.msg("%s: loaded %d plugins in %.1fms" % (self.modulename, len(self.plugins), self.load_time * 1000))
+        if bytecode is not None:
+            log.msg("%s: %s" % (self.modulename, bytecode.report()))
+        self._stamp(self.plugins)
         self.loaded = True
 
+    def _stamp(self, modules):
+        "remember the state of modules' source files, to tell later whether they changed"
+        for module in modules:
+            self.stamps[module.__name__] = _stat(_source_file(module))
+
+    def changed(self):
+        "the loaded plugin modules whose source files changed or went away since loading"
+        return sorted((module for module in self.plugins
+                        if _stat(_source_file(module)) != self.stamps.get(module.__name__)),
+                      key=lambda module: module.__name__)
+
+    def reload(self):
+        """
+        Reload the plugin modules whose source changed since they were loaded, leaving the rest
+        alone. Everything a changed module had registered on any hook, as found by
+        crow2.events.hook.owners(), is unregistered, and the module is run again to register its
+        new handlers. A module whose source was deleted is just dropped.
+
+        Live instances of a changed module's handlerclasses keep running the old code: their
+        method registrations are left alone (see _serves_live_instance), and are unregistered
+        as usual once the last of them is deleted. Only new instances use the new code.
+
+        Each affected hook is sorted once, after all the changed modules have been reloaded.
+
+        Returns the names of the modules reloaded or dropped.
+        """
+        if not self.loaded:
+            raise NotLoadedError(repr(self))
+        if getattr(self.hook, "_lazy", False):
+            raise LoadError("%r: cannot reload before the hook tree has stopped being lazy" % self)
+
+        changed = self.changed()
+        affected = set()
+        for module in changed:
+            name = module.__name__
+            for hook in hook_module.owners(name):
+                affected.add(hook)
+                for handler in list(hook.owned_handlers().get(name, ())):
+                    if not _serves_live_instance(handler):
+                        hook.unregister(handler)
+
+        failures = []
+        old_dont_write_bytecode = sys.dont_write_bytecode # see load()
+        sys.dont_write_bytecode = True
+        try:
+            for module in changed:
+                name = module.__name__
+                if self.stamps.get(name) is not None and _stat(_source_file(module)) is None:
+                    self.plugins.discard(module)
+                    sys.modules.pop(name, None)
+                    del self.stamps[name]
+                    continue
+                try:
+                    reload(module)
+                except Exception:
+                    import traceback
+                    failures.append("%s: %s" % (name, traceback.format_exc()))
+                self._stamp([module])
+                affected.update(hook_module.owners(name))
+        finally:
+            sys.dont_write_bytecode = old_dont_write_bytecode
+
+        for hook in affected:
+            hook._get_call_list()
+
+        names = [module.__name__ for module in changed]
+        log.msg("%s: reloaded %s" % (self.modulename, ", ".join(names) or "nothing"))
+        if failures:
+            raise LoadError("Failed to reload:\n%s" % "\n".join(failures))
+        return names
+
+    def _defer(self, modulename, targets):
+        self.lazy_plugins[modulename] = LazyPlugin(self, modulename, targets)
+
+    def _activate(self, lazy_plugin):
+        started = time.time()
+        try:
+            modules = load(lazy_plugin.modulename, False)
+        except:
+            # take back whatever it registered before failing, so that retrying starts clean
+            name = lazy_plugin.modulename
+            for hook in hook_module.owners(name):
+                for handler in list(hook.owned_handlers().get(name, ())):
+                    hook.unregister(handler)
+            raise
+        del self.lazy_plugins[lazy_plugin.modulename]
+        self.plugins.update(modules)
+        self._stamp(modules)
+        log.msg("%s: activated lazy plugin %s in %.1fms" % (
+                self.modulename, lazy_plugin.modulename, (time.time() - started) * 1000))
+
     '''
     def unload(self):
         """
@@ -129,19 +761,119 @@ class Tracker(object):
         return "Plugin Tracker %r: %s" % (self.description, self.modulename)
 
 suffixes = set([info[0] for info in imp.get_suffixes()])
+_init_names = frozenset("__init__" + suffix for suffix in suffixes)
+
+def _index_suffixes(suffixes):
+    """
+    Map each extension to the suffixes ending in it, longest first, so that matching a filename
+    is a dict lookup and then usually a single endswith (foomodule.so is foo, not foomodule)
+    """
+    index = {}
+    for suffix in sorted(suffixes, key=len, reverse=True):
+        index.setdefault(os.path.splitext(suffix)[1] or suffix, []).append(suffix)
+    return dict((extension, tuple(candidates)) for extension, candidates in index.items())
+_suffix_index = _index_suffixes(suffixes)
+
+def _match_suffix(filename):
+    "the module name of a filename that has a module suffix, or None"
+    for suffix in _suffix_index.get(filename[filename.rfind("."):], ()):
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return None
+
 def getmodulename(parent, filename):
     """
     Get the name of a module based on it's filename
     """
-    for suffix in suffixes:
-        if filename.endswith(suffix):
-            return filename[:-len(suffix)] # remove ending
+    name = _match_suffix(filename)
+    if name is not None:
+        return name # remove ending
+    elif _is_package(os.path.join(parent, filename)):
+        return filename
+
+def _is_package(path):
+    "whether path is a directory with an __init__ module, checked with a single listdir"
+    try:
+        return not _init_names.isdisjoint(os.listdir(path))
+    except OSError:
+        return False
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+# directory -> (mtime, module names, {non-package subdirectory: mtime}) from the last scan of it
+_listing_cache = {}
+
+# how close together two changes to a directory can be and still leave it with the same mtime,
+# on the coarsest filesystems we expect to load from (FAT's is 2 seconds)
+_mtime_resolution = 2.0
+
+def _scan(directory):
+    """
+    Find the module names in a directory, looking at each entry once. scandir tells us which
+    entries are directories without a stat where the platform allows; only directories get
+    looked into, to see whether they're packages.
+    """
+    names = set()
+    index = _suffix_index
+    directories = []
+    # the suffix matching is _match_suffix, inlined since this is run for every file
+    if scandir is not None:
+        for entry in scandir(directory):
+            filename = entry.name
+            for suffix in index.get(filename[filename.rfind("."):], ()):
+                if filename.endswith(suffix):
+                    names.add(filename[:-len(suffix)])
+                    break
+            else:
+                if entry.is_dir():
+                    directories.append(entry.path)
     else:
-        fullpath = os.path.join(parent, filename)
-        if os.path.isdir(fullpath):
-            for suffix in suffixes:
-                if os.path.exists(os.path.join(fullpath, "__init__"+suffix)):
-                    return filename
+        for filename in os.listdir(directory):
+            for suffix in index.get(filename[filename.rfind("."):], ()):
+                if filename.endswith(suffix):
+                    names.add(filename[:-len(suffix)])
+                    break
+            else:
+                path = os.path.join(directory, filename)
+                if os.path.isdir(path):
+                    directories.append(path)
+
+    # directories that aren't packages could become packages without changing our mtime
+    plain_directories = {}
+    for path in directories:
+        if _is_package(path):
+            names.add(os.path.basename(path))
+        else:
+            plain_directories[path] = _mtime(path)
+    names.discard("__init__")
+    names.discard("")
+    return names, plain_directories
+
+def _list_directory(directory):
+    """
+    The module names in a directory, rescanning it only if it or one of its non-package
+    subdirectories has been modified since the last scan
+
+    A scan is only cached if those mtimes are older than it by more than _mtime_resolution;
+    otherwise a change made just after the scan could leave them as they were.
+    """
+    mtime = _mtime(directory)
+    cached = _listing_cache.get(directory)
+    if cached is not None and cached[0] == mtime and all(_mtime(path) == subdirectory_mtime
+                                for path, subdirectory_mtime in cached[2].items()):
+        return cached[1]
+    settled = time.time() - _mtime_resolution
+    names, plain_directories = _scan(directory)
+    if mtime is not None and mtime < settled and all(subdirectory_mtime is not None and
+                        subdirectory_mtime < settled for subdirectory_mtime in plain_directories.values()):
+        _listing_cache[directory] = (mtime, frozenset(names), plain_directories)
+    else:
+        _listing_cache.pop(directory, None)
+    return names
 
 def listpackage(path):
     """
@@ -149,12 +881,5 @@ def listpackage(path):
     """
     results = set()
     for package_path in path:
-        files = os.listdir(package_path)
-
-        for filename in files:
-            modulename = getmodulename(package_path, filename)
-            if not modulename or modulename == "__init__":
-                continue
-            results.add(modulename)
-
+        results.update(_list_directory(package_path))
     return results
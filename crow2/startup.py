@@ -0,0 +1,148 @@
+"""
+Startup profiling: where the time and memory go while plugins load and register
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+from twisted.python import log
+
+try:
+    import tracemalloc
+except ImportError: # python 2 without the pytracemalloc backport
+    tracemalloc = None
+
+from crow2.events import hook as hook_module
+
+class PluginStats(object):
+    """
+    What one plugin module cost at startup. registrations is the number of calls the plugin
+    made on a lazy hook tree, which is None if the tree wasn't lazy; memory is None if
+    tracemalloc isn't available.
+    """
+    def __init__(self, modulename):
+        self.modulename = modulename
+        self.import_time = 0.0
+        self.registrations = None
+        self.replay_time = 0.0
+        self.memory = None
+
+    def as_dict(self):
+        return {
+            "import_time": self.import_time,
+            "registrations": self.registrations,
+            "replay_time": self.replay_time,
+            "memory": self.memory
+        }
+
+class StartupProfile(object):
+    """
+    Collects per-plugin import time, registration count, lazy-call replay time and memory, and
+    the time each hook spends sorting its call list, between start() and stop().
+
+    plugin.load() reports imports with importing(); pass replayed as the on_resolve of
+    HookTree._unlazy to time lazy calls. Registrations are counted on hooktree.
+    """
+    def __init__(self, hooktree=None):
+        self.hooktree = hooktree
+        self.plugins = {}
+        self.order = []
+        self.sorts = {}
+        self.running = False
+        self._started_tracemalloc = False
+
+    def start(self):
+        self.running = True
+        hook_module.sort_timer = self.sorted
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def stop(self):
+        self.running = False
+        if hook_module.sort_timer == self.sorted:
+            hook_module.sort_timer = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _stats(self, modulename):
+        try:
+            return self.plugins[modulename]
+        except KeyError:
+            stats = self.plugins[modulename] = PluginStats(modulename)
+            self.order.append(modulename)
+            return stats
+
+    @contextmanager
+    def importing(self, modulename):
+        """
+        Measure the import of a plugin module. Calls it makes on our hooktree while it is lazy
+        are marked as the plugin's, so replay time can be attributed to it.
+        """
+        stats = self._stats(modulename)
+        hooktree = self.hooktree
+        lazy = getattr(hooktree, "_lazy", False)
+        if lazy:
+            calls_before = len(hooktree._lazy_calls)
+            specials_before = len(hooktree._lazy_specials)
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            memory_before = tracemalloc.get_traced_memory()[0]
+        else:
+            memory_before = None
+        started = time.time()
+        try:
+            yield stats
+        finally:
+            stats.import_time += time.time() - started
+            if memory_before is not None:
+                stats.memory = (stats.memory or 0) + tracemalloc.get_traced_memory()[0] - memory_before
+            if lazy:
+                new_calls = hooktree._lazy_calls[calls_before:] + hooktree._lazy_specials[specials_before:]
+                for lazycall in new_calls:
+                    lazycall.crow2_owner = modulename
+                stats.registrations = (stats.registrations or 0) + len(new_calls)
+
+    def replayed(self, lazycall, seconds):
+        "add the time taken to resolve a lazy call to the plugin which made it"
+        owner = getattr(lazycall, "crow2_owner", None)
+        if owner is not None:
+            self._stats(owner).replay_time += seconds
+
+    def sorted(self, hook, seconds):
+        name = getattr(hook, "_name", None) or repr(hook)
+        count, total = self.sorts.get(name, (0, 0.0))
+        self.sorts[name] = (count + 1, total + seconds)
+
+    def as_dict(self):
+        return {
+            "plugins": dict((name, stats.as_dict()) for name, stats in self.plugins.items()),
+            "hooks": dict((name, {"sorts": count, "sort_time": total})
+                          for name, (count, total) in self.sorts.items())
+        }
+
+    def format(self):
+        "the report as a human-readable table, plugins in load order and hooks slowest first"
+        width = max([40] + [len(name) for name in self.order] + [len(name) for name in self.sorts])
+        lines = ["startup report",
+                 "%-*s %10s %10s %13s %12s" % (width, "plugin", "import", "replay", "registrations", "memory")]
+        for name in self.order:
+            stats = self.plugins[name]
+            lines.append("%-*s %8.2fms %8.2fms %13s %12s" % (width, name, stats.import_time * 1000,
+                    stats.replay_time * 1000, "n/a" if stats.registrations is None else stats.registrations,
+                    "n/a" if stats.memory is None else "%.1fKiB" % (stats.memory / 1024.0)))
+        if tracemalloc is None:
+            lines.append("(memory is n/a: tracemalloc is python 3.4+, or the pytracemalloc backport)")
+        lines.append("%-*s %10s %10s" % (width, "hook", "sorting", "sorts"))
+        for name, (count, total) in sorted(self.sorts.items(), key=lambda item: -item[1][1]):
+            lines.append("%-*s %8.2fms %10d" % (width, name, total * 1000, count))
+        return "\n".join(lines)
+
+    def write(self, destination):
+        "log the report if destination is '-', otherwise write it to that path as JSON"
+        if destination == "-":
+            log.msg(self.format())
+        else:
+            with open(destination, "w") as writer:
+                json.dump(self.as_dict(), writer, indent=1, sort_keys=True)
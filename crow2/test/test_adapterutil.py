@@ -1,5 +1,5 @@
 import pytest
-from zope.interface import Interface, implementer
+from zope.interface import Interface, implementer, alsoProvides, classImplements
 from zope.interface.adapter import AdapterRegistry
 
 from crow2 import adapterutil
@@ -112,3 +112,107 @@ def test_deregister_infer(monkeypatch):
 
     with pytest.raises(TypeError):
         ITo(from_obj)
+
+def test_cache(monkeypatch):
+    monkeypatch.setattr(adapterutil, "registry", AdapterRegistry())
+
+    class IFrom(Interface):
+        pass
+    @implementer(IFrom)
+    class From(object):
+        pass
+    class ITo(Interface):
+        pass
+    class To(object):
+        def __init__(self, from_obj):
+            self.from_obj = from_obj
+
+    adapterutil.register(To, From, ITo)
+    cache = adapterutil.cache
+    assert not cache.entries
+    hits, misses = cache.hits, cache.misses
+
+    assert isinstance(ITo(From()), To)
+    assert (cache.hits - hits, cache.misses - misses) == (0, 1)
+    assert isinstance(ITo(From()), To)
+    assert (cache.hits - hits, cache.misses - misses) == (1, 1)
+    assert "entries" in repr(cache)
+
+    # failed lookups are cached too
+    class Unrelated(object):
+        pass
+    for x in range(2):
+        with pytest.raises(TypeError):
+            ITo(Unrelated())
+    assert (cache.hits - hits, cache.misses - misses) == (2, 2)
+
+    adapterutil.deregister(To, From, ITo)
+    assert not cache.entries
+    with pytest.raises(TypeError):
+        ITo(From())
+
+def test_cache_instance_declarations(monkeypatch):
+    monkeypatch.setattr(adapterutil, "registry", AdapterRegistry())
+
+    class IFrom(Interface):
+        pass
+    class ITo(Interface):
+        pass
+    class Plain(object):
+        pass
+
+    @implementer(ITo)
+    def convert(obj):
+        return "converted"
+    adapterutil.register(convert, IFrom)
+
+    with pytest.raises(TypeError):
+        ITo(Plain())
+
+    # an instance of the same type which provides IFrom itself must not hit the cached failure
+    special = Plain()
+    alsoProvides(special, IFrom)
+    assert ITo(special) == "converted"
+
+    # objects which already provide the target are returned as-is
+    target = Plain()
+    alsoProvides(target, ITo)
+    assert ITo(target) is target
+
+def test_cache_declarations_changed(monkeypatch):
+    monkeypatch.setattr(adapterutil, "registry", AdapterRegistry())
+
+    class IFrom(Interface):
+        pass
+    class ITo(Interface):
+        pass
+    class Plain(object):
+        pass
+
+    @implementer(ITo)
+    def convert(obj):
+        return "converted"
+    adapterutil.register(convert, IFrom)
+
+    with pytest.raises(TypeError):
+        ITo(Plain())
+
+    # declaring the class afterwards must not hit the cached failure
+    classImplements(Plain, IFrom)
+    assert ITo(Plain()) == "converted"
+
+def test_cache_registry_swap(monkeypatch):
+    class ITo(Interface):
+        pass
+
+    @implementer(ITo)
+    def convert(obj):
+        return str(obj)
+
+    monkeypatch.setattr(adapterutil, "registry", AdapterRegistry())
+    adapterutil.register(convert, int)
+    assert ITo(5) == "5"
+
+    monkeypatch.setattr(adapterutil, "registry", AdapterRegistry())
+    with pytest.raises(TypeError):
+        ITo(5)
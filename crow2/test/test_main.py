@@ -1,4 +1,5 @@
 import functools
+import os
 
 import pytest
 
@@ -10,8 +11,9 @@ import crow2.plugin
 import crow2.main
 
 class DummyTracker(object):
-    def __init__(self, trackers, name):
+    def __init__(self, trackers, name, **options):
         self.name = name
+        self.options = options
         self.loaded = False
         trackers.append(self)
 
@@ -33,6 +35,7 @@ def test_main(monkeypatch):
     assert pluginset.name == "pluginset"
     assert pluginset2.name == "pluginset2"
     assert all(tracker.loaded for tracker in trackers)
+    assert all(tracker.options["hook"] is hook for tracker in trackers)
 
     mainloop_exitcodes = []
 
@@ -64,6 +67,26 @@ def test_main(monkeypatch):
 
     main.run()
     assert main.deinit_ran
+
+def test_main_profile_init_fails(monkeypatch, tmpdir):
+    hook = HookTree(start_lazy=True)
+    monkeypatch.setattr(crow2.plugin, "Tracker", functools.partial(DummyTracker, []))
+    report = tmpdir.join("report.json")
+    main = crow2.main.Main(hook, "core", [], startup_report=str(report))
+
+    class SentinelException(Exception):
+        pass
+
+    @hook.init
+    def init(event):
+        raise SentinelException()
+
+    with pytest.raises(SentinelException):
+        main.run()
+    # still reported, and no longer profiling
+    assert report.check()
+    assert not main.profile.running
+    assert crow2.events.hook.sort_timer is None
     
 class TestMainloopHook(object):
     def test_double_register(self):
@@ -110,8 +133,13 @@ class TestMainloopHook(object):
             hook.fire()
 
 class DummyMain(object):
-    def __init__(self, dummymains, hook, core, plugins):
+    def __init__(self, dummymains, hook, core, plugins, cache_dir=None, lazy=False,
+                 preload_threads=0, startup_report=None):
         dummymains.append(self)
+        self.startup_report = startup_report
+        self.preload_threads = preload_threads
+        self.cache_dir = cache_dir
+        self.lazy = lazy
         self.hook = hook
         self.core = core
         self.plugins = plugins
@@ -130,8 +158,39 @@ class TestScriptmain(object):
         assert dummymains[0].hook == crow2.hook
         assert dummymains[0].core == "core"
         assert dummymains[0].plugins == ["pluginset", "pluginset2"]
+        assert dummymains[0].cache_dir == None
         assert dummymains[0].was_run
 
+    def test_cache_dir(self, monkeypatch):
+        dummymains = []
+        monkeypatch.setattr(crow2.main, "Main", functools.partial(DummyMain, dummymains))
+
+        crow2.main.scriptmain(["--cache-dir", "somewhere", "core"])
+        crow2.main.scriptmain(["--no-cache", "--lazy", "--preload-threads", "4", "core"])
+        crow2.main.scriptmain(["--cache", "core"])
+        assert dummymains[0].cache_dir == "somewhere"
+        assert not dummymains[0].lazy
+        assert dummymains[1].cache_dir == None
+        assert dummymains[1].lazy
+        assert dummymains[1].preload_threads == 4
+        assert dummymains[2].cache_dir == crow2.main.user_cache_dir()
+
+    def test_user_cache_dir(self, monkeypatch):
+        monkeypatch.setenv("XDG_CACHE_HOME", "/somewhere/cache")
+        assert crow2.main.user_cache_dir() == os.path.join("/somewhere/cache", "crow2")
+        monkeypatch.delenv("XDG_CACHE_HOME")
+        monkeypatch.setenv("HOME", "/home/someone")
+        assert crow2.main.user_cache_dir() == os.path.join("/home/someone", ".cache", "crow2")
+
+    def test_startup_report(self, monkeypatch):
+        dummymains = []
+        monkeypatch.setattr(crow2.main, "Main", functools.partial(DummyMain, dummymains))
+
+        crow2.main.scriptmain(["core"])
+        crow2.main.scriptmain(["--startup-report", "--", "core"])
+        crow2.main.scriptmain(["--startup-report", "report.json", "core"])
+        assert [main.startup_report for main in dummymains] == [None, "-", "report.json"]
+
     def test_argparse_missing(self, monkeypatch):
         import sys
         monkeypatch.setitem(sys.modules, "argparse", None)
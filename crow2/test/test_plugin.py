@@ -6,9 +6,12 @@ okay to leave them loaded because none of them change any state or are reference
 again, but just fyi.
 """
 import sys
+import time
 
 import pytest
 
+from crow2.events.hooktree import HookTree
+from crow2.events.hook import Hook
 import crow2.plugin
 import crow2.test.setup
 
@@ -96,6 +99,48 @@ def test_listpackage(tmpdir, monkeypatch):
 
     assert result == children
 
+@pytest.mark.parametrize("use_scandir", [True, False])
+def test_listpackage_cache(tmpdir, monkeypatch, use_scandir):
+    if not use_scandir:
+        monkeypatch.setattr(crow2.plugin, "scandir", None)
+    packagepath = tmpdir.join("test_listpackage_cache")
+    packagepath.mkdir()
+    create_empty(packagepath.join("__init__.py"))
+    create_empty(packagepath.join("child.py"))
+    create_empty(packagepath.join("child.pyc"))
+    packagepath.join("subpackage").mkdir()
+    create_empty(packagepath.join("subpackage", "__init__.py"))
+    packagepath.join("data").mkdir()
+    path = [str(packagepath)]
+
+    # a scan in the same tick as the last change isn't cached: a change after it wouldn't show
+    mtime = int(time.time())
+    packagepath.setmtime(mtime)
+    assert crow2.plugin.listpackage(path) == set(["child", "subpackage"])
+    create_empty(packagepath.join("same_tick.py"))
+    packagepath.setmtime(mtime)
+    assert crow2.plugin.listpackage(path) == set(["child", "subpackage", "same_tick"])
+    packagepath.join("same_tick.py").remove()
+
+    packagepath.setmtime(mtime - 60)
+    packagepath.join("data").setmtime(mtime - 60)
+    assert crow2.plugin.listpackage(path) == set(["child", "subpackage"])
+
+    def scan(directory):
+        raise AssertionError("should not rescan %r" % directory)
+    with monkeypatch.context() as patch:
+        patch.setattr(crow2.plugin, "_scan", scan)
+        assert crow2.plugin.listpackage(path) == set(["child", "subpackage"])
+
+    # a directory becoming a package doesn't change the mtime of its parent
+    create_empty(packagepath.join("data", "__init__.py"))
+    packagepath.join("data").setmtime(packagepath.join("data").mtime() + 10)
+    assert crow2.plugin.listpackage(path) == set(["child", "subpackage", "data"])
+
+    create_empty(packagepath.join("added.py"))
+    packagepath.setmtime(packagepath.mtime() + 10)
+    assert crow2.plugin.listpackage(path) == set(["child", "subpackage", "data", "added"])
+
 def test_getmodulename(tmpdir):
     """
     Test that getmodulename can accurately determine a module's python name from
@@ -133,3 +178,392 @@ def test_getmodulename(tmpdir):
     for name in emptyfiles:
         result = crow2.plugin.getmodulename(str(packagepath), name)
         assert result == None
+
+class TestManifest(object):
+    def make_package(self, tmpdir, monkeypatch, name):
+        # each test gets its own names, since the modules stay in sys.modules
+        packagepath = tmpdir.join(name)
+        packagepath.mkdir()
+        packagepath.join("__init__.py").write("crow2_pluginset = True\n")
+        packagepath.join("child_a.py").write("")
+        packagepath.join("redirect.py").write("crow2_module = %r\n" % (name + "_target"))
+        tmpdir.join(name + "_target.py").write("")
+        monkeypatch.syspath_prepend(tmpdir)
+        return packagepath
+
+    def names(self, tracker):
+        return set(plugin.__name__ for plugin in tracker.plugins)
+
+    def test_manifest(self, tmpdir, monkeypatch):
+        packagepath = self.make_package(tmpdir, monkeypatch, "test_manifest_package")
+        cache_dir = str(tmpdir.join("cache"))
+        expected = set(("test_manifest_package", "test_manifest_package.child_a",
+                        "test_manifest_package_target"))
+
+        tracker = crow2.plugin.Tracker("test_manifest_package", cache_dir=cache_dir)
+        tracker.load()
+        assert self.names(tracker) == expected
+        assert tmpdir.join("cache", "manifests", "test_manifest_package.json").check()
+
+        # with a current manifest, neither the directory scan nor the redirect are needed
+        def listpackage(path):
+            raise AssertionError("should not scan %r" % path)
+        monkeypatch.setattr(crow2.plugin, "listpackage", listpackage)
+        monkeypatch.delitem(sys.modules, "test_manifest_package.redirect")
+
+        tracker = crow2.plugin.Tracker("test_manifest_package", cache_dir=cache_dir)
+        tracker.load()
+        assert self.names(tracker) == expected
+        assert "test_manifest_package.redirect" not in sys.modules
+        monkeypatch.undo()
+
+    def test_stale_manifest(self, tmpdir, monkeypatch):
+        packagepath = self.make_package(tmpdir, monkeypatch, "test_stale_manifest_package")
+        cache_dir = str(tmpdir.join("cache"))
+
+        tracker = crow2.plugin.Tracker("test_stale_manifest_package", cache_dir=cache_dir)
+        tracker.load()
+
+        packagepath.join("child_b.py").write("")
+        packagepath.setmtime(packagepath.mtime() + 10)
+
+        manifest = crow2.plugin.Manifest.for_module("test_stale_manifest_package", cache_dir)
+        assert not manifest.read()
+
+        tracker = crow2.plugin.Tracker("test_stale_manifest_package", cache_dir=cache_dir)
+        tracker.load()
+        assert "test_stale_manifest_package.child_b" in self.names(tracker)
+        assert crow2.plugin.Manifest.for_module("test_stale_manifest_package", cache_dir).read()
+
+    def test_loop_with_manifest(self, tmpdir):
+        cache_dir = str(tmpdir.join("cache"))
+        for attempt in range(2):
+            tracker = crow2.plugin.Tracker(plugin_targets + "redirect_loop_0", cache_dir=cache_dir)
+            with pytest.raises(crow2.plugin.LoadRedirectError):
+                tracker.load()
+
+    def test_unwritable(self, tmpdir):
+        blocker = tmpdir.join("cache")
+        blocker.write("not a directory")
+        tracker = crow2.plugin.Tracker(plugin_targets + "simple_module", cache_dir=str(blocker))
+        tracker.load()
+        assert len(tracker.plugins) == 1
+
+class TestBytecodeCache(object):
+    def test_cache(self, tmpdir, monkeypatch):
+        packagepath = tmpdir.join("test_bytecode_package")
+        packagepath.mkdir()
+        packagepath.join("__init__.py").write("crow2_pluginset = True\n")
+        packagepath.join("child.py").write("value = 1\n")
+        monkeypatch.syspath_prepend(tmpdir)
+        cache_dir = str(tmpdir.join("cache"))
+
+        def load():
+            for name in ("test_bytecode_package", "test_bytecode_package.child"):
+                monkeypatch.delitem(sys.modules, name, raising=False)
+            tracker = crow2.plugin.Tracker("test_bytecode_package", cache_dir=cache_dir)
+            tracker.load()
+            return tracker
+
+        tracker = load()
+        assert tracker.bytecode_stats == {
+            "test_bytecode_package": (False, 0.0),
+            "test_bytecode_package.child": (False, 0.0)
+        }
+        entries = tmpdir.join("cache", "bytecode", "test_bytecode_package")
+        assert len(entries.listdir()) == 2
+
+        tracker = load()
+        assert all(hit for hit, saved in tracker.bytecode_stats.values())
+        child = sys.modules["test_bytecode_package.child"]
+        assert child.value == 1
+        assert child.__file__ == str(packagepath.join("child.py"))
+        assert sys.modules["test_bytecode_package"].__path__ == [str(packagepath)]
+
+        # changed source is a miss, and nothing was written next to the source
+        packagepath.join("child.py").write("value = 2\n")
+        tracker = load()
+        assert tracker.bytecode_stats["test_bytecode_package.child"] == (False, 0.0)
+        assert tracker.bytecode_stats["test_bytecode_package"][0]
+        assert sys.modules["test_bytecode_package.child"].value == 2
+        assert not packagepath.listdir("*.pyc")
+        # and the entry for the old source is gone
+        assert len(entries.listdir()) == 2
+
+        packagepath.join("child.py").remove()
+        tracker = load()
+        assert list(tracker.bytecode_stats) == ["test_bytecode_package"]
+        assert len(entries.listdir()) == 1
+
+    def test_report(self):
+        bytecode = crow2.plugin.BytecodeCache(None)
+        assert bytecode.report() == "bytecode cache: no hits (0 compiled)"
+        bytecode.stats = {"a": (True, 0.002), "b": (False, 0.0), "c": (True, 0.001)}
+        assert bytecode.report() == "bytecode cache: saved 3.0ms over 2 plugins (a: 2.00ms, c: 1.00ms)"
+
+    def test_broken_module(self, tmpdir):
+        with crow2.plugin.BytecodeCache(str(tmpdir)) as bytecode:
+            with pytest.raises(crow2.plugin.LoadError):
+                crow2.plugin.load(plugin_targets + "broken_module", bytecode=bytecode)
+        assert plugin_targets + "broken_module" not in sys.modules
+        assert bytecode not in sys.meta_path
+
+@pytest.mark.parametrize("first", ["made", "command"])
+def test_lazy_plugin(tmpdir, monkeypatch, first):
+    # separate names per run, since the modules stay in sys.modules
+    hooksname = "test_lazy_hooks_" + first
+    packagename = "test_lazy_package_" + first
+    tmpdir.join(hooksname + ".py").write(
+        "from crow2.events.hooktree import HookTree, HookMultiplexer, CommandHook\n"
+        "hooks = HookTree()\n"
+        "hooks.createhook('made')\n"
+        "hooks.addhook('command', HookMultiplexer(hook_class=CommandHook))\n")
+    packagepath = tmpdir.join(packagename)
+    packagepath.mkdir()
+    packagepath.join("__init__.py").write(
+        "crow2_pluginset = True\n"
+        "crow2_lazy = {'greeter': ['command:greet', 'made']}\n")
+    packagepath.join("greeter.py").write(
+        "from %s import hooks\n"
+        "calls = []\n"
+        "@hooks.command(name='greet')\n"
+        "def greet(event):\n"
+        "    calls.append(('greet', event.value))\n"
+        "@hooks.made\n"
+        "def made(event):\n"
+        "    calls.append(('made', event.value))\n" % hooksname)
+    packagepath.join("eager.py").write("")
+    monkeypatch.syspath_prepend(tmpdir)
+    hooks = __import__(hooksname).hooks
+
+    tracker = crow2.plugin.Tracker(packagename, lazy=True, hook=hooks)
+    tracker.load()
+    assert set(tracker.lazy_plugins) == set([packagename + ".greeter"])
+    assert packagename + ".eager" in sys.modules
+    assert packagename + ".greeter" not in sys.modules
+
+    other_calls = []
+    @hooks.made
+    def other(event):
+        other_calls.append(event.value)
+
+    if first == "made":
+        hooks.made.fire(value=1)
+    else:
+        hooks.command.fire(name="greet", value=1)
+    greeter = sys.modules[packagename + ".greeter"]
+    assert greeter in tracker.plugins
+    assert not tracker.lazy_plugins
+    assert greeter.calls == [(first.replace("command", "greet"), 1)]
+    assert other_calls == ([1] if first == "made" else [])
+
+    hooks.command.fire(name="greet", value=2)
+    hooks.made.fire(value=3)
+    assert greeter.calls[1:] == [("greet", 2), ("made", 3)]
+    assert other_calls[-1] == 3
+
+@pytest.mark.parametrize("use_cache", [False, True])
+def test_preload(tmpdir, monkeypatch, use_cache):
+    packagename = "test_preload_package_%d" % use_cache
+    packagepath = tmpdir.join(packagename)
+    packagepath.mkdir()
+    packagepath.join("__init__.py").write("crow2_pluginset = True\norder = []\n")
+    children = ["child_%s" % letter for letter in "dbeac"]
+    for child in children:
+        packagepath.join(child + ".py").write(
+                "from %s import order\norder.append(__name__)\n" % packagename)
+    monkeypatch.syspath_prepend(tmpdir)
+
+    cache_dir = str(tmpdir.join("cache")) if use_cache else None
+    tracker = crow2.plugin.Tracker(packagename, cache_dir=cache_dir, preload_threads=3)
+    tracker.load()
+
+    order = sys.modules[packagename].order
+    assert order == [packagename + "." + child for child in sorted(children)]
+    assert len(tracker.plugins) == 6
+    assert set(tracker.bytecode_stats) == set(order + [packagename])
+    assert tracker.load_time is not None
+
+def test_preload_count(tmpdir):
+    packagepath = tmpdir.join("test_preload_count_package")
+    packagepath.mkdir()
+    children = ["child_%d" % number for number in range(20)]
+    for child in children:
+        packagepath.join(child + ".py").write("value = 1\n")
+    subpackage = packagepath.join("nested")
+    subpackage.mkdir()
+    subpackage.join("__init__.py").write("")
+    subpackage.join("deeper.py").write("value = 2\n")
+    packagepath.join("broken.py").write("def (\n")
+
+    bytecode = crow2.plugin.BytecodeCache(None, threads=4)
+    bytecode.preload("test_preload_count_package", [str(packagepath)],
+                     children + ["nested", "broken", "missing"])
+    # the whole tree is preloaded at once, including what's in packages further down
+    assert bytecode.preloaded_count == len(children) + 2
+    assert "test_preload_count_package.nested.deeper" in bytecode._preloaded
+    assert "test_preload_count_package.broken" not in bytecode._preloaded
+    assert bytecode.preload_time > 0
+
+def test_preload_report():
+    bytecode = crow2.plugin.BytecodeCache(None, threads=4)
+    bytecode.preloaded_count = 8
+    bytecode.preload_time = 0.010
+    assert bytecode.report() == ("bytecode cache: no hits (0 compiled); preloaded 8 modules with 4 "
+            "threads in 10.0ms")
+
+def test_lazy_plugin_order_and_failure(tmpdir, monkeypatch):
+    tmpdir.join("test_lazy_order_hooks.py").write(
+        "from crow2.events.hooktree import HookTree, InstanceHook\n"
+        "hooks = HookTree()\n"
+        "hooks.createhook('made')\n"
+        "hooks.addhook('received', InstanceHook())\n"
+        "calls = []\n"
+        "broken = [True]\n")
+    packagepath = tmpdir.join("test_lazy_order_package")
+    packagepath.mkdir()
+    packagepath.join("__init__.py").write(
+        "crow2_pluginset = True\n"
+        "crow2_lazy = {'plugin': ['made']}\n")
+    packagepath.join("plugin.py").write(
+        "from test_lazy_order_hooks import hooks, calls, broken\n"
+        "@hooks.made(after='test_lazy_order_hooks.late')\n"
+        "def made(event):\n"
+        "    calls.append('plugin')\n"
+        "if broken[0]:\n"
+        "    raise ValueError('not yet')\n")
+    monkeypatch.syspath_prepend(tmpdir)
+    import test_lazy_order_hooks as hooks_module
+    hooks = hooks_module.hooks
+
+    tracker = crow2.plugin.Tracker("test_lazy_order_package", lazy=True, hook=hooks)
+    tracker.load()
+    def late(event):
+        hooks_module.calls.append("late")
+    late.__module__ = "test_lazy_order_hooks"
+    hooks.made.register(late)
+
+    # a plugin which fails to load keeps its stubs, and what it registered is taken back
+    with pytest.raises(ValueError):
+        hooks.made.fire()
+    assert "plugin" not in hooks_module.calls # late may or may not have run before the stub
+    assert "test_lazy_order_package.plugin" in tracker.lazy_plugins
+    del hooks_module.calls[:]
+
+    # once it loads, its handler runs in its sorted place, and nothing runs twice
+    hooks_module.broken[0] = False
+    hooks.made.fire()
+    assert hooks_module.calls == ["late", "plugin"]
+    assert not tracker.lazy_plugins
+    del hooks_module.calls[:]
+    hooks.made.fire()
+    assert hooks_module.calls == ["late", "plugin"]
+
+    with pytest.raises(crow2.plugin.LoadError):
+        crow2.plugin.LazyPlugin(tracker, "test_lazy_order_package.other", ["received"])
+
+def test_reload(tmpdir, monkeypatch):
+    tmpdir.join("test_reload_hooks.py").write(
+        "from crow2.events.hooktree import HookTree\n"
+        "hooks = HookTree()\n"
+        "hooks.createhook('greet')\n"
+        "calls = []\n")
+    packagepath = tmpdir.join("test_reload_package")
+    packagepath.mkdir()
+    packagepath.join("__init__.py").write("crow2_pluginset = True\n")
+    plugin_source = ("from test_reload_hooks import hooks, calls\n"
+                     "@hooks.greet%s\n"
+                     "def greet(event):\n"
+                     "    calls.append((__name__, %r))\n")
+    packagepath.join("changing.py").write(plugin_source % ("", "old"))
+    packagepath.join("unchanged.py").write(plugin_source % ("", "old"))
+    packagepath.join("deleted.py").write(plugin_source % ("", "old"))
+    monkeypatch.syspath_prepend(tmpdir)
+    import test_reload_hooks
+    hooks, calls = test_reload_hooks.hooks, test_reload_hooks.calls
+
+    tracker = crow2.plugin.Tracker("test_reload_package", hook=hooks)
+    tracker.load()
+    unchanged_greet = sys.modules["test_reload_package.unchanged"].greet
+    assert tracker.reload() == []
+
+    packagepath.join("changing.py").write(plugin_source % ("(before='test_reload_package.unchanged.greet')", "new"))
+    packagepath.join("deleted.py").remove()
+    assert tracker.reload() == ["test_reload_package.changing", "test_reload_package.deleted"]
+
+    assert "test_reload_package.deleted" not in sys.modules
+    assert sys.modules["test_reload_package.unchanged"].greet is unchanged_greet
+    assert hooks.greet.sorted_call_list is not None # sorted once, during the reload
+    hooks.greet.fire()
+    assert calls == [("test_reload_package.changing", "new"), ("test_reload_package.unchanged", "old")]
+    assert tracker.reload() == []
+
+def test_reload_live_instances(tmpdir, monkeypatch):
+    tmpdir.join("test_reload_instance_hooks.py").write(
+        "from crow2.events.hooktree import HookTree\n"
+        "hooks = HookTree()\n"
+        "hooks.createhook('connect')\n"
+        "hooks.createhook('tick')\n"
+        "calls = []\n"
+        "instances = []\n")
+    packagepath = tmpdir.join("test_reload_instance_package")
+    packagepath.mkdir()
+    packagepath.join("__init__.py").write("crow2_pluginset = True\n")
+    plugin_source = ("from crow2.events.handlerclass import handlerclass, handlermethod, instancehandler\n"
+                     "from test_reload_instance_hooks import hooks, calls, instances\n"
+                     "@handlerclass(hooks.connect)\n"
+                     "class Connection(object):\n"
+                     "    def __init__(self, event):\n"
+                     "        instances.append(self)\n"
+                     "    @handlermethod(hooks.tick)\n"
+                     "    def tick(self, event):\n"
+                     "        calls.append(('tick', %r))\n"
+                     "    @instancehandler.own\n"
+                     "    def own(self, event):\n"
+                     "        calls.append(('own', %r))\n")
+    packagepath.join("connection.py").write(plugin_source % ("old", "old"))
+    monkeypatch.syspath_prepend(tmpdir)
+    import test_reload_instance_hooks
+    hooks = test_reload_instance_hooks.hooks
+    calls = test_reload_instance_hooks.calls
+    instances = test_reload_instance_hooks.instances
+
+    tracker = crow2.plugin.Tracker("test_reload_instance_package", hook=hooks)
+    tracker.load()
+    old_hook = Hook()
+    hooks.connect.fire(own=old_hook)
+    old_instance, = instances
+
+    packagepath.join("connection.py").write(plugin_source % ("new", "new") + "\n")
+    assert tracker.reload() == ["test_reload_instance_package.connection"]
+
+    # the live instance is still connected, running the code it was created with
+    hooks.tick.fire()
+    old_hook.fire()
+    assert calls == [("tick", "old"), ("own", "old")]
+
+    # new instances are of the new class
+    del calls[:]
+    new_hook = Hook()
+    hooks.connect.fire(own=new_hook)
+    assert len(instances) == 2 and type(instances[1]) is not type(old_instance)
+    hooks.tick.fire()
+    new_hook.fire()
+    assert sorted(calls) == [("own", "new"), ("tick", "new"), ("tick", "old")]
+
+    del calls[:]
+    old_instance.delete()
+    hooks.tick.fire()
+    old_hook.fire()
+    assert calls == [("tick", "new")]
+    instances[1].delete()
+    hooks.tick.fire()
+    assert calls == [("tick", "new")]
+
+def test_reload_errors(tmpdir, monkeypatch):
+    tracker = crow2.plugin.Tracker(plugin_targets + "simple_module", hook=HookTree(start_lazy=True))
+    with pytest.raises(crow2.plugin.NotLoadedError):
+        tracker.reload()
+    tracker.load()
+    with pytest.raises(crow2.plugin.LoadError):
+        tracker.reload()
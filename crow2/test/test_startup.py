@@ -0,0 +1,68 @@
+import json
+
+from twisted.python import log
+
+from crow2.events.hooktree import HookTree
+from crow2.events import hook as hook_module
+from crow2.startup import StartupProfile
+import crow2.plugin
+import crow2.test.setup
+
+def test_profile(tmpdir):
+    tree = HookTree(start_lazy=True, name="tree")
+    profile = StartupProfile(tree)
+    profile.start()
+    assert hook_module.sort_timer == profile.sorted
+
+    with profile.importing("plugin_a"):
+        tree.createhook("greet")
+        @tree.greet
+        def handler(event):
+            pass
+    with profile.importing("plugin_b"):
+        pass
+
+    tree._unlazy(on_resolve=profile.replayed)
+    tree.greet.fire()
+    tree.greet.fire()
+    profile.stop()
+    assert hook_module.sort_timer is None
+
+    assert profile.order == ["plugin_a", "plugin_b"]
+    plugin_a = profile.plugins["plugin_a"]
+    assert plugin_a.registrations == 2
+    assert plugin_a.import_time > 0
+    assert plugin_a.replay_time > 0
+    assert profile.plugins["plugin_b"].registrations == 0
+    assert profile.plugins["plugin_b"].replay_time == 0
+    assert profile.sorts["tree.greet"][0] == 1
+
+    logged = []
+    log.addObserver(logged.append)
+    try:
+        profile.write("-")
+    finally:
+        log.removeObserver(logged.append)
+    out = log.textFromEventDict(logged[0])
+    assert "plugin_a" in out
+    assert "tree.greet" in out
+
+    path = tmpdir.join("report.json")
+    profile.write(str(path))
+    report = json.loads(path.read())
+    assert report["plugins"]["plugin_a"]["registrations"] == 2
+    assert report["hooks"]["tree.greet"]["sorts"] == 1
+
+def test_not_lazy():
+    tree = HookTree(name="tree")
+    profile = StartupProfile(tree)
+    with profile.importing("plugin"):
+        tree.createhook("greet")
+    assert profile.plugins["plugin"].registrations is None
+
+def test_tracker():
+    profile = StartupProfile()
+    modulename = "crow2.test.plugin_targets.explicit_children"
+    tracker = crow2.plugin.Tracker(modulename, profile=profile)
+    tracker.load()
+    assert set(profile.order) == set(plugin.__name__ for plugin in tracker.plugins)
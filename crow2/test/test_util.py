@@ -2,8 +2,16 @@
 Tests for the util module
 """
 # pylint: disable = W0612
+import copy
+import gc
+import json
+import pickle
+
 import crow2.util
 import pytest
+from zope.interface import Interface
+
+from crow2.test.util import Counter
 
 class TestParamdecorator(object):
     """
@@ -273,6 +281,98 @@ class TestParamdecorator(object):
 
         assert vars(partial) != vars(copied)
 
+    def test_partialiface(self):
+        """
+        Partials provide partialiface through their class, and copies keep providing it
+        """
+        class IPartial(Interface):
+            pass
+
+        @crow2.util.paramdecorator(partialiface=IPartial)
+        def decorator(func, argument):
+            "Decorator with a partial interface"
+            return func
+
+        partial = decorator(1)
+        assert IPartial.providedBy(partial)
+        assert "__provides__" not in vars(partial)
+        assert type(partial) is type(decorator(2))
+        assert IPartial.providedBy(partial.copy())
+
+        direct = crow2.util.DecoratorPartial(decorator.undecorated, 0, IPartial, False, (1,), {})
+        assert IPartial.providedBy(direct)
+
+    def test_include_call_type_partial_reuse(self):
+        """
+        Calling a partial doesn't modify the keywords it was created with
+        """
+        calls = []
+        @crow2.util.paramdecorator(include_call_type=True)
+        def decorator(func, **keywords):
+            "Decorator which records its call type"
+            calls.append(keywords)
+            return func
+
+        partial = decorator(key="value")
+        partial(lambda: None)
+        assert partial.keywords == {"key": "value"}
+        assert calls == [{"key": "value", "paramdecorator_simple_call": False}]
+
+    def test_metaclass_target(self):
+        """
+        Classes with a metaclass are still recognized as simple decoration targets
+        """
+        runs = []
+        @crow2.util.paramdecorator
+        def simple(clazz):
+            "Simple decorator"
+            runs.append(clazz)
+            return clazz
+
+        class Meta(type):
+            pass
+
+        class Target(object):
+            __metaclass__ = Meta
+
+        assert simple(Target) is Target
+        assert runs == [Target]
+
+    def test_argnames_cache(self):
+        """
+        Decorator functions which share a code object share their argument analysis
+        """
+        def make():
+            def decorator(func, argument):
+                "Decorator defined in a function"
+                return func
+            return decorator
+
+        first, second = make(), make()
+        crow2.util.paramdecorator(first)
+        assert crow2.util._argnames_cache[first.func_code] == ["func", "argument"]
+        assert crow2.util._argnames(second) is crow2.util._argnames_cache[first.func_code]
+
+    def test_weakmethod_target(self):
+        """
+        WeakMethods are recognized as decoration targets, like real bound methods
+        """
+        runs = []
+        @crow2.util.paramdecorator
+        def simple(func):
+            "Simple decorator"
+            runs.append(func)
+            return func
+
+        class Target(object):
+            def method(self):
+                should_never_run()
+        target = Target()
+
+        weak = crow2.util.WeakMethod(target.method)
+        assert simple(weak) is weak
+        assert runs == [weak]
+
 def test_attrdict():
     attrdict = crow2.util.AttrDict()
     attrdict.blah = 1
@@ -281,3 +381,108 @@ def test_attrdict():
     with pytest.raises(AttributeError):
         assert attrdict.doesnotexis
 
+def test_attrdict_storage():
+    attrdict = crow2.util.AttrDict({"a": 1}, b=2)
+    assert attrdict.a == 1
+    assert attrdict.b == 2
+
+    attrdict["c"] = 3
+    assert attrdict.c == 3
+    del attrdict.a
+    assert attrdict == {"b": 2, "c": 3}
+    assert getattr(attrdict, "a", None) is None
+
+def test_attrdict_method_collision():
+    attrdict = crow2.util.AttrDict(items=1, update=2)
+
+    # methods win over keys for attribute access, so dict users keep working
+    assert sorted(attrdict.items()) == [("items", 1), ("update", 2)]
+    attrdict.update(keys=3)
+    assert attrdict["keys"] == 3
+    assert json.loads(json.dumps(attrdict, indent=4)) == {"items": 1, "update": 2, "keys": 3}
+
+    with pytest.raises(crow2.util.KeyAttributeCollisionError):
+        attrdict.items = 4
+
+def test_attrdict_no_cycle():
+    attrdict = crow2.util.AttrDict(a=1)
+    attrdict.b = 2
+    assert attrdict not in gc.get_referents(attrdict)
+    assert not hasattr(attrdict, "__dict__")
+    with pytest.raises(KeyError):
+        attrdict["missing"]
+    with pytest.raises(AttributeError):
+        del attrdict.missing
+
+def test_attrdict_subclass_method():
+    class Cancellable(crow2.util.AttrDict):
+        __slots__ = ()
+        def cancel(self):
+            self.cancelled = True
+
+    attrdict = Cancellable(cancel="key")
+    attrdict.cancel()
+    assert attrdict.cancelled
+    with pytest.raises(crow2.util.KeyAttributeCollisionError):
+        attrdict.cancel = 1
+
+def test_attrdict_pickle_copy():
+    attrdict = crow2.util.AttrDict(a=1, nested=crow2.util.AttrDict(b=2))
+
+    for copied in (pickle.loads(pickle.dumps(attrdict, 2)), pickle.loads(pickle.dumps(attrdict)),
+                    copy.deepcopy(attrdict), copy.copy(attrdict)):
+        assert type(copied) is crow2.util.AttrDict
+        assert copied == attrdict
+        assert copied.nested.b == 2
+        copied.c = 3
+        assert copied["c"] == 3
+        assert "c" not in attrdict
+
+
+def test_weakmethod():
+    class Target(object):
+        def __init__(self):
+            self.counter = Counter()
+        def method(self, value):
+            self.counter.tick()
+            return value
+
+    collected = Counter()
+    target = Target()
+    weak = crow2.util.WeakMethod(target.method, lambda ref: collected.tick())
+    assert weak(5) == 5
+    assert target.counter.incremented(1)
+    assert weak.im_self is target
+    assert weak.__name__ == "method"
+    assert "method" in repr(weak)
+
+    same = crow2.util.WeakMethod(target.method)
+    other = crow2.util.WeakMethod(Target().method)
+    assert weak == same
+    assert hash(weak) == hash(same)
+    assert weak != other
+    assert weak != target.method
+
+    del target
+    gc.collect()
+    assert collected.incremented(1)
+    assert weak.im_self is None
+    assert weak(5) is None
+    assert weak == weak
+    assert weak != same
+
+def test_debug_calling_name(monkeypatch):
+    monkeypatch.setattr(crow2.util, "DEBUG", True)
+
+    def named():
+        return crow2.util.DEBUG_calling_name()
+
+    def skipped():
+        return crow2.util.DEBUG_calling_name(skip_modules=(__name__,))
+
+    assert named() == __name__ + ".test_debug_calling_name"
+    assert named() is named() # cached per code object
+    assert not skipped().startswith(__name__)
+
+    monkeypatch.setattr(crow2.util, "DEBUG", False)
+    assert "CROW2_DEBUG" in named()
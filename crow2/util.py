@@ -6,18 +6,72 @@ import warnings
 import inspect
 import functools
 import os
+import sys
+import types
+import weakref
 from collections import deque
 
-from twisted.python.reflect import fullyQualifiedName
-from zope.interface import alsoProvides
+from zope.interface import alsoProvides, implementer
+
+class WeakMethod(object):
+    """
+    Stand-in for a bound method which only holds a weak reference to the instance it's bound to;
+    calling it after the instance has been garbage collected does nothing
+    """
+    __slots__ = ("im_func", "im_class", "_ref", "_hash", "__weakref__")
+
+    def __init__(self, bound_method, callback=None):
+        instance = bound_method.im_self
+        self.im_func = bound_method.im_func
+        self.im_class = bound_method.im_class
+        self._ref = weakref.ref(instance, callback)
+        self._hash = hash((self.im_func, id(instance)))
+
+    @property
+    def im_self(self):
+        return self._ref()
+
+    @property
+    def __name__(self):
+        return self.im_func.__name__
+
+    def __call__(self, *args, **keywords):
+        instance = self._ref()
+        if instance is None:
+            return None
+        return self.im_func(instance, *args, **keywords)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(other) is not WeakMethod or self.im_func is not other.im_func:
+            return False
+        instance = self._ref()
+        return instance is not None and instance is other._ref()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        return "<WeakMethod %s.%s of %r>" % (self.im_class.__name__, self.im_func.__name__, self._ref())
 
 class DecoratorPartial(object):
+    """
+    A parameter decorator which has been given its arguments, and is waiting for its target
+    """
+    # set on the per-interface subclasses paramdecorator uses, which implement partialiface
+    # at the class level instead of needing alsoProvides() on every instance
+    _implemented_partialiface = None
+
     def __init__(self, func, argnum, partialiface, include_call_type, args, keywords):
         self.func = func
         self.args = args
         self.keywords = keywords
         self.argnum = argnum
-        if partialiface:
+        if partialiface and partialiface is not self._implemented_partialiface:
             alsoProvides(self, partialiface)
         self.partialiface = partialiface
         self.include_call_type = include_call_type
@@ -27,13 +81,50 @@ class DecoratorPartial(object):
         args = self.args[:self.argnum] + (target,) + self.args[self.argnum:]
         keywords = self.keywords
         if self.include_call_type:
-            keywords["paramdecorator_simple_call"] = False
+            keywords = dict(keywords, paramdecorator_simple_call=False)
 
         return self.func(*args, **keywords)
 
     def copy(self):
-        return DecoratorPartial(self.func, self.argnum, self.partialiface, self.include_call_type, self.args, self.keywords)
+        return type(self)(self.func, self.argnum, self.partialiface, self.include_call_type, self.args, self.keywords)
+
+_partial_classes = {}
 
+def _partial_class(partialiface):
+    """
+    Get a DecoratorPartial subclass which implements partialiface, so that creating partials doesn't
+    have to attach the interface to each instance
+    """
+    if not partialiface:
+        return DecoratorPartial
+    try:
+        return _partial_classes[partialiface]
+    except KeyError:
+        partial_class = type("DecoratorPartial", (DecoratorPartial,),
+                {"_implemented_partialiface": partialiface})
+        partial_class = implementer(partialiface)(partial_class)
+        _partial_classes[partialiface] = partial_class
+        return partial_class
+
+_argnames_cache = {}
+
+def _argnames(func):
+    """
+    Names of the positional arguments of func; cached by code object, since the same function body
+    can be defined many times over (methods of classes created in functions, for instance)
+    """
+    code = getattr(func, "func_code", None)
+    if code is None:
+        return inspect.getargspec(func).args
+    try:
+        return _argnames_cache[code]
+    except KeyError:
+        argnames = _argnames_cache[code] = inspect.getargspec(func).args
+        return argnames
+
+# types which paramdecorator treats as a decoration target when passed as the only argument;
+# metaclass instances are checked for separately
+_simple_target_types = frozenset((types.FunctionType, types.MethodType, types.ClassType, type, WeakMethod))
 
 def paramdecorator(decorator_func, argname=None, argnum=None, useself=None, partialiface=None, include_call_type=False):
     """
@@ -66,17 +157,17 @@ def paramdecorator(decorator_func, argname=None, argnum=None, useself=None, part
         argnum = 1 if useself else 0
 
     if argnum is None and argname is None:
-        args = inspect.getargspec(decorator_func).args
+        args = _argnames(decorator_func)
         if args[0] == "self":
             argnum = 1
         else:
             argnum = 0
         argname = args[argnum]
     elif argnum is not None and argname is None:
-        args = inspect.getargspec(decorator_func).args
+        args = _argnames(decorator_func)
         argname = args[argnum]
     elif argnum is None and argname is not None:
-        args = inspect.getargspec(decorator_func).args
+        args = _argnames(decorator_func)
         for index, name in enumerate(args):
             if name == argname:
                 argnum = index
@@ -89,30 +180,30 @@ def paramdecorator(decorator_func, argname=None, argnum=None, useself=None, part
  
     assert argnum is not None
 
-    makepartial = functools.partial(DecoratorPartial, decorator_func, argnum, partialiface, include_call_type)
+    partial_class = _partial_class(partialiface)
+    simple_arg_count = argnum + 1
+    simple_target_types = _simple_target_types
 
     @functools.wraps(decorator_func)
     def meta_decorated(*args, **keywords):
         "I'm tired of providing nonsense docstrings to functools.wrapped functions just to shut pylint up"
-        if argname in keywords:
-            # a way for callers to force a 'normal' function call
-            arg = keywords[argname]
-            del keywords[argname]
-            preparer = makepartial(args, keywords)
-            return preparer(arg)
-
-        # called as a simple decorator
-        if (len(args) == argnum+1 and
-            (inspect.isfunction(args[argnum]) or
-                inspect.isclass(args[argnum]) or
-                inspect.ismethod(args[argnum]))
-            and len(keywords) == 0):
-            if include_call_type:
-                return decorator_func(*args, paramdecorator_simple_call=True)
-            else:
-                return decorator_func(*args)
-        else: # called as an argument decorator
-            return makepartial(args, keywords)
+        if keywords:
+            if argname in keywords:
+                # a way for callers to force a 'normal' function call
+                arg = keywords.pop(argname)
+                preparer = partial_class(decorator_func, argnum, partialiface, include_call_type, args, keywords)
+                return preparer(arg)
+        elif len(args) == simple_arg_count:
+            target = args[argnum]
+            if type(target) in simple_target_types or isinstance(target, type):
+                # called as a simple decorator
+                if include_call_type:
+                    return decorator_func(*args, paramdecorator_simple_call=True)
+                else:
+                    return decorator_func(*args)
+
+        # called as an argument decorator
+        return partial_class(decorator_func, argnum, partialiface, include_call_type, args, keywords)
     meta_decorated.undecorated = decorator_func
     return meta_decorated
 paramdecorator = paramdecorator(paramdecorator) # we are ourselves!
@@ -132,21 +223,38 @@ class ExceptionWithMessage(Exception):
 class KeyAttributeCollisionError(ExceptionWithMessage):
     """Key {1!r} collides with attribute of the same name on AttrDict it is set in """
 
+class _MissingKey(KeyError, AttributeError):
+    "An AttrDict has no such key; raised as both, so item and attribute access each work as usual"
+
 class AttrDict(dict):
     """
     Dict with it's values accessible as attributes
+
+    Attributes that aren't found the normal way are looked up as keys, by dict.__getitem__
+    itself rather than a python-level __getattr__, so methods (including a subclass's) always
+    win over keys of the same name. Setting such a name as an attribute raises
+    KeyAttributeCollisionError. Instances have no __dict__ of their own, so they don't refer to
+    themselves and are freed as soon as they're dropped.
     """
-    def __init__(self, *args, **keywords):
-        dict.__init__(self, *args, **keywords)
+    __slots__ = ()
+    __getattr__ = dict.__getitem__
+
+    def __missing__(self, key):
+        raise _MissingKey(key)
+
+    def __setattr__(self, name, value):
+        if hasattr(type(self), name):
+            raise KeyAttributeCollisionError(self, name)
+        self[name] = value
 
-    def __getattr__(self, name):
+    def __delattr__(self, name):
         try:
-            return self[name]
+            del self[name]
         except KeyError:
-            raise AttributeError
+            raise _MissingKey(name)
 
-    def __setattr__(self, name, attr):
-        self[name] = attr
+    def __reduce__(self):
+        return (type(self), (dict(self),))
 
     '''
     def setdefault(self, name, value, update=True):
@@ -172,18 +280,30 @@ class AttrDict(dict):
     def __repr__(self):
         return "AttrDict(%s)" % super(AttrDict, self).__repr__() #pragma: no cover
 
+
 DEBUG = "CROW2_DEBUG" in os.environ
 
-def DEBUG_calling_name(): #pragma: no cover
+_calling_names = {}
+
+def DEBUG_calling_name(skip_modules=()):
+    """
+    Name the function which called our caller as "module.function", for naming otherwise unnamed
+    objects in debug mode. Frames from modules in skip_modules are skipped, so that constructors
+    can report who created them rather than which superclass __init__ did.
+
+    Walks frames directly and caches names per code object, so it's cheap enough to leave on.
+    """
     if not DEBUG:
         # TODO: print warning if this code is run
         return "<**CROW2_DEBUG not in environment**>"
 
-    stackframe = inspect.stack()[2] # 0 = us, 1 = who called us, 2 = who called them
-    frame = stackframe[0]
-    code_name = frame.f_code.co_name
-
-    module = inspect.getmodule(frame)
-    modulename = fullyQualifiedName(module)
+    frame = sys._getframe(2) # 0 = us, 1 = who called us, 2 = who called them
+    while frame.f_back is not None and frame.f_globals.get("__name__") in skip_modules:
+        frame = frame.f_back
 
-    return modulename + '.' + code_name
+    code = frame.f_code
+    try:
+        return _calling_names[code]
+    except KeyError:
+        name = _calling_names[code] = "%s.%s" % (frame.f_globals.get("__name__", "<unknown>"), code.co_name)
+        return name